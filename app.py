@@ -1,7 +1,8 @@
 # app.py
-from dash import Dash, html, dcc, Input, Output, State, page_registry, no_update
+from dash import Dash, html, dcc, Input, Output, page_registry
 import dash_bootstrap_components as dbc
 import dash
+from utils import auth, export, metrics
 
 external_stylesheets = [dbc.themes.BOOTSTRAP]
 
@@ -12,12 +13,13 @@ app = Dash(
     suppress_callback_exceptions=True
 )
 server = app.server
+# DASH_METRICS=1: aşama süreleri, /_metrics (Prometheus) ve Server-Timing başlıkları
+metrics.install(app)
+# /export/<sayfa>/<tablo>.csv|xlsx: filtrelenmiş satırlar ve tablolar parça parça indirilir
+export.install(app)
 
-def make_nav(auth, current_path):
-    """Login dışındaki sayfaları menüye ekle + Yazdır/Çıkış butonları"""
-    if not (auth and auth.get("logged_in")):
-        return html.Div()
-
+def make_nav():
+    """Login dışındaki sayfaların menüsü + Yazdır/Çıkış butonları (başlangıçta bir kez kurulur)"""
     pages = [
         p for p in page_registry.values()
         if p.get("path") and p["path"] != "/"
@@ -35,7 +37,7 @@ def make_nav(auth, current_path):
             dbc.NavLink(
                 p.get("name", p["path"].strip("/").capitalize()) or "Page",
                 href=p["path"],
-                active=("exact" if current_path == p["path"] else False)
+                active="exact"  # aktif sayfa tarayıcıda işaretlenir
             )
         )
         for p in pages
@@ -46,61 +48,35 @@ def make_nav(auth, current_path):
             html.Div("E-Ticaret Dashboard", className="navbar-brand"),
             dbc.Nav(nav_items, className="ms-auto"),
             dbc.Button("Yazdır / PDF", id="print-btn", color="light", className="ms-3"),
-            dbc.Button("Çıkış", id="logout-btn", color="secondary", className="ms-2", n_clicks=0),
+            dbc.Button("Çıkış", href=auth.LOGOUT_PATH, external_link=True, color="secondary", className="ms-2"),
         ]),
         color="dark", dark=True, className="mb-3"
     )
 
+# Login dışındaki tüm path'ler; sayfa kaydı başlangıçta tamamlandığı için bir kez hesaplanır
+PROTECTED = tuple(sorted(p["path"] for p in page_registry.values() if p.get("path") and p["path"] != "/"))
+# Oturum kontrolü sunucuda, her istekten önce: imzalı çerez yoksa korunan sayfalar "/"e döner,
+# sayfa callback'leri ve dışa aktarmalar 401 ile reddedilir (hiç toplama yapılmaz)
+auth.install(app, PROTECTED)
+
 app.layout = html.Div([
     dcc.Location(id="url"),
-    dcc.Store(id="auth", storage_type="session"),
-    dcc.Location(id="gate", refresh=True),
-    html.Div(id="nav-wrap"),
+    # Menü bir kez kurulur; yalnızca görünürlüğü tarayıcıda değişir
+    html.Div(make_nav(), id="nav-wrap", style={"display": "none"}),
     html.Div(id="print-done", style={"display": "none"}),  # Yazdır işlemi için dummy hedef
     dash.page_container,
 ])
 
-# Navbar
-@app.callback(
-    Output("nav-wrap", "children"),
-    Input("auth", "data"),
-    Input("url", "pathname"),
-)
-def render_nav(auth, pathname):
-    return make_nav(auth, pathname or "/")
-
-def protected_prefixes():
-    """Login dışındaki tüm path'leri koru"""
-    paths = [p["path"] for p in page_registry.values() if p.get("path")]
-    return tuple(sorted([p for p in paths if p != "/"]))
-
-# Guard
-@app.callback(
-    Output("gate", "href"),
+# Navbar: giriş sayfasında gizli (korunan sayfalara oturumsuz gelinemez)
+app.clientside_callback(
+    """
+    function(pathname) {
+      return {display: (!pathname || pathname === "/") ? "none" : "block"};
+    }
+    """,
+    Output("nav-wrap", "style"),
     Input("url", "pathname"),
-    State("auth", "data"),
-    prevent_initial_call=False
-)
-def guard_routes(pathname, auth):
-    if pathname is None:
-        return no_update
-    needs_auth = any(pathname.startswith(p) for p in protected_prefixes())
-    is_logged_in = bool(auth and auth.get("logged_in"))
-    if needs_auth and not is_logged_in:
-        return "/"
-    return no_update
-
-# Logout
-@app.callback(
-    Output("auth", "data", allow_duplicate=True),
-    Output("gate", "href", allow_duplicate=True),
-    Input("logout-btn", "n_clicks"),
-    prevent_initial_call=True
 )
-def logout(n):
-    if n:
-        return {}, "/"
-    return no_update, no_update
 
 # Yazdır (clientside)
 app.clientside_callback(
@@ -3,65 +3,76 @@ from dash import register_page, html, dcc, Input, Output, callback
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
-from utils.data import load_data, resample_time
+from utils import export
+from utils.cache import memoize, range_key
+from utils.data import get_engine, get_store, resample_time
+from utils.metrics import stage
+from utils.parallel import gather
 
 register_page(__name__, path="/finance", name="Finans & Kârlılık")
 
-df = load_data()
+store = get_store()
+# Toplamları yapılandırılan sorgu motoru verir (SALES_ENGINE: pandas / sqlite)
+engine = get_engine()
+
+# Düşük marj listesine girmek için gereken en az ciro (0 = tüm ürünler)
+LOW_MARGIN_MIN_REVENUE = 0
 
 def kpi(title, value):
     return dbc.Card(dbc.CardBody([html.H6(title), html.H3(value)]), class_name="kpi-card")
 
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            dcc.DatePickerRange(
-                id="fin-date",
-                start_date=df["order_date"].min().date(),
-                end_date=df["order_date"].max().date(),
-                display_format="DD.MM.YYYY"
-            )
-        ], md=5),
-        dbc.Col(dcc.Dropdown(sorted(df["marketplace"].unique()), id="fin-mp", multi=True, placeholder="Pazar yeri"), md=4),
-        dbc.Col(dcc.Dropdown(sorted(df["category"].unique()), id="fin-cat", multi=True, placeholder="Kategori"), md=3),
-    ], class_name="mb-3"),
-
-    dbc.Row(id="fin-kpis", class_name="g-3 mb-3"),
-
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="waterfall"), md=6),
-        dbc.Col(dcc.Graph(id="profit-trend"), md=6),
-    ], class_name="mb-4"),
-
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="low-margin-products"), md=12)
-    ])
-], fluid=True)
-
-def _filter(dff, start, end, mp, cat):
-    mask = (dff["order_date"]>=pd.to_datetime(start)) & (dff["order_date"]<=pd.to_datetime(end))
-    if mp: mask &= dff["marketplace"].isin(mp)
-    if cat: mask &= dff["category"].isin(cat)
-    return dff.loc[mask]
-
-@callback(
-    Output("fin-kpis","children"),
-    Output("waterfall","figure"),
-    Output("profit-trend","figure"),
-    Output("low-margin-products","figure"),
+def layout(**_):
+    # Sayfa her açıldığında güncel veri sürümünün tarih aralığı ve seçenekleri
+    first, last = store.date_bounds()
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                dcc.DatePickerRange(
+                    id="fin-date",
+                    start_date=first.date(),
+                    end_date=last.date(),
+                    display_format="DD.MM.YYYY"
+                )
+            ], md=5),
+            dbc.Col(dcc.Dropdown(store.values("marketplace"), id="fin-mp", multi=True, placeholder="Pazar yeri"), md=4),
+            dbc.Col(dcc.Dropdown(store.values("category"), id="fin-cat", multi=True, placeholder="Kategori"), md=3),
+        ], class_name="mb-3"),
+        dbc.Row(dbc.Col(dbc.DropdownMenu(label="Dışa aktar", id="fin-export", size="sm", color="secondary"),
+                        width="auto"), justify="end", class_name="mb-2"),
+
+        dbc.Row(id="fin-kpis", class_name="g-3 mb-3"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="waterfall"), md=6),
+            dbc.Col(dcc.Graph(id="profit-trend"), md=6),
+        ], class_name="mb-4"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="low-margin-products"), md=12)
+        ])
+    ], fluid=True)
+
+FILTER_INPUTS = [
     Input("fin-date","start_date"),
     Input("fin-date","end_date"),
     Input("fin-mp","value"),
     Input("fin-cat","value"),
-)
-def update_fin(start, end, mp, cat):
-    dff = _filter(df, start, end, mp, cat)
+]
 
-    revenue = dff["revenue"].sum()
-    cogs = dff["cogs"].sum()
-    commission = dff["commission"].sum()
-    shipping = dff["shipping_cost"].sum()
+# KPI'lar ayrı callback: grafiklerden önce gelir, maliyeti geçmiş uzunluğundan bağımsız
+@callback(
+    Output("fin-kpis","children"),
+    Output("waterfall","figure"),
+    *FILTER_INPUTS,
+)
+@memoize(version=lambda: store.data_key, key=range_key(store.date_bounds))
+def update_fin_kpis(start, end, mp, cat):
+    stage("aggregate")
+    t = engine.totals(start, end, ["revenue","cogs","commission","shipping_cost"], marketplace=mp, category=cat)
+    revenue = t["revenue"]
+    cogs = t["cogs"]
+    commission = t["commission"]
+    shipping = t["shipping_cost"]
     net = revenue - (cogs + commission + shipping)
     margin = (net / revenue * 100) if revenue>0 else 0
 
@@ -72,6 +83,7 @@ def update_fin(start, end, mp, cat):
         dbc.Col(kpi("Kâr Marjı", f"{margin:.1f}%"), md=3),
     ]
 
+    stage("figure")
     wf = go.Figure(go.Waterfall(
         name="Finans",
         orientation="v",
@@ -81,16 +93,50 @@ def update_fin(start, end, mp, cat):
         y=[revenue, -commission, -shipping, net - (revenue - commission - shipping)],
     ))
     wf.update_layout(title="Waterfall: Satış → Komisyon → Kargo → Net Kâr")
+    return kpis, wf
 
-    ts = resample_time(dff, freq="M")
+@callback(
+    Output("profit-trend","figure"),
+    Output("low-margin-products","figure"),
+    *FILTER_INPUTS,
+)
+@memoize(version=lambda: store.data_key, key=range_key(store.date_bounds))
+def update_fin(start, end, mp, cat):
+    stage("aggregate")
+    # Ürün seviyesi: ürün başına aralık toplamı + kısmi seçim (ham satır taranmaz)
+    having = {"revenue": LOW_MARGIN_MIN_REVENUE} if LOW_MARGIN_MIN_REVENUE else None
+    # Bağımsız iki sorgu iş parçacığı havuzunda birlikte
+    daily, low = gather(
+        lambda: engine.group(["order_date"], ["net_profit"], start, end, marketplace=mp, category=cat),
+        lambda: engine.top("product_key", "margin", 20, start, end, largest=False, having=having,
+                           marketplace=mp, category=cat))
+    ts = resample_time(daily, freq="M", value_col="net_profit")
+    # İsimler yalnızca gösterilen 20 ürüne eklenir
+    low = store.products.label(low)
+    stage("figure")
     fig_trend = px.line(ts, x="order_date", y="net_profit", title="Aylık Net Kâr Trendi")
-
-    prod = (dff.groupby(["product_name","brand"], as_index=False)
-            .agg({"revenue":"sum","cogs":"sum","commission":"sum","shipping_cost":"sum"}))
-    prod["net_profit"] = prod["revenue"] - (prod["cogs"]+prod["commission"]+prod["shipping_cost"])
-    prod["margin"] = prod["net_profit"] / prod["revenue"].replace(0,1)
-    low = prod.sort_values("margin").head(20)
+    stage("figure")
     fig_low = px.bar(low, x="margin", y="product_name", orientation="h",
                      title="Kâr marjı düşük ürünler", hover_data=["revenue","net_profit"])
 
-    return kpis, wf, fig_trend, fig_low
+    return fig_trend, fig_low
+
+# Dışa aktarma: satırlar + sayfanın tabloları, seçili filtrelerle (/export/finance/...)
+@callback(Output("fin-export","children"), *FILTER_INPUTS)
+def update_fin_export(start, end, mp, cat):
+    return export.menu("finance", start, end, marketplace=mp, category=cat)
+
+@export.table("finance", "monthly", "Aylık gelir / gider")
+def _export_monthly(start, end, **filters):
+    daily = engine.group(["order_date"], ["revenue","cogs","commission","shipping_cost","net_profit"],
+                         start, end, **filters)
+    monthly = daily.groupby(daily["order_date"].dt.to_period("M").dt.start_time).sum(numeric_only=True)
+    return monthly.rename_axis("month").reset_index()
+
+@export.table("finance", "products", "Ürün kârlılığı")
+def _export_products(start, end, **filters):
+    totals = engine.group(["product_key"], ["revenue","net_profit"], start, end, **filters)
+    totals["margin"] = totals["net_profit"] / totals["revenue"].where(totals["revenue"] != 0)
+    out = store.products.label(totals.set_index("product_key"), ["product_id","product_name","brand"])
+    # İç vekil anahtar dosyaya yazılmaz; ürün product_id ile tanınır
+    return out.drop(columns="product_key")
@@ -1,6 +1,7 @@
 # pages/login.py
 from dash import register_page, html, dcc, Input, Output, State, callback
 import dash_bootstrap_components as dbc
+from utils import auth
 
 register_page(__name__, path="/", name="Giriş")
 
@@ -29,17 +30,17 @@ layout = dbc.Container([
     Output("login-alert", "children"),
     Output("login-alert", "is_open"),
     Output("login-nav", "href"),
-    Output("auth", "data", allow_duplicate=True),
     Input("login-btn", "n_clicks"),
     State("login-user", "value"),
     State("login-pass", "value"),
     prevent_initial_call=True
 )
 def do_login(n, user, pw):
-    # Basit sabit kimlik doğrulama
-    if (user or "").strip().lower() == "admin" and (pw or "") == "1234":
-        # başarılı → /sales
-        return "", False, "/sales", {"logged_in": True, "user": "admin"}
+    # Kullanıcılar data/users.json'da (PBKDF2 özetleri); oturum imzalı çerezde tutulur
+    user = auth.check(user, pw)
+    if user is not None:
+        # başarılı → /sales (çerez bu yanıtla gelir)
+        auth.login(user)
+        return "", False, "/sales"
     # hata
-    return "Hatalı kullanıcı adı veya şifre.", True, None, {}
-
+    return "Hatalı kullanıcı adı veya şifre.", True, None
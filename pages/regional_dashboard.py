@@ -2,43 +2,64 @@
 from dash import register_page, html, dcc, Input, Output, callback
 import dash_bootstrap_components as dbc
 import plotly.express as px
-import pandas as pd
-from utils.data import load_data
+from utils import background, export
+from utils.cache import memoize, range_key
+from utils.data import GEO_MEASURES, get_engine, get_store
+from utils.figures import reduce_figure
+from utils.metrics import stage
+from utils.parallel import gather
 
 register_page(__name__, path="/regional", name="Bölgesel Analiz")
 
-df = load_data()
+store = get_store()
+# Toplamları yapılandırılan sorgu motoru verir (SALES_ENGINE: pandas / sqlite)
+engine = get_engine()
 
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            dcc.DatePickerRange(
-                id="reg-date",
-                start_date=df["order_date"].min().date(),
-                end_date=df["order_date"].max().date(),
-                display_format="DD.MM.YYYY"
-            )
-        ], md=4),
-        dbc.Col(dcc.Dropdown(sorted(df["marketplace"].unique()), id="reg-mp", multi=True, placeholder="Pazar yeri"), md=4),
-        dbc.Col(dcc.Dropdown(sorted(df["region"].unique()), id="reg-region", multi=True, placeholder="Bölge"), md=4),
-    ], class_name="mb-3"),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="map-sales"), md=7),
-        dbc.Col(dcc.Graph(id="top-cities"), md=5),
-    ], class_name="mb-4"),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="region-returns"), md=6),
-        dbc.Col(dcc.Graph(id="delivery-by-region"), md=6),
-    ])
-], fluid=True)
+def layout(**_):
+    # Sayfa her açıldığında güncel veri sürümünün tarih aralığı ve seçenekleri
+    first, last = store.date_bounds()
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                dcc.DatePickerRange(
+                    id="reg-date",
+                    start_date=first.date(),
+                    end_date=last.date(),
+                    display_format="DD.MM.YYYY"
+                )
+            ], md=4),
+            dbc.Col(dcc.Dropdown(store.values("marketplace"), id="reg-mp", multi=True, placeholder="Pazar yeri"), md=4),
+            dbc.Col(dcc.Dropdown(store.values("region"), id="reg-region", multi=True, placeholder="Bölge"), md=4),
+        ], class_name="mb-3"),
+        dbc.Row(dbc.Col(dbc.DropdownMenu(label="Dışa aktar", id="reg-export", size="sm", color="secondary"),
+                        width="auto"), justify="end", class_name="mb-2"),
+        # Hesaplama sürerken görünür (arka plan modunda adım adım ilerler)
+        dbc.Progress(id="reg-progress", value=0, striped=True, animated=True, style={"display":"none"}, class_name="mb-3"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="map-sales"), md=7),
+            dbc.Col(dcc.Graph(id="top-cities"), md=5),
+        ], class_name="mb-4"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="region-returns"), md=6),
+            dbc.Col(dcc.Graph(id="delivery-by-region"), md=6),
+        ])
+    ], fluid=True)
 
-def _filter(dff, start, end, mp, regs):
-    mask = (dff["order_date"]>=pd.to_datetime(start)) & (dff["order_date"]<=pd.to_datetime(end))
-    if mp: mask &= dff["marketplace"].isin(mp)
-    if regs: mask &= dff["region"].isin(regs)
-    return dff.loc[mask]
+def _by_city(start, end, mp, regs):
+    totals = engine.group(["city_key"], ["revenue","sales_qty","return_qty"], start, end,
+                          marketplace=mp, region=regs)
+    # Şehir adı ve koordinatlar şehir boyutundan (GeoDim), yalnızca toplamı olan şehirler için
+    return store.cities.label(totals.set_index("city_key"))
 
-@callback(
+def _by_region(start, end, mp, regs):
+    # Bellek içi motorda bölge toplamları ham satırlardan değil, şehir toplamlarından türetilir
+    reg = engine.group(["region"], GEO_MEASURES, start, end, marketplace=mp, region=regs)
+    reg["delivery_days"] = reg["delivery_days_sum"] / reg["delivery_days_count"]
+    reg["ret_rate"] = reg["return_qty"]/reg["sales_qty"].replace(0,1)
+    return reg
+
+# Ağır callback: DASH_BACKGROUND=1 ile arka plan sürecinde çalışır, filtre değişince iptal edilir
+@background.callback(
     Output("map-sales","figure"),
     Output("top-cities","figure"),
     Output("region-returns","figure"),
@@ -47,24 +68,49 @@ def _filter(dff, start, end, mp, regs):
     Input("reg-date","end_date"),
     Input("reg-mp","value"),
     Input("reg-region","value"),
+    progress=[Output("reg-progress","value"), Output("reg-progress","label")],
+    running=[(Output("reg-progress","style"), {"display":"flex"}, {"display":"none"})],
+    cancel=[background.PAGE_CHANGE],
 )
+@memoize(version=lambda: store.data_key, key=range_key(store.date_bounds))
 def update_reg(start, end, mp, regs):
-    dff = _filter(df, start, end, mp, regs)
-    geo = (dff.groupby(["city","lat","lon"], as_index=False)
-           .agg({"revenue":"sum","sales_qty":"sum","return_qty":"sum"}))
+    stage("aggregate")
+    # Şehir ve bölge toplamları iş parçacığı havuzunda birlikte
+    geo, reg = gather(lambda: _by_city(start, end, mp, regs), lambda: _by_region(start, end, mp, regs))
+    stage("figure")
     fig_map = px.scatter_geo(
         geo, lat="lat", lon="lon",
         size="revenue", hover_name="city",
         projection="natural earth", title="Şehirlere göre satış yoğunluğu (balon boyutu = ₺)"
     )
+    # Binlerce şehir/ilçede yalnızca en büyük balonlar gönderilir
+    fig_map = reduce_figure(fig_map)
     top = geo.sort_values("revenue", ascending=False).head(15)
     fig_top = px.bar(top, x="revenue", y="city", orientation="h", title="En çok satış yapılan şehirler")
+    background.report_progress(1, 2)
 
-    reg = (dff.groupby("region", as_index=False)
-           .agg({"sales_qty":"sum","return_qty":"sum","delivery_days":"mean"}))
-    reg["ret_rate"] = reg["return_qty"]/reg["sales_qty"].replace(0,1)
     fig_ret = px.bar(reg, x="region", y="ret_rate", title="Bölge bazında iade oranı")
 
     fig_del = px.bar(reg, x="region", y="delivery_days", title="Bölgeye göre ort. teslimat süresi (gün)")
+    background.report_progress(2, 2)
 
     return fig_map, fig_top, fig_ret, fig_del
+
+# Dışa aktarma: satırlar + sayfanın tabloları, seçili filtrelerle (/export/regional/...)
+@callback(
+    Output("reg-export","children"),
+    Input("reg-date","start_date"),
+    Input("reg-date","end_date"),
+    Input("reg-mp","value"),
+    Input("reg-region","value"),
+)
+def update_reg_export(start, end, mp, regs):
+    return export.menu("regional", start, end, marketplace=mp, region=regs)
+
+@export.table("regional", "cities", "Şehirler")
+def _export_cities(start, end, marketplace=None, region=None, **_):
+    return _by_city(start, end, marketplace, region)
+
+@export.table("regional", "regions", "Bölgeler")
+def _export_regions(start, end, marketplace=None, region=None, **_):
+    return _by_region(start, end, marketplace, region)
@@ -3,89 +3,136 @@ from dash import register_page, html, dcc, Input, Output, callback
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
-from utils.data import load_data
+from utils import export
+from utils.cache import memoize, range_key
+from utils.data import get_engine, get_store
+from utils.metrics import stage
+from utils.parallel import gather
 
 register_page(__name__, path="/returns", name="İade & Müşteri")
 
-df = load_data()
+store = get_store()
+# Toplamları yapılandırılan sorgu motoru verir (SALES_ENGINE: pandas / sqlite)
+engine = get_engine()
 
 def kpi_card(title, value):
     return dbc.Card(dbc.CardBody([html.H6(title), html.H3(value)]), class_name="kpi-card")
 
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            dcc.DatePickerRange(
-                id="ret-date",
-                start_date=df["order_date"].min().date(),
-                end_date=df["order_date"].max().date(),
-                display_format="DD.MM.YYYY"
-            )
-        ], md=4),
-        dbc.Col(dcc.Dropdown(sorted(df["marketplace"].unique()), id="ret-mp", multi=True, placeholder="Pazar yeri"), md=4),
-        dbc.Col(dcc.Dropdown(sorted(df["category"].unique()), id="ret-cat", multi=True, placeholder="Kategori"), md=4),
-    ], class_name="mb-3"),
-
-    dbc.Row(id="ret-kpis", class_name="mb-3 g-3"),
-
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="ret-pie-reasons"), md=5),
-        dbc.Col(dcc.Graph(id="ret-heat-mp-cat"), md=7),
-    ], class_name="mb-4"),
-
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="ret-top-products"), md=12),
-    ])
-], fluid=True)
-
-def _filter(dff, start, end, mp, cat):
-    mask = (dff["order_date"]>=pd.to_datetime(start)) & (dff["order_date"]<=pd.to_datetime(end))
-    if mp: mask &= dff["marketplace"].isin(mp)
-    if cat: mask &= dff["category"].isin(cat)
-    return dff.loc[mask]
+def layout(**_):
+    # Sayfa her açıldığında güncel veri sürümünün tarih aralığı ve seçenekleri
+    first, last = store.date_bounds()
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                dcc.DatePickerRange(
+                    id="ret-date",
+                    start_date=first.date(),
+                    end_date=last.date(),
+                    display_format="DD.MM.YYYY"
+                )
+            ], md=4),
+            dbc.Col(dcc.Dropdown(store.values("marketplace"), id="ret-mp", multi=True, placeholder="Pazar yeri"), md=4),
+            dbc.Col(dcc.Dropdown(store.values("category"), id="ret-cat", multi=True, placeholder="Kategori"), md=4),
+        ], class_name="mb-3"),
+        dbc.Row(dbc.Col(dbc.DropdownMenu(label="Dışa aktar", id="ret-export", size="sm", color="secondary"),
+                        width="auto"), justify="end", class_name="mb-2"),
 
-@callback(
-    Output("ret-kpis","children"),
-    Output("ret-pie-reasons","figure"),
-    Output("ret-heat-mp-cat","figure"),
-    Output("ret-top-products","figure"),
+        dbc.Row(id="ret-kpis", class_name="mb-3 g-3"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="ret-pie-reasons"), md=5),
+            dbc.Col(dcc.Graph(id="ret-heat-mp-cat"), md=7),
+        ], class_name="mb-4"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="ret-top-products"), md=12),
+        ])
+    ], fluid=True)
+
+FILTER_INPUTS = [
     Input("ret-date","start_date"),
     Input("ret-date","end_date"),
     Input("ret-mp","value"),
     Input("ret-cat","value"),
-)
-def update_returns(start, end, mp, cat):
-    dff = _filter(df, start, end, mp, cat)
-    total_sales = dff["sales_qty"].sum()
-    total_ret = dff["return_qty"].sum()
-    total_loss = (dff["return_qty"] * dff["unit_price"]).sum()  # simple est.
-    kpis = [
+]
+
+# KPI'lar ayrı callback: grafiklerden önce gelir, maliyeti geçmiş uzunluğundan bağımsız
+@callback(Output("ret-kpis","children"), *FILTER_INPUTS)
+@memoize(version=lambda: store.data_key, key=range_key(store.date_bounds))
+def update_returns_kpis(start, end, mp, cat):
+    stage("aggregate")
+    t = engine.totals(start, end, ["sales_qty","return_qty","return_loss"], marketplace=mp, category=cat)
+    total_sales = t["sales_qty"]
+    total_ret = t["return_qty"]
+    total_loss = t["return_loss"]  # simple est.: return_qty * unit_price
+    stage("figure")
+    return [
         dbc.Col(kpi_card("Toplam İade Oranı", f"{(total_ret/max(1,total_sales))*100:.1f}%"), md=3),
         dbc.Col(kpi_card("Toplam İade Adedi", f"{int(total_ret):,}"), md=3),
         dbc.Col(kpi_card("Tahmini İade Kayıp (₺)", f"{total_loss:,.0f}"), md=6),
     ]
 
-    reasons = dff[dff["return_qty"]>0]["return_reason"].replace("", "Diğer")
-    pie_df = reasons.value_counts().reset_index()
+@callback(
+    Output("ret-pie-reasons","figure"),
+    Output("ret-heat-mp-cat","figure"),
+    Output("ret-top-products","figure"),
+    *FILTER_INPUTS,
+)
+@memoize(version=lambda: store.data_key, key=range_key(store.date_bounds))
+def update_returns(start, end, mp, cat):
+    stage("aggregate")
+    # Üç bağımsız sorgu iş parçacığı havuzunda birlikte; ürün başına ilk 15 kısmi seçimle
+    reasons, pivot, top_ret = gather(
+        lambda: engine.group(["return_reason"], ["return_lines"], start, end, marketplace=mp, category=cat),
+        lambda: engine.group(["marketplace","category"], ["sales_qty","return_qty"], start, end,
+                             marketplace=mp, category=cat),
+        lambda: engine.top("product_key", "return_qty", 15, start, end, marketplace=mp, category=cat))
+    pie_df = (reasons.set_index("return_reason")["return_lines"]
+              .rename(index={"": "Diğer"})
+              .sort_values(ascending=False)
+              .reset_index())
     pie_df.columns = ["reason","count"]
+    stage("figure")
     fig_pie = px.pie(pie_df, values="count", names="reason", title="İade nedenleri dağılımı")
 
     # Heatmap: return rate by marketplace x category
-    pivot = (dff.groupby(["marketplace","category"], as_index=False)
-             .agg({"sales_qty":"sum","return_qty":"sum"}))
+    stage("aggregate")
     pivot["ret_rate"] = pivot["return_qty"] / pivot["sales_qty"].replace(0, 1)
     heat = pivot.pivot(index="marketplace", columns="category", values="ret_rate").fillna(0)
+    stage("figure")
     fig_heat = go.Figure(data=go.Heatmap(
-        z=heat.values, x=heat.columns, y=heat.index, zmin=0, zmax=max(0.25, heat.values.max()),
+        z=heat.values, x=heat.columns, y=heat.index, zmin=0, zmax=max(0.25, heat.values.max(initial=0)),
         colorbar=dict(title="İade Oranı")
     ))
     fig_heat.update_layout(title="Pazar yeri × Kategori bazında iade oranı")
 
-    top_ret = (dff.groupby(["product_name","brand"], as_index=False)
-               .agg({"return_qty":"sum"})
-               .sort_values("return_qty", ascending=False).head(15))
+    stage("aggregate")
+    # İsimler yalnızca ilk 15 ürüne eklenir
+    top_ret = store.products.label(top_ret)
+    stage("figure")
     fig_top = px.bar(top_ret, x="return_qty", y="product_name", orientation="h",
                      title="En çok iade edilen ürünler (adet)")
 
-    return kpis, fig_pie, fig_heat, fig_top
+    return fig_pie, fig_heat, fig_top
+
+# Dışa aktarma: satırlar + sayfanın tabloları, seçili filtrelerle (/export/returns/...)
+@callback(Output("ret-export","children"), *FILTER_INPUTS)
+def update_returns_export(start, end, mp, cat):
+    return export.menu("returns", start, end, marketplace=mp, category=cat)
+
+@export.table("returns", "reasons", "İade nedenleri")
+def _export_reasons(start, end, **filters):
+    return engine.group(["return_reason"], ["return_lines","return_qty"], start, end, **filters)
+
+@export.table("returns", "marketplace-category", "Pazar yeri × Kategori")
+def _export_mp_cat(start, end, **filters):
+    out = engine.group(["marketplace","category"], ["sales_qty","return_qty"], start, end, **filters)
+    out["ret_rate"] = out["return_qty"] / out["sales_qty"].replace(0, 1)
+    return out
+
+@export.table("returns", "products", "Ürün bazında iadeler")
+def _export_products(start, end, **filters):
+    totals = engine.group(["product_key"], ["sales_qty","return_qty","return_loss"], start, end, **filters)
+    out = store.products.label(totals.set_index("product_key"), ["product_id","product_name","brand"])
+    # İç vekil anahtar dosyaya yazılmaz; ürün product_id ile tanınır
+    return out.drop(columns="product_key")
@@ -1,119 +1,131 @@
 # pages/sales_dashboard.py
 
-from dash import register_page, html, dcc, Input, Output, callback, no_update
+from dash import register_page, html, dcc, Input, Output, State, callback, ctx, no_update, Patch
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import pandas as pd
-import numpy as np
+import hashlib
+import json
+import threading
+from collections import OrderedDict
 from datetime import date, timedelta
 
 # ---------- DATA LOADING ----------
 try:
-    from utils.data import load_data as _load_data, resample_time as _resample_time
+    from utils.data import get_store as _get_store, SalesStore as _SalesStore, resample_time as _resample_time
+    from utils.data import get_engine as _get_engine, PandasEngine as _PandasEngine
+    from utils.cache import memoize as _memoize, range_key as _range_key
+    from utils.metrics import stage
+    from utils.figures import reduce_figure
+    from utils.background import callback as _heavy_callback, PAGE_CHANGE as _PAGE_CHANGE
+    from utils.parallel import gather as _gather
+    from utils import export as _export
     USE_UTILS = True
 except Exception:
     USE_UTILS = False
+    _PAGE_CHANGE = None
+    _export = None
+
+    def _gather(*tasks):
+        return [task() for task in tasks]
+
+    def _heavy_callback(*args, running=None, cancel=None, **kwargs):
+        return callback(*args, running=running, **kwargs)
+
+    def stage(name):
+        pass
+
+    def reduce_figure(fig):
+        return fig
 
 def _demo_data(n_days=420, seed=42):
-    rng = np.random.default_rng(seed)
-    start = pd.Timestamp.today().normalize() - pd.Timedelta(days=n_days-1)
-    dates = pd.date_range(start, periods=n_days, freq="D")
-
-    marketplaces = ["Trendyol","Hepsiburada","Amazon","N11"]
-    cats = ["Elektronik","Ev & Yaşam","Giyim","Kozmetik","Spor"]
-    brands = ["MarkaA","MarkaB","MarkaC","MarkaD"]
-    prods = [f"Ürün {i:03d}" for i in range(1,121)]
-
-    rows = []
-    for d in dates:
-        for _ in range(int(rng.integers(60,121))):
-            qty = int(rng.integers(1,5))
-            price = rng.uniform(150, 2500)
-            rev = qty * price
-            ret = int(rng.integers(0,2) == 1 and rng.random() < 0.05)
-            cost = rev * rng.uniform(0.6, 0.85)
-            profit = rev - cost
-            rows.append({
-                "order_date": d,
-                "marketplace": rng.choice(marketplaces),
-                "category": rng.choice(cats),
-                "product_name": rng.choice(prods),
-                "brand": rng.choice(brands),
-                "sales_qty": qty,
-                "return_qty": ret,
-                "unit_price": price,
-                "unit_cost": price * rng.uniform(0.55, 0.8),
-                "commission_rate": rng.uniform(0.05, 0.16),
-                "cargo_cost": rng.uniform(20, 120),
-                "revenue": rev,
-                "net_profit": profit - ret * rng.uniform(50, 300),
-            })
-    df = pd.DataFrame(rows)
+    # Vektörel üretici: tüm şema (şehir, bölge, teslimat, iade nedeni, maliyetler)
+    from utils.demo import demo_sales
+    return demo_sales(n_days=n_days, seed=seed)
+
+def _prepare(df):
+    # --- Veri temizliği / türetmeler ---
+    df["order_date"] = pd.to_datetime(df.get("order_date"), errors="coerce")
+    df = df.dropna(subset=["order_date"])
+
+    # Sayısalları güvenli çevir
+    for c in ["sales_qty","return_qty","unit_price","unit_cost","commission_rate","cargo_cost","revenue","net_profit"]:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    # revenue yoksa türet: (satılabilir adet) * unit_price
+    if "revenue" not in df.columns:
+        qty_eff = (df.get("sales_qty", 0).fillna(0) - df.get("return_qty", 0).fillna(0)).clip(lower=0)
+        df["revenue"] = qty_eff * df.get("unit_price", 0).fillna(0)
+
+    # net_profit yoksa kabaca türet (varsa alanları kullan)
+    if "net_profit" not in df.columns:
+        qty_eff = (df.get("sales_qty", 0).fillna(0) - df.get("return_qty", 0).fillna(0)).clip(lower=0)
+        unit_price = df.get("unit_price", 0).fillna(0)
+        unit_cost  = df.get("unit_cost", 0).fillna(0)
+        comm_rate  = df.get("commission_rate", 0).fillna(0)  # 0–1 beklenir
+        cargo      = df.get("cargo_cost", 0).fillna(0)
+        gross = qty_eff * (unit_price - unit_cost)
+        comm = qty_eff * unit_price * comm_rate
+        df["net_profit"] = gross - comm - cargo
+
+    # Eksik kategorik kolonları doldur
+    for c in ["marketplace","category","product_name","brand","city","region"]:
+        if c not in df.columns:
+            df[c] = "Bilinmiyor"
+
+    # Nihai tip güvenliği
+    for c in ["revenue","sales_qty","return_qty","net_profit"]:
+        df[c] = pd.to_numeric(df.get(c, 0), errors="coerce").fillna(0.0)
     return df
 
-def load_data():
-    if USE_UTILS:
-        try:
-            return _load_data()
-        except Exception:
-            pass
+def load_fallback():
     try:
         df = pd.read_csv("./data/sales.csv", parse_dates=["order_date"])
-        return df
     except Exception:
-        return _demo_data()
+        df = _demo_data()
+    return _prepare(df)
+
+def load_store():
+    if not USE_UTILS:
+        return None
+    try:
+        # Paylaşılan store zaten zenginleştirilmiş ve tip güvenli; kopyalamadan kullan
+        return _get_store()
+    except Exception:
+        # sales_data.csv yoksa yedek veriden sayfaya özel store (sıralı indeks + günlük küp)
+        return _SalesStore(load_fallback())
+
+def load_engine():
+    if store is None:
+        return None
+    try:
+        # Yapılandırılan sorgu motoru (SALES_ENGINE: pandas / sqlite), paylaşılan store üzerinde
+        return _get_engine()
+    except Exception:
+        # Sayfaya özel yedek store: bellek içi motor
+        return _PandasEngine(store)
 
-def resample_time(df, freq="W", date_col="order_date", value_col="revenue"):
+def resample_time(df, freq="W", date_col="order_date", value_col="revenue", mode="periodic"):
     if USE_UTILS:
-        try:
-            return _resample_time(df, date_col=date_col, value_col=value_col, freq=freq)
-        except Exception:
-            pass
+        # Ortak motor: günlük toplamlar -> D/W/M/Q kovaları (istisnasız hızlı yol)
+        return _resample_time(df, freq=freq, value_col=value_col, date_col=date_col, mode=mode)
     s = (df.sort_values(date_col)
            .set_index(date_col)
-           .groupby(pd.Grouper(freq=freq))[value_col]
+           .groupby(pd.Grouper(freq={"M": "ME", "Q": "QE"}.get(freq, freq)))[value_col]
            .sum()
            .fillna(0)
            .reset_index())
+    if mode == "cumulative":
+        s[value_col] = s[value_col].cumsum()
     return s.rename(columns={date_col: "order_date"})
 
 register_page(__name__, path="/sales", name="Satış Performansı")
 
-df = load_data().copy()
-
-# --- Veri temizliği / türetmeler ---
-df["order_date"] = pd.to_datetime(df.get("order_date"), errors="coerce")
-df = df.dropna(subset=["order_date"])
-
-# Sayısalları güvenli çevir
-for c in ["sales_qty","return_qty","unit_price","unit_cost","commission_rate","cargo_cost","revenue","net_profit"]:
-    if c in df.columns:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-
-# revenue yoksa türet: (satılabilir adet) * unit_price
-if "revenue" not in df.columns:
-    qty_eff = (df.get("sales_qty", 0).fillna(0) - df.get("return_qty", 0).fillna(0)).clip(lower=0)
-    df["revenue"] = qty_eff * df.get("unit_price", 0).fillna(0)
-
-# net_profit yoksa kabaca türet (varsa alanları kullan)
-if "net_profit" not in df.columns:
-    qty_eff = (df.get("sales_qty", 0).fillna(0) - df.get("return_qty", 0).fillna(0)).clip(lower=0)
-    unit_price = df.get("unit_price", 0).fillna(0)
-    unit_cost  = df.get("unit_cost", 0).fillna(0)
-    comm_rate  = df.get("commission_rate", 0).fillna(0)  # 0–1 beklenir
-    cargo      = df.get("cargo_cost", 0).fillna(0)
-    gross = qty_eff * (unit_price - unit_cost)
-    comm = qty_eff * unit_price * comm_rate
-    df["net_profit"] = gross - comm - cargo
-
-# Eksik kategorik kolonları doldur
-for c in ["marketplace","category","product_name","brand","city","region"]:
-    if c not in df.columns:
-        df[c] = "Bilinmiyor"
-
-# Nihai tip güvenliği
-for c in ["revenue","sales_qty","return_qty","net_profit"]:
-    df[c] = pd.to_numeric(df.get(c, 0), errors="coerce").fillna(0.0)
+store = load_store()
+engine = load_engine()
+df = store.df if store is not None else load_fallback()
 
 def kpi_card(title, value, subtitle=None):
     return dbc.Card(
@@ -125,55 +137,78 @@ def kpi_card(title, value, subtitle=None):
         class_name="kpi-card"
     )
 
+def _date_bounds():
+    if store is not None:
+        return store.date_bounds()
+    if df.empty:
+        return None, None
+    return df["order_date"].min(), df["order_date"].max()
+
+def _options(col):
+    if store is not None:
+        return store.values(col)
+    return sorted(df[col].dropna().unique().tolist())
+
 # ---------------- UI ----------------
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            dcc.DatePickerRange(
-                id="sales-date",
-                start_date=(df["order_date"].min().date() if not df.empty else date.today()-timedelta(days=30)),
-                end_date=(df["order_date"].max().date() if not df.empty else date.today()),
-                display_format="DD.MM.YYYY"
-            )
-        ], md=4),
-        dbc.Col([
-            dcc.Dropdown(sorted(df["marketplace"].dropna().unique().tolist()),
-                         id="sales-mp", multi=True, placeholder="Pazar yeri seç (opsiyonel)")
-        ], md=4),
-        dbc.Col([
-            dcc.Dropdown(sorted(df["category"].dropna().unique().tolist()),
-                         id="sales-cat", multi=True, placeholder="Kategori seç (opsiyonel)")
-        ], md=4),
-    ], class_name="mb-3"),
-
-    dbc.Row([
-        dbc.Col(dcc.RadioItems(
-            id="freq",
-            options=[{"label":"Günlük","value":"D"},{"label":"Haftalık","value":"W"},{"label":"Aylık","value":"M"}],
-            value="W", inline=True
-        ), md=6),
-        dbc.Col(dcc.RadioItems(
-            id="agg_mode",
-            options=[{"label":"Dönemsel Toplam","value":"periodic"},
-                     {"label":"Kümülatif","value":"cumulative"}],
-            value="periodic", inline=True
-        ), md=6, class_name="text-md-end")
-    ], class_name="mb-2"),
-
-    dbc.Row([dbc.Col(html.Div(id="data-alert"))], class_name="mb-2"),
-
-    dbc.Row(id="sales-kpis", class_name="mb-3 g-3"),
-
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="bar-mp-revenue"), md=6),
-        dbc.Col(dcc.Graph(id="treemap-cat-brand"), md=6),  # <-- yeni: Kategori → Marka oranı
-    ], class_name="mb-3"),
-
-    dbc.Row([dbc.Col(dcc.Graph(id="line-total-sales"), md=12)], class_name="mb-4"),
-    dbc.Row([dbc.Col(dcc.Graph(id="top-products"), md=12)])
-], fluid=True)
+def layout(**_):
+    # Sayfa her açıldığında güncel veri sürümünün tarih aralığı ve seçenekleri
+    first, last = _date_bounds()
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                dcc.DatePickerRange(
+                    id="sales-date",
+                    start_date=(first.date() if first is not None else date.today()-timedelta(days=30)),
+                    end_date=(last.date() if last is not None else date.today()),
+                    display_format="DD.MM.YYYY"
+                )
+            ], md=4),
+            dbc.Col([
+                dcc.Dropdown(_options("marketplace"),
+                             id="sales-mp", multi=True, placeholder="Pazar yeri seç (opsiyonel)")
+            ], md=4),
+            dbc.Col([
+                dcc.Dropdown(_options("category"),
+                             id="sales-cat", multi=True, placeholder="Kategori seç (opsiyonel)")
+            ], md=4),
+        ], class_name="mb-3"),
+        dbc.Row(dbc.Col(dbc.DropdownMenu(label="Dışa aktar", id="sales-export", size="sm", color="secondary",
+                                         disabled=_export is None or store is None),
+                        width="auto"), justify="end", class_name="mb-2"),
+
+        dbc.Row([
+            dbc.Col(dcc.RadioItems(
+                id="freq",
+                options=[{"label":"Günlük","value":"D"},{"label":"Haftalık","value":"W"},{"label":"Aylık","value":"M"}],
+                value="W", inline=True
+            ), md=6),
+            dbc.Col(dcc.RadioItems(
+                id="agg_mode",
+                options=[{"label":"Dönemsel Toplam","value":"periodic"},
+                         {"label":"Kümülatif","value":"cumulative"}],
+                value="periodic", inline=True
+            ), md=6, class_name="text-md-end")
+        ], class_name="mb-2"),
+
+        # Normalize filtre durumu (özet anahtarı sunucudaki paylaşılan alt kümeyi gösterir)
+        dcc.Store(id="sales-filter"),
+        dbc.Row([dbc.Col(html.Div(id="data-alert"))], class_name="mb-2"),
+
+        dbc.Row(id="sales-kpis", class_name="mb-3 g-3"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="bar-mp-revenue"), md=6),
+            dbc.Col(dcc.Graph(id="treemap-cat-brand"), md=6),  # <-- yeni: Kategori → Marka oranı
+        ], class_name="mb-3"),
+
+        dbc.Row([dbc.Col(dcc.Graph(id="line-total-sales"), md=12)], class_name="mb-4"),
+        dbc.Row([dbc.Col(dcc.Graph(id="top-products"), md=12)])
+    ], fluid=True)
 
 def _filter(dff, start, end, mp, cat):
+    if store is not None:
+        # Boş/eksik tarih sınırları store'da açık aralık demek
+        return store.select(start, end, marketplace=mp, category=cat)
     if dff.empty:
         return dff
     if pd.isna(start) or pd.isna(end):
@@ -182,88 +217,301 @@ def _filter(dff, start, end, mp, cat):
     mask = (dff["order_date"] >= pd.to_datetime(start)) & (dff["order_date"] <= pd.to_datetime(end))
     if mp:  mask &= dff["marketplace"].isin(mp)
     if cat: mask &= dff["category"].isin(cat)
-    return dff.loc[mask].copy()
-
-@callback(
-    Output("data-alert","children"),
-    Output("sales-kpis","children"),
-    Output("bar-mp-revenue","figure"),
-    Output("treemap-cat-brand","figure"),
-    Output("line-total-sales","figure"),
-    Output("top-products","figure"),
-    Input("sales-date","start_date"),
-    Input("sales-date","end_date"),
-    Input("sales-mp","value"),
-    Input("sales-cat","value"),
-    Input("freq","value"),
-    Input("agg_mode","value")
-)
-def update_sales(start, end, mp, cat, freq, agg_mode):
+    return dff.loc[mask]
+
+def _memoized(fn):
+    # Aynı filtre durumu + veri sürümü için sonuçları önbellekten ver
+    if not USE_UTILS:
+        return fn
+    return _memoize(version=lambda: store.data_key if store is not None else None,
+                    key=lambda state, *rest: ((state or {}).get("key"),) + rest)(fn)
+
+def _cube(start, end, mp, cat):
+    # Günlük küp hücreleri ham satırlarla aynı kolon adlarını taşır; toplamlar aynı çıkar
+    if store is not None and "sales" in store.cubes:
+        return store.cube("sales", start, end, marketplace=mp, category=cat)
+    return _filter(df, start, end, mp, cat)
+
+# ---------- FİLTRE DURUMU ----------
+def _filter_state(start, end, mp, cat):
+    """Girdilerden normalize filtre durumu; ``key`` veri sürümü dahil özet (hash)."""
     if pd.to_datetime(start) > pd.to_datetime(end):
-        start = df["order_date"].min().date()
-        end = df["order_date"].max().date()
-
-    dff = _filter(df, start, end, mp, cat)
-
+        start, end = (d.date() for d in _date_bounds())
+    if USE_UTILS:
+        # Veri aralığına kırpılmış gün dizgileri (önbellek anahtarıyla aynı kural)
+        start, end = _range_key(_date_bounds)(start, end)
+    else:
+        start = pd.Timestamp(start).date().isoformat() if start else None
+        end = pd.Timestamp(end).date().isoformat() if end else None
+    mp = sorted(set(mp)) if mp else None
+    cat = sorted(set(cat)) if cat else None
+    version = store.data_key if store is not None else None
+    raw = json.dumps([version, start, end, mp, cat], default=str)
+    return {"key": hashlib.sha1(raw.encode()).hexdigest()[:16],
+            "start": start, "end": end, "mp": mp, "cat": cat}
+
+class _Subset:
+    """Bir filtre durumunun küp ve ham satır görünümleri (ilk kullanımda hesaplanır)."""
+
+    def __init__(self, state):
+        self.args = (state["start"], state["end"], state["mp"], state["cat"])
+        self._cube = self._rows = self._daily = None
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            self._cube = _cube(*self.args)
+        return self._cube
+
+    @property
+    def daily(self):
+        # Günlük toplam seri: frekans/kümülatif değişimi yalnızca bunu kovalara toplar
+        if self._daily is None:
+            start, end, mp, cat = self.args
+            self._daily = (engine.group(["order_date"], ["revenue"], start, end, marketplace=mp, category=cat)
+                           if engine is not None else self.cube)
+        return self._daily
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = _filter(df, *self.args)
+        return self._rows
+
+# Sunucu tarafı paylaşım: filtre özeti -> alt küme; çıktı callback'leri aynı dilimi kullanır
+_SUBSETS_MAX = 16
+_subsets = OrderedDict()
+_subsets_lock = threading.Lock()
+
+def _subset(state):
+    key = state["key"]
+    with _subsets_lock:
+        sub = _subsets.get(key)
+        if sub is not None:
+            _subsets.move_to_end(key)
+            return sub
+        sub = _subsets[key] = _Subset(state)
+        while len(_subsets) > _SUBSETS_MAX:
+            _subsets.popitem(last=False)
+    return sub
+
+# ---------- ÇIKTI ÜRETİCİLERİ ----------
+def _totals(sub):
+    # KPI toplamları: store varsa sorgu motorundan (bellek içinde hücre başına önek toplamlardan iki okuma)
+    if engine is not None:
+        start, end, mp, cat = sub.args
+        return engine.totals(start, end, ["revenue","sales_qty","net_profit","return_qty"],
+                             marketplace=mp, category=cat)
+    cube = sub.cube
+    t = {c: cube[c].sum() for c in ["revenue","sales_qty","net_profit","return_qty"]}
+    t["cells"] = len(cube)
+    return t
+
+def _kpis(sub):
+    stage("aggregate")
+    t = _totals(sub)
     alert = None
-    if dff.empty:
+    if not t["cells"]:
         alert = dbc.Alert(
             "Seçili filtrelerde veri bulunamadı. Tarih aralığını veya filtreleri genişletin.",
             color="warning", dismissable=True
         )
 
-    # KPIs
-    total_rev = float(dff["revenue"].sum()) if not dff.empty else 0.0
-    total_qty = int(dff["sales_qty"].sum()) if not dff.empty else 0
-    net_profit = float(dff["net_profit"].sum()) if not dff.empty else 0.0
-    return_rate = (dff["return_qty"].sum() / max(1, total_qty) * 100.0) if total_qty > 0 else 0.0
+    total_rev = float(t["revenue"])
+    total_qty = int(t["sales_qty"])
+    net_profit = float(t["net_profit"])
+    return_rate = (t["return_qty"] / max(1, total_qty) * 100.0) if total_qty > 0 else 0.0
 
+    stage("figure")
     kpis = [
         dbc.Col(kpi_card("Toplam Satış (₺)", f"{total_rev:,.0f}"), md=3),
         dbc.Col(kpi_card("Toplam Adet", f"{total_qty:,}"), md=3),
         dbc.Col(kpi_card("Net Kâr (₺)", f"{net_profit:,.0f}"), md=3),
         dbc.Col(kpi_card("İade Oranı", f"{return_rate:.1f}%"), md=3),
     ]
+    return alert, kpis
 
-    # Pazar yeri bar
-    bar_df = (dff.groupby("marketplace", as_index=False)["revenue"].sum()
-                .sort_values("revenue", ascending=False)) if not dff.empty else \
-             pd.DataFrame({"marketplace": [], "revenue": []})
+def _group(sub, by):
+    # Motor varsa toplamı motor hesaplar; yedek veride filtrelenmiş satırlar gruplanır
+    if engine is not None:
+        start, end, mp, cat = sub.args
+        out = engine.group(by, ["revenue"], start, end, marketplace=mp, category=cat)
+    else:
+        out = sub.cube
+        out = out if out.empty else out.groupby(by, as_index=False, observed=True)["revenue"].sum()
+    if out.empty:
+        # Filtrede veri yok: grafikler düz tipli boş tabloyla çizilir
+        return pd.DataFrame({**{c: [] for c in by}, "revenue": []})
+    return out
+
+def _bar_figure(sub):
+    stage("aggregate")
+    bar_df = _group(sub, ["marketplace"]).sort_values("revenue", ascending=False)
+    stage("figure")
     fig_bar = px.bar(bar_df, x="marketplace", y="revenue", text_auto=".2s",
                      title="Pazar yeri bazında satış (₺)")
     fig_bar.update_layout(xaxis_title="", yaxis_title="Satış (₺)", margin=dict(t=60,l=10,r=10,b=10))
+    return fig_bar
 
-    # --- YENİ: Kategori → Marka treemap (satış oranı, ₺ bazlı) ---
-    if not dff.empty:
-        cb_df = dff.groupby(["category","brand"], as_index=False)["revenue"].sum()
-    else:
-        cb_df = pd.DataFrame({"category": [], "brand": [], "revenue": []})
+def _tree_figure(sub):
+    # Kategori → Marka treemap (satış oranı, ₺ bazlı)
+    stage("aggregate")
+    cb_df = _group(sub, ["category","brand"])
+    stage("figure")
     fig_tree_cb = px.treemap(
         cb_df, path=["category","brand"], values="revenue",
         title="Kategori → Marka satış oranı (₺)"
     )
     fig_tree_cb.update_layout(margin=dict(t=60,l=10,r=10,b=10))
-
-    # Zaman serisi
-    ts = resample_time(dff if not dff.empty else df, freq=freq, value_col="revenue")
+    return fig_tree_cb
+
+def _line_figure(daily, freq, agg_mode):
+    stage("aggregate")
+    if daily.empty:
+        # Filtrede veri yoksa tüm dönemin serisi gösterilir
+        daily = engine.group(["order_date"], ["revenue"]) if engine is not None else _cube(None, None, None, None)
+    ts = resample_time(daily, freq=freq, value_col="revenue", mode=agg_mode)
     ts = ts.rename(columns={"revenue": "value"})
-    if agg_mode == "cumulative":
-        ts["value"] = ts["value"].cumsum()
 
+    stage("figure")
     fig_line = px.line(ts, x="order_date", y="value",
                        title="Zaman serisinde toplam satış" + (" (kümülatif)" if agg_mode=="cumulative" else " (dönemsel)"))
     fig_line.update_layout(xaxis_title="", yaxis_title="Satış (₺)", margin=dict(t=60,l=10,r=10,b=10))
+    # Çok yıllık günlük seride nokta bütçesi (LTTB) + ikili tarih dizisi
+    return reduce_figure(fig_line)
+
+def _top_figure(sub):
+    stage("aggregate")
+    if engine is not None:
+        # Ürün başına ilk 15 (kısmi seçim, ham satır taranmaz); isimler yalnızca bu satırlara
+        start, end, mp, cat = sub.args
+        top = engine.top("product_key", "revenue", 15, start, end, measures=["sales_qty"],
+                         marketplace=mp, category=cat)
+        top_df = store.products.label(top)
+    elif not sub.rows.empty:
+        top_df = (sub.rows.groupby(["product_name","brand"], as_index=False, observed=True)
+                    .agg(revenue=("revenue","sum"), sales_qty=("sales_qty","sum"))
+                    .sort_values("revenue", ascending=False)
+                    .head(15))
+    else:
+        top_df = pd.DataFrame({"product_name": [], "brand": [], "revenue": [], "sales_qty": []})
 
-    # En çok satan ürünler
-    top_df = (dff.groupby(["product_name","brand"], as_index=False)
-                .agg(revenue=("revenue","sum"), sales_qty=("sales_qty","sum"))
-                .sort_values("revenue", ascending=False)
-                .head(15)) if not dff.empty else \
-             pd.DataFrame({"product_name": [], "brand": [], "revenue": [], "sales_qty": []})
-
+    stage("figure")
     fig_top = px.bar(top_df, x="revenue", y="product_name", orientation="h",
                      text="sales_qty", title="En çok satan ürünler (₺) — (etikette adet)")
     fig_top.update_layout(xaxis_title="Satış (₺)", yaxis_title="", margin=dict(t=60,l=10,r=10,b=10))
     fig_top.update_yaxes(autorange="reversed")
+    return fig_top
 
-    return alert, kpis, fig_bar, fig_tree_cb, fig_line, fig_top
+# ---------- CALLBACKS ----------
+# Filtreler -> "sales-filter" (özet + normalize değerler); her çıktı yalnızca kendi
+# girdilerine bağlı. Frekans/kümülatif değişimi yalnızca çizgi grafiği yeniden hesaplar.
+@callback(
+    Output("sales-filter","data"),
+    Input("sales-date","start_date"),
+    Input("sales-date","end_date"),
+    Input("sales-mp","value"),
+    Input("sales-cat","value"),
+    State("sales-filter","data"),
+)
+def update_sales_filter(start, end, mp, cat, current):
+    state = _filter_state(start, end, mp, cat)
+    if current and current.get("key") == state["key"]:
+        # Ör. çoklu seçimde sıra değişti: aynı durum, aşağı akış tetiklenmez
+        return no_update
+    return state
+
+@callback(
+    Output("data-alert","children"),
+    Output("sales-kpis","children"),
+    Input("sales-filter","data"),
+)
+@_memoized
+def update_sales_kpis(state):
+    if not state:
+        raise PreventUpdate
+    return _kpis(_subset(state))
+
+@callback(Output("bar-mp-revenue","figure"), Input("sales-filter","data"))
+@_memoized
+def update_sales_bar(state):
+    if not state:
+        raise PreventUpdate
+    return _bar_figure(_subset(state))
+
+# Ağır çıktı: DASH_BACKGROUND=1 ile arka planda; beklerken grafik soluklaşır
+@_heavy_callback(
+    Output("treemap-cat-brand","figure"), Input("sales-filter","data"),
+    running=[(Output("treemap-cat-brand","style"), {"opacity":0.5}, {"opacity":1})],
+    cancel=[_PAGE_CHANGE] if _PAGE_CHANGE is not None else None,
+)
+@_memoized
+def update_sales_tree(state):
+    if not state:
+        raise PreventUpdate
+    return _tree_figure(_subset(state))
+
+@callback(Output("top-products","figure"), Input("sales-filter","data"))
+@_memoized
+def update_sales_top(state):
+    if not state:
+        raise PreventUpdate
+    return _top_figure(_subset(state))
+
+@callback(
+    Output("line-total-sales","figure"),
+    Input("sales-filter","data"),
+    Input("freq","value"),
+    Input("agg_mode","value"),
+)
+def update_sales_line(state, freq, agg_mode):
+    if not state:
+        raise PreventUpdate
+    fig = _line_figure(_subset(state).daily, freq, agg_mode)
+    if "sales-filter.data" in ctx.triggered_prop_ids or ctx.triggered_id not in ("freq", "agg_mode"):
+        return fig
+    # Yalnızca seri değişti: şablon ve düzen yeniden gönderilmez
+    spec = fig.to_plotly_json()
+    patch = Patch()
+    patch["data"][0] = spec["data"][0]
+    patch["layout"]["title"]["text"] = fig.layout.title.text
+    patch["layout"]["xaxis"]["type"] = fig.layout.xaxis.type
+    return patch
+
+# Dışa aktarma: satırlar + sayfanın tabloları, normalize filtre durumuyla (/export/sales/...)
+@callback(Output("sales-export","children"), Input("sales-filter","data"))
+def update_sales_export(state):
+    if not state or _export is None or store is None:
+        raise PreventUpdate
+    return _export.menu("sales", state["start"], state["end"], marketplace=state["mp"], category=state["cat"])
+
+if _export is not None:
+    @_export.table("sales", "marketplaces", "Pazar yeri satışları")
+    def _export_marketplaces(start, end, **filters):
+        return engine.group(["marketplace"], ["revenue","sales_qty","net_profit"], start, end, **filters)
+
+    @_export.table("sales", "category-brand", "Kategori → Marka")
+    def _export_category_brand(start, end, **filters):
+        return engine.group(["category","brand"], ["revenue","sales_qty"], start, end, **filters)
+
+    @_export.table("sales", "daily", "Günlük satış")
+    def _export_daily(start, end, **filters):
+        return engine.group(["order_date"], ["revenue","sales_qty","net_profit"], start, end, **filters)
+
+    @_export.table("sales", "products", "Ürün satışları")
+    def _export_products(start, end, **filters):
+        totals = engine.group(["product_key"], ["revenue","sales_qty"], start, end, **filters)
+        out = store.products.label(totals.set_index("product_key"), ["product_id","product_name","brand"])
+        # İç vekil anahtar dosyaya yazılmaz; ürün product_id ile tanınır
+        return out.drop(columns="product_key")
+
+def update_sales(start, end, mp, cat, freq, agg_mode):
+    """Sayfanın tüm çıktıları tek çağrıda (benchmark ve eşdeğerlik kontrolleri için)."""
+    state = _filter_state(start, end, mp, cat)
+    sub = _subset(state)
+    daily = sub.daily
+    # Bağımsız çıktılar iş parçacığı havuzunda birlikte (tek çekirdekte sırayla)
+    (alert, kpis), bar, tree, line, top = _gather(
+        lambda: _kpis(sub), lambda: _bar_figure(sub), lambda: _tree_figure(sub),
+        lambda: _line_figure(daily, freq, agg_mode), lambda: _top_figure(sub))
+    return alert, kpis, bar, tree, line, top
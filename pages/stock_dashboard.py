@@ -1,41 +1,66 @@
 
-from dash import register_page, html, dcc, Input, Output, callback
+from dash import register_page, html, dcc, Input, Output, State, callback
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
-from utils.data import load_data, load_stock
+from utils import export
+from utils.cache import memoize
+from utils.metrics import stage
+from utils.forecast import get_demand_model
+from utils.stock import get_stock_index
 
 register_page(__name__, path="/stock", name="Stok Yönetimi")
 
-df = load_data()
-stock = load_stock()
-
-product_options = (
-    stock[["product_id", "product_name"]]
-    .drop_duplicates()
-    .assign(
-        label=lambda x: x["product_name"] + " (" + x["product_id"] + ")",
-        value=lambda x: x["product_id"]
-    )[["label", "value"]]            # <-- fazladan alanları at
-    .to_dict("records")
-)
+# Tarayıcıya gönderilen ürün seçeneği üst sınırı; fazlası arama ile sunucudan gelir
+OPTIONS_LIMIT = 1000
+
+def _demand_model():
+    # Satış geçmişi yoksa (yalnızca stok dosyası) snapshot ortalamalarına düşülür
+    try:
+        return get_demand_model()
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _version():
+    model = _demand_model()
+    return get_stock_index().token, None if model is None else model.key
 
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(dcc.Dropdown(product_options, id="stock-product", placeholder="Ürün seç (gauge için)"), md=5),
-        dbc.Col(dcc.Dropdown(sorted(stock["marketplace"].unique()), id="stock-mp", multi=True, placeholder="Pazar yeri"), md=4),
-        dbc.Col(dcc.Slider(0, 30, 1, value=14, id="forecast-days", tooltip={"always_visible":True}, marks=None), md=3),
-    ], class_name="mb-3"),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="gauge-stock"), md=4),
-        dbc.Col(dcc.Graph(id="stock-by-mp"), md=4),
-        dbc.Col(dcc.Graph(id="forecast-line"), md=4),
-    ], class_name="mb-4"),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="critical-stock-table"), md=12)
-    ])
-], fluid=True)
+def layout(**_):
+    index = get_stock_index()
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(index.options(limit=OPTIONS_LIMIT), id="stock-product", placeholder="Ürün seç (gauge için)"), md=5),
+            dbc.Col(dcc.Dropdown(index.marketplaces, id="stock-mp", multi=True, placeholder="Pazar yeri"), md=4),
+            dbc.Col(dcc.Slider(0, 30, 1, value=14, id="forecast-days", tooltip={"always_visible":True}, marks=None), md=3),
+        ], class_name="mb-3"),
+        dbc.Row(dbc.Col(dbc.DropdownMenu(label="Dışa aktar", id="stock-export", size="sm", color="secondary"),
+                        width="auto"), justify="end", class_name="mb-2"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="gauge-stock"), md=4),
+            dbc.Col(dcc.Graph(id="stock-by-mp"), md=4),
+            dbc.Col(dcc.Graph(id="forecast-line"), md=4),
+        ], class_name="mb-4"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="critical-stock-table"), md=12)
+        ])
+    ], fluid=True)
+
+@callback(
+    Output("stock-product","options"),
+    Input("stock-product","search_value"),
+    State("stock-product","value"),
+)
+def search_products(search, value):
+    # Büyük katalogda seçenekler yazdıkça sunucuda süzülür
+    index = get_stock_index()
+    if not search or len(index.products) <= OPTIONS_LIMIT:
+        raise PreventUpdate
+    options = index.options(search, limit=50)
+    if value and all(o["value"] != value for o in options):
+        options += [o for o in index.options(value, limit=1)]
+    return options
 
 @callback(
     Output("gauge-stock","figure"),
@@ -46,17 +71,23 @@ layout = dbc.Container([
     Input("stock-mp","value"),
     Input("forecast-days","value"),
 )
+@memoize(version=_version)
 def update_stock(pid, mp_list, horizon):
-    s = stock.copy()
-    if mp_list:
-        s = s[s["marketplace"].isin(mp_list)]
+    stage("filter")
+    index = get_stock_index()
+    # Satış geçmişinden öğrenilen talep (tüm SKU'lar tek geçişte, veri sürümü başına bir kez)
+    demand = index.demand(_demand_model())
+    # Kopya yok: pazar yeri filtresi kategorik kodlar üzerinde maske
+    mask = index.mask(mp_list)
     # Gauge: pick the first matching row for product
+    stage("figure")
     gauge_fig = go.Figure()
     if pid:
-        row = s[s["product_id"]==pid].sort_values("current_stock", ascending=False).head(1)
-        if not row.empty:
-            cs = int(row["current_stock"].iloc[0])
-            rl = int(row["reorder_level"].iloc[0])
+        rows = index.product_rows(pid, mask)
+        if len(rows):
+            row = rows[index.current[rows].argmax()]
+            cs = int(index.current[row])
+            rl = int(index.reorder_level[row])
             gauge_fig.add_trace(go.Indicator(
                 mode="gauge+number",
                 value=cs,
@@ -74,27 +105,52 @@ def update_stock(pid, mp_list, horizon):
     gauge_fig.update_layout(height=300, margin=dict(l=10,r=10,t=40,b=10))
 
     # Stock by marketplace
-    by_mp = s.groupby("marketplace", as_index=False).agg({"current_stock":"sum"})
+    stage("aggregate")
+    by_mp = index.by_marketplace(mask)
+    stage("figure")
     fig_mp = px.bar(by_mp, x="marketplace", y="current_stock", title="Pazar yeri bazında stok dağılımı")
 
-    # Forecast line: naive depletion using daily_avg_sales
+    # Forecast line: talep tahminiyle stok erimesi ve %90 güven bandı (NumPy, çok ürün için aynı çağrı)
     f_line = go.Figure()
-    if pid:
-        rs = s[s["product_id"]==pid]
-        if not rs.empty:
-            cs_total = rs["current_stock"].sum()
-            daily = max(0.2, rs["daily_avg_sales"].sum())
-            days = list(range(horizon+1))
-            proj = [max(0, cs_total - d*daily) for d in days]
-            f_line.add_trace(go.Scatter(x=days, y=proj, mode="lines+markers", name="Proj. Stok"))
-            f_line.update_layout(title=f"Stok bitiş tahmini (~{round(cs_total/daily,1)} gün)", xaxis_title="Gün", yaxis_title="Stok")
-
-    # Critical stock table (bar chart as table-like)
-    crit = s.copy()
-    crit["coverage_days"] = (crit["current_stock"] / crit["daily_avg_sales"].replace(0, 0.25)).round(1)
-    crit = crit.sort_values(["coverage_days","current_stock"]).head(25)
+    if pid and len(index.product_rows(pid, mask)):
+        fc = index.forecast([pid], horizon, mask, demand)
+        days = list(range(horizon+1))
+        f_line.add_trace(go.Scatter(x=days, y=fc.upper[0], mode="lines", line={"width":0}, showlegend=False, hoverinfo="skip"))
+        f_line.add_trace(go.Scatter(x=days, y=fc.lower[0], mode="lines", line={"width":0}, fill="tonexty",
+                                    fillcolor="rgba(99,110,250,0.2)", name="%90 bant"))
+        f_line.add_trace(go.Scatter(x=days, y=fc.projection[0], mode="lines+markers", name="Proj. Stok"))
+        f_line.update_layout(title=f"Stok bitiş tahmini (~{round(fc.stock[0]/fc.daily[0],1)} gün)", xaxis_title="Gün", yaxis_title="Stok")
+
+    # Critical stock table (bar chart as table-like): önceden sıralı kritik listeden ilk 25;
+    # çubuk sayısı burada sınırlı olduğundan reduce_figure gerekmez
+    stage("aggregate")
+    crit = index.critical(25, mask, demand)
+    stage("figure")
     fig_table = px.bar(crit, x="current_stock", y=crit["product_id"]+" | "+crit["marketplace"],
                        orientation="h", title="Kritik stok listesi (düşük coverage gün)",
-                       hover_data=["reorder_level","daily_avg_sales","coverage_days"])
+                       hover_data=["reorder_level","daily_avg_sales","demand_rate","coverage_days","coverage_low"])
 
     return gauge_fig, fig_mp, f_line, fig_table
+
+# Dışa aktarma: stok satırları + kritik liste ve pazar yeri toplamları (/export/stock/...)
+@callback(Output("stock-export","children"), Input("stock-mp","value"))
+def update_stock_export(mp_list):
+    return export.menu("stock", marketplace=mp_list)
+
+# Sayfa sipariş satırlarından değil stok dosyasından beslenir: satırlar da stok satırlarıdır
+@export.table("stock", "rows", "Stok satırları")
+def _export_rows(start, end, marketplace=None, **_):
+    index = get_stock_index()
+    mask = index.mask(marketplace)
+    return index.frame if mask is None else index.frame[mask]
+
+@export.table("stock", "critical", "Kritik stok listesi")
+def _export_critical(start, end, marketplace=None, **_):
+    # Sayfadaki ilk 25 değil, seçili pazar yerlerinin tüm satırları coverage sırasıyla
+    index = get_stock_index()
+    return index.critical(len(index), index.mask(marketplace), index.demand(_demand_model()))
+
+@export.table("stock", "marketplaces", "Pazar yeri bazında stok")
+def _export_marketplaces(start, end, marketplace=None, **_):
+    index = get_stock_index()
+    return index.by_marketplace(index.mask(marketplace))
@@ -0,0 +1,72 @@
+"""The pandas and SQLite engines answer every page request alike on a small demo store."""
+import numpy as np
+import pytest
+
+from utils import data, engine_check
+from utils.demo import demo_sales
+from utils.sqlite_engine import SqliteEngine
+
+RTOL = 1e-9
+
+@pytest.fixture(scope="module")
+def store():
+    frame = demo_sales(n_days=90, orders_per_day=(20, 40), end="2025-12-31", seed=7)
+    return data.SalesStore(frame, source="test-engines")
+
+@pytest.fixture(scope="module")
+def engines(store, tmp_path_factory):
+    sqlite = SqliteEngine(store, str(tmp_path_factory.mktemp("sqlite") / "sales.sqlite"))
+    sqlite.sync()
+    return data.PandasEngine(store), sqlite
+
+@pytest.mark.parametrize("request_name", list(engine_check.REQUESTS))
+def test_engines_agree(store, engines, request_name):
+    # The filter matrix of engine_check, including a range without data
+    issues = []
+    for case, start, end, filters in engine_check._cases(store):
+        if filters and ("region" in filters) != (request_name in engine_check.GEO):
+            continue
+        a, b = (engine_check._call(e, request_name, start, end, filters) for e in engines)
+        problem = engine_check._diff(a, b, RTOL, request_name)
+        if problem:
+            issues.append(f"{case}: {problem}")
+    assert not issues
+
+def test_totals_match_rows(store, engines):
+    frame = store.orders.frame
+    for engine in engines:
+        totals = engine.totals(measures=["revenue", "sales_qty", "net_profit"])
+        for m in ("revenue", "sales_qty", "net_profit"):
+            assert np.isclose(totals[m], frame[m].sum(), rtol=RTOL)
+
+def test_filtered_group_and_top(store, engines):
+    mp = store.values("marketplace")[:1]
+    _, last = store.date_bounds()
+    start = (last - np.timedelta64(29, "D")).date().isoformat()
+    pandas_engine, sqlite = engines
+    a = pandas_engine.group(["marketplace"], ["revenue"], start, last.date().isoformat(), marketplace=mp)
+    b = sqlite.group(["marketplace"], ["revenue"], start, last.date().isoformat(), marketplace=mp)
+    assert list(a["marketplace"]) == list(b["marketplace"]) == mp
+    assert np.isclose(a["revenue"].sum(), b["revenue"].sum(), rtol=RTOL)
+    top_a = pandas_engine.top("product_key", "revenue", 10, start, last.date().isoformat(), marketplace=mp)
+    top_b = sqlite.top("product_key", "revenue", 10, start, last.date().isoformat(), marketplace=mp)
+    assert len(top_a) == len(top_b) == 10
+    np.testing.assert_allclose(top_a["revenue"].to_numpy(float), top_b["revenue"].to_numpy(float), rtol=RTOL)
+
+def test_empty_range(engines):
+    for engine in engines:
+        assert engine.totals("2100-01-01", "2100-01-31", measures=["revenue"])["revenue"] == 0
+        out = engine.group(["category"], ["revenue"], "2100-01-01", "2100-01-31")
+        assert out.empty and list(out.columns) == ["category", "revenue"]
+
+def test_query_engine_is_abstract():
+    with pytest.raises(TypeError, match="abstract"):
+        data.QueryEngine()
+
+    class TotalsOnly(data.QueryEngine):
+        def totals(self, start=None, end=None, measures=None, **filters):
+            return {}
+
+    # group() is required as well
+    with pytest.raises(TypeError, match="group"):
+        TotalsOnly()
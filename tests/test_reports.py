@@ -0,0 +1,47 @@
+"""Report PDFs: merged with pypdf, one page per figure, readable back."""
+import io
+
+import plotly.graph_objects as go
+import pytest
+
+from utils import reports
+
+pypdf = pytest.importorskip("pypdf")
+
+def _page(width, height):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=width, height=height)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+def test_write_pdf_merges_pages(tmp_path):
+    path = tmp_path / "all.pdf"
+    reports.write_pdf(str(path), [_page(600, 400), _page(800, 450), _page(600, 400)], "Tümü")
+    pdf = pypdf.PdfReader(str(path))
+    assert len(pdf.pages) == 3
+    assert float(pdf.pages[1].mediabox.width) == 800
+    assert pdf.metadata.title == "Tümü"
+    assert not list(tmp_path.glob("*.tmp"))
+
+def _kaleido_renders():
+    try:
+        go.Figure().to_image(format="pdf")
+    except Exception:
+        return False
+    return True
+
+def test_render_pdf(tmp_path, monkeypatch):
+    pytest.importorskip("kaleido")
+    if not _kaleido_renders():
+        pytest.skip("kaleido cannot start Chrome here")
+    figures = [("Satış", go.Figure(go.Bar(x=["a", "b"], y=[1, 2]), layout={"title": {"text": "Bar"}})),
+               ("İade", go.Figure(go.Pie(labels=["x", "y"], values=[3, 4])))]
+    monkeypatch.setattr(reports, "_figures", lambda start, end, mp, cat: figures)
+    job = reports.jobs("marketplace", [], None, None, "pdf", str(tmp_path))[0]
+    entry = reports.render(job)
+    assert "error" not in entry, entry.get("error")
+    pdf = pypdf.PdfReader(entry["files"][0])
+    assert len(pdf.pages) == len(figures)
+    # Vector pages: the figure's text is in the page, not a raster image
+    assert "Bar" in pdf.pages[0].extract_text()
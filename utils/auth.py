@@ -0,0 +1,196 @@
+"""Login check in a Flask request hook, backed by a signed session cookie.
+
+Credentials live in ``data/users.json`` (``AUTH_USERS_FILE``) as
+``{"user": "pbkdf2_sha256$<iterations>$<salt>$<hash>"}``; add or change one with::
+
+    python -m utils.auth set admin
+
+A successful login stores the user in Flask's session cookie, signed with
+``DASH_SECRET_KEY`` (or a random key kept in ``data/.cache/session_secret``,
+shared by the workers of one box); ``/logout`` clears it. ``install()`` checks that cookie
+before any request reaches Dash: protected pages redirect to the login page,
+and page callbacks and exports answer 401, so no aggregation runs for a
+client that is not logged in. Only the callbacks of the login page (and the
+page router on public paths) are served without a session.
+"""
+import argparse
+import base64
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+from datetime import timedelta
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+USERS_PATH = os.environ.get("AUTH_USERS_FILE", os.path.join(DATA_DIR, "users.json"))
+SECRET_PATH = os.path.join(DATA_DIR, ".cache", "session_secret")
+SESSION_HOURS = float(os.environ.get("AUTH_SESSION_HOURS", "12"))
+ITERATIONS = 260_000
+
+# Request prefixes that need a session besides the pages themselves
+PROTECTED_PREFIXES = ("/export/",)
+# Callbacks the login screen needs before there is a session
+PUBLIC_OUTPUTS = {"login-alert", "login-nav", "_pages_content", "_pages_store"}
+CALLBACK_PATH = "/_dash-update-component"
+LOGOUT_PATH = "/logout"
+
+_users = {}
+_users_mtime = None
+_users_lock = threading.Lock()
+_dummy = None
+# Page paths and prefixes that need a session (set by install())
+_prefixes = ()
+
+def hash_password(password, iterations=ITERATIONS):
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    b64 = lambda b: base64.b64encode(b).decode("ascii")
+    return f"pbkdf2_sha256${iterations}${b64(salt)}${b64(digest)}"
+
+def _matches(password, stored):
+    try:
+        algo, iterations, salt, digest = stored.split("$")
+    except (AttributeError, ValueError):
+        return False
+    if algo != "pbkdf2_sha256":
+        return False
+    actual = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations))
+    return hmac.compare_digest(actual, base64.b64decode(digest))
+
+def users(path=USERS_PATH):
+    """User -> password hash, re-read when the file changes."""
+    global _users, _users_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _users_lock:
+        if mtime != _users_mtime:
+            with open(path, encoding="utf-8") as f:
+                _users, _users_mtime = json.load(f), mtime
+        return _users
+
+def check(user, password):
+    """Canonical user name when ``password`` is right for ``user``, else None."""
+    global _dummy
+    user = (user or "").strip().lower()
+    stored = users().get(user)
+    if stored is None and _dummy is None:
+        _dummy = hash_password(secrets.token_hex(16))
+    # Unknown users cost the same hash as wrong passwords
+    ok = _matches(password or "", stored or _dummy)
+    return user if ok and stored is not None else None
+
+def current_user():
+    """The logged-in user of the current request, or None."""
+    from flask import session
+    return session.get("user")
+
+def login(user):
+    from flask import session
+    session.clear()
+    session["user"] = user
+    session.permanent = True
+
+def logout():
+    from flask import session
+    session.clear()
+
+def _secret_key():
+    key = os.environ.get("DASH_SECRET_KEY")
+    if key:
+        return key
+    try:
+        with open(SECRET_PATH, encoding="ascii") as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(SECRET_PATH), exist_ok=True)
+    key = secrets.token_hex(32)
+    try:
+        # O_EXCL: of several workers starting together, one writes and the rest read it
+        fd = os.open(SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(SECRET_PATH, encoding="ascii") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(key)
+    return key
+
+def _public_callback(body):
+    # Every output belongs to the login screen, and the router is not asked for a protected page
+    outputs = body.get("outputs")
+    outputs = outputs if isinstance(outputs, list) else [outputs]
+    if not all(isinstance(o, dict) and o.get("id") in PUBLIC_OUTPUTS for o in outputs):
+        return False
+    return all(i.get("id") != "_pages_location" or i.get("property") != "pathname" or not _protected(i.get("value"))
+               for i in body.get("inputs") or [] if isinstance(i, dict))
+
+def _protected(path):
+    path = path or "/"
+    return any(path == p or path.startswith(p.rstrip("/") + "/") for p in _prefixes)
+
+def install(app, protected, login_path="/"):
+    """Require a session for the ``protected`` page paths, exports and page callbacks."""
+    global _prefixes
+    from flask import abort, redirect, request
+
+    server = app.server
+    server.secret_key = _secret_key()
+    server.config.update(PERMANENT_SESSION_LIFETIME=timedelta(hours=SESSION_HOURS),
+                         SESSION_COOKIE_HTTPONLY=True, SESSION_COOKIE_SAMESITE="Lax")
+    _prefixes = tuple(protected) + PROTECTED_PREFIXES
+
+    @server.before_request
+    def _require_login():
+        if current_user() is not None:
+            return None
+        if request.path == CALLBACK_PATH:
+            if not _public_callback(request.get_json(silent=True) or {}):
+                abort(401)
+            return None
+        if _protected(request.path):
+            if request.path.startswith(PROTECTED_PREFIXES):
+                abort(401)
+            return redirect(login_path)
+        return None
+
+    @server.route(LOGOUT_PATH)
+    def _logout():
+        logout()
+        return redirect(login_path)
+    return _require_login
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Manage dashboard users")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    add = sub.add_parser("set", help="add a user or change its password")
+    add.add_argument("user")
+    rm = sub.add_parser("remove", help="delete a user")
+    rm.add_argument("user")
+    ap.add_argument("--file", default=USERS_PATH)
+    args = ap.parse_args(argv)
+    try:
+        with open(args.file, encoding="utf-8") as f:
+            table = json.load(f)
+    except OSError:
+        table = {}
+    user = args.user.strip().lower()
+    if args.cmd == "set":
+        password = getpass.getpass(f"Password for {user}: ")
+        if password != getpass.getpass("Again: "):
+            ap.error("passwords do not match")
+        table[user] = hash_password(password)
+    elif table.pop(user, None) is None:
+        ap.error(f"no user {user!r}")
+    tmp = f"{args.file}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=1)
+    os.replace(tmp, args.file)
+    print(f"{len(table)} user(s) in {args.file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Opt-in background execution of heavy callbacks (``DASH_BACKGROUND=1``).
+
+Heavy page callbacks are declared with ``background.callback`` instead of
+``dash.callback``. When enabled, Dash runs them as background callbacks
+through a ``DiskcacheManager``: each job runs in a forked process next to
+the server, and results and progress travel through a local diskcache
+directory, with no broker. The request thread only starts the job and polls
+it, so one slow query no longer holds a worker thread while other
+analysts wait.
+
+- A job is cancelled when the same callback is triggered again (the user
+  changed a filter mid-computation) or when its ``cancel`` inputs fire.
+- ``report_progress(done, total)`` inside the callback feeds the page's progress
+  output; outside a background job it does nothing.
+
+Without the flag, or without the optional ``diskcache``/``multiprocess``/
+``psutil`` packages, the same declarations register plain synchronous
+callbacks, and ``running`` still toggles the page's busy indicator.
+"""
+import functools
+import os
+import tempfile
+import threading
+
+import dash
+
+ENABLED = os.environ.get("DASH_BACKGROUND", "0") == "1"
+# Job results and progress; local to the box, shared by all of its workers
+CACHE_DIR = os.environ.get("DASH_BACKGROUND_DIR", os.path.join(tempfile.gettempdir(), "dash-background"))
+# How often the browser polls a running job (ms)
+INTERVAL_MS = int(os.environ.get("DASH_BACKGROUND_INTERVAL_MS", "250"))
+# Seconds a finished job's result is kept for the polling request
+EXPIRE_S = int(os.environ.get("DASH_BACKGROUND_EXPIRE_S", "600"))
+
+# Leaving the page cancels its running jobs
+PAGE_CHANGE = dash.Input("_pages_location", "pathname")
+
+_local = threading.local()
+_manager = None
+_manager_lock = threading.Lock()
+
+def _data_key():
+    try:
+        from utils.data import get_store
+        return get_store().data_key
+    except Exception:
+        return None
+
+def get_manager():
+    """The shared ``DiskcacheManager``, or None (disabled / dependencies missing)."""
+    global _manager
+    if not ENABLED:
+        return None
+    with _manager_lock:
+        if _manager is None:
+            try:
+                import diskcache
+                # cache_by: a repeated (inputs, data version) is answered without starting a job
+                _manager = dash.DiskcacheManager(diskcache.Cache(CACHE_DIR), cache_by=[_data_key],
+                                                 expire=EXPIRE_S)
+            except ImportError:
+                # Background callbacks need diskcache, multiprocess and psutil
+                _manager = False
+        return _manager or None
+
+def report_progress(done, total):
+    """Report ``done`` of ``total`` steps to the job's progress output, if any."""
+    set_progress = getattr(_local, "set_progress", None)
+    if set_progress is not None:
+        set_progress((round(100 * done / max(total, 1)), f"{done}/{total}"))
+
+def _with_progress(fn):
+    # Dash passes ``set_progress`` first; report_progress() finds it thread-locally
+    @functools.wraps(fn)
+    def job(set_progress, *args):
+        _local.set_progress = set_progress
+        try:
+            return fn(*args)
+        finally:
+            _local.set_progress = None
+    return job
+
+def callback(*args, progress=None, running=None, cancel=None, **kwargs):
+    """``dash.callback`` that runs in the background when enabled.
+
+    ``progress`` is a ``[value, label]`` output pair fed by ``report_progress()``;
+    ``running`` and ``cancel`` are passed through to Dash. The decorated
+    function is returned unchanged, so it can still be called directly.
+    """
+    def decorate(fn):
+        manager = get_manager()
+        if manager is None:
+            dash.callback(*args, running=running, **kwargs)(fn)
+            return fn
+        dash.callback(*args, background=True, manager=manager, interval=INTERVAL_MS,
+                      progress=progress, running=running, cancel=cancel, **kwargs)(
+            _with_progress(fn) if progress is not None else fn)
+        return fn
+    return decorate
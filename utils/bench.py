@@ -0,0 +1,247 @@
+"""Benchmark the page callbacks on synthetic data of increasing size.
+
+Every dataset size runs in its own worker process (pages bind the shared
+store at import, and peak memory stays comparable between sizes). Each
+callback is called directly, without the HTTP layer, over a matrix of
+filter combinations; the result cache is disabled so every call computes::
+
+    python -m utils.bench --rows 100000 1000000 10000000 --save bench.json
+    python -m utils.bench --rows 100000 1000000 --compare bench.json
+    python -m utils.bench --rows 1000000 --engine sqlite
+
+``--compare`` exits with status 1 when latency, peak memory or payload size
+regressed past ``--tolerance`` against the baseline file.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+CALLBACKS = {
+    "sales": ("pages.sales_dashboard", "update_sales"),
+    "finance": ("pages.finance_dashboard", "update_fin"),
+    "fin-kpis": ("pages.finance_dashboard", "update_fin_kpis"),
+    "returns": ("pages.returns_dashboard", "update_returns"),
+    "ret-kpis": ("pages.returns_dashboard", "update_returns_kpis"),
+    "regional": ("pages.regional_dashboard", "update_reg"),
+    "stock": ("pages.stock_dashboard", "update_stock"),
+}
+# Latency differences below this are noise, whatever the relative change
+NOISE_MS = 5.0
+
+def _cases(store, stock):
+    """Filter matrix per callback: (case name, positional args)."""
+    first, last = store.date_bounds()
+    day = lambda ts: ts.date().isoformat()
+    last30, last90 = day(last - np.timedelta64(29, "D")), day(last - np.timedelta64(89, "D"))
+    full = (day(first), day(last))
+    mps, cats, regions = store.values("marketplace"), store.values("category"), store.values("region")
+    ranges = [
+        ("all", full, None, None),
+        ("30d", (last30, day(last)), None, None),
+        ("90d-1mp", (last90, day(last)), mps[:1], None),
+        ("all-2mp-1cat", full, mps[:2], cats[:1]),
+        ("30d-1mp-3cat", (last30, day(last)), mps[:1], cats[:3]),
+    ]
+    cases = {name: [] for name in CALLBACKS}
+    for name, (s, e), mp, cat in ranges:
+        cases["sales"].append((name, (s, e, mp, cat, "W", "periodic")))
+        for page in ("finance", "fin-kpis", "returns", "ret-kpis"):
+            cases[page].append((name, (s, e, mp, cat)))
+    cases["sales"] += [("all-daily-cum", (*full, None, None, "D", "cumulative")),
+                       ("all-monthly", (*full, None, None, "M", "periodic"))]
+    for name, (s, e), mp, _ in ranges[:3]:
+        cases["regional"].append((name, (s, e, mp, None)))
+    cases["regional"].append(("all-2reg", (*full, None, regions[:2])))
+    pid = stock["product_id"].iloc[0]
+    cases["stock"] = [
+        ("all", (None, None, 14)),
+        ("1product", (pid, None, 14)),
+        ("1product-2mp", (pid, mps[:2], 30)),
+    ]
+    return cases
+
+def _payload_bytes(outputs):
+    # Same encoder Dash uses for the response body
+    from plotly.io.json import to_json_plotly
+    if not isinstance(outputs, tuple):  # several outputs; a list is one (children) output
+        outputs = [outputs]
+    return [len(to_json_plotly(o).encode("utf-8")) for o in outputs]
+
+def _measure(fn, args, repeat, warmup):
+    for _ in range(warmup):
+        fn(*args)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        times.append((time.perf_counter() - t0) * 1000)
+    # Peak Python/NumPy allocations of one extra call (tracemalloc slows it, so untimed)
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {
+        "p50_ms": round(float(p50), 3), "p90_ms": round(float(p90), 3),
+        "p99_ms": round(float(p99), 3), "max_ms": round(max(times), 3),
+        "peak_mb": round(peak / 2**20, 2),
+        "payload_bytes": _payload_bytes(out),
+    }
+
+def run_worker(rows, days, products, cities, seed, repeat, warmup, only, engine="pandas"):
+    """Build one dataset, import the pages against it and time every case."""
+    os.environ["CALLBACK_CACHE"] = "0"
+    os.environ["SALES_ENGINE"] = engine
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ["SALES_SQLITE_PATH"] = os.path.join(workdir, "sales.sqlite")
+    import dash
+    import pandas as pd
+    from utils import data
+    from utils.demo import demo_sales, demo_stock
+
+    t0 = time.perf_counter()
+    frame = demo_sales(n_days=days, orders_per_day=max(1, rows // days), n_products=products,
+                       n_cities=cities, end="2025-12-31", seed=seed)
+    generate_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    store = data.set_store(data.SalesStore(frame, source="bench"))
+    store_s = time.perf_counter() - t0
+    del frame
+    # The engine's own storage (the SQLite copy) is built before timing
+    t0 = time.perf_counter()
+    sync = getattr(data.get_engine(), "sync", None)
+    if sync is not None:
+        sync()
+    engine_s = time.perf_counter() - t0
+    orders = store.orders.frame
+
+    stock = demo_stock(products, seed=seed)
+    stock_path = os.path.join(workdir, "stock_snapshot.csv")
+    stock.to_csv(stock_path, index=False)
+    data.STOCK_PATH = stock_path
+
+    # register_page needs an app; pages are not rendered, only their callbacks called
+    dash.Dash(__name__, use_pages=True, pages_folder="")
+    results = []
+    for name, cases in _cases(store, stock).items():
+        if only and name not in only:
+            continue
+        module, attr = CALLBACKS[name]
+        fn = getattr(importlib.import_module(module), attr)
+        for case, args in cases:
+            r = _measure(fn, args, repeat, warmup)
+            results.append({"callback": name, "case": case, "rows": len(orders), **r})
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "rows": len(orders),
+        "products": int(orders["product_id"].nunique()),
+        "cities": int(orders["city"].nunique()),
+        "generate_s": round(generate_s, 3),
+        "store_s": round(store_s, 3),
+        "engine": engine,
+        "engine_s": round(engine_s, 3),
+        "store_mb": round(store.nbytes / 2**20, 1),
+        "pandas": pd.__version__,
+        "results": results,
+    }
+
+def _key(r):
+    return (r["rows"], r["callback"], r["case"])
+
+def compare(baseline, current, tolerance):
+    """Regression lines for results that got slower, bigger or heavier than the baseline."""
+    base = {_key(r): r for r in baseline["results"]}
+    issues = []
+    for r in current["results"]:
+        b = base.get(_key(r))
+        if b is None:
+            continue
+        label = f"{r['callback']}/{r['case']} @ {r['rows']:,}"
+        if r["p50_ms"] > b["p50_ms"] * (1 + tolerance) and r["p50_ms"] - b["p50_ms"] > NOISE_MS:
+            issues.append(f"{label}: p50 {b['p50_ms']:.1f} -> {r['p50_ms']:.1f} ms")
+        if r["peak_mb"] > b["peak_mb"] * (1 + tolerance) and r["peak_mb"] - b["peak_mb"] > 1:
+            issues.append(f"{label}: peak {b['peak_mb']:.1f} -> {r['peak_mb']:.1f} MB")
+        for i, (old, new) in enumerate(zip(b["payload_bytes"], r["payload_bytes"])):
+            if new > old * (1 + tolerance):
+                issues.append(f"{label}: output {i} payload {old:,} -> {new:,} B")
+    return issues
+
+def _print(report):
+    for run in report["runs"]:
+        print(f"\n{run['rows']:,} rows, {run['products']} products, {run['cities']} cities "
+              f"(store {run['store_mb']} MB, built in {run['store_s']} s; "
+              f"{run.get('engine', 'pandas')} engine ready in {run.get('engine_s', 0)} s)")
+        print(f"{'callback':<10}{'case':<16}{'p50':>9}{'p90':>9}{'p99':>9}{'peak MB':>9}  payload KB")
+        for r in run["results"]:
+            kb = " ".join(f"{b / 1024:.0f}" for b in r["payload_bytes"])
+            print(f"{r['callback']:<10}{r['case']:<16}{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}"
+                  f"{r['p99_ms']:>9.1f}{r['peak_mb']:>9.1f}  {kb}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the dashboard page callbacks")
+    ap.add_argument("--rows", type=float, nargs="+", default=[1e5, 1e6, 1e7])
+    ap.add_argument("--days", type=int, default=730)
+    ap.add_argument("--products", type=int, default=None, help="catalog size (default: products.csv)")
+    ap.add_argument("--cities", type=int, default=None, help="city count (default: 24 provinces)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--only", nargs="+", choices=sorted(CALLBACKS), help="callbacks to run")
+    ap.add_argument("--engine", default="pandas", choices=["pandas", "sqlite"], help="query engine of the pages")
+    ap.add_argument("--save", help="write results as JSON (a baseline for --compare)")
+    ap.add_argument("--compare", help="baseline JSON to check against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative growth")
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    params = [args.days, args.products, args.cities, args.seed, args.repeat, args.warmup, args.only, args.engine]
+    if args.worker:
+        # Anything the pages print must not end up in the JSON on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_worker(int(args.rows[0]), *params)
+        json.dump(result, sys.stdout)
+        return
+
+    report = {"meta": {"python": platform.python_version(), "machine": platform.machine(),
+                       "days": args.days, "seed": args.seed, "repeat": args.repeat}, "runs": []}
+    for rows in args.rows:
+        cmd = [sys.executable, "-m", "utils.bench", "--worker", "--rows", str(int(rows)),
+               "--days", str(args.days), "--seed", str(args.seed),
+               "--repeat", str(args.repeat), "--warmup", str(args.warmup), "--engine", args.engine]
+        if args.products:
+            cmd += ["--products", str(args.products)]
+        if args.cities:
+            cmd += ["--cities", str(args.cities)]
+        if args.only:
+            cmd += ["--only", *args.only]
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        report["runs"].append(json.loads(out.stdout))
+    report["results"] = [r for run in report["runs"] for r in run["results"]]
+    _print(report)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            issues = compare(json.load(f), report, args.tolerance)
+        print("\nNo regressions against baseline." if not issues else "\nRegressions:")
+        for line in issues:
+            print("  " + line)
+        if issues:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
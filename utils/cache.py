@@ -0,0 +1,212 @@
+import functools
+import hashlib
+import os
+import pickle
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+import pandas as pd
+
+# CALLBACK_CACHE=0 disables memoization entirely
+ENABLED = os.environ.get("CALLBACK_CACHE", "1") != "0"
+# Per-process memory budget, or the shared directory budget when CALLBACK_CACHE_DIR is set
+MAX_BYTES = int(float(os.environ.get("CALLBACK_CACHE_MB", "256")) * 1024 * 1024)
+# A local directory shared by all workers on the box (e.g. /dev/shm/dash-cache)
+CACHE_DIR = os.environ.get("CALLBACK_CACHE_DIR", "")
+
+_MISS = object()
+
+class MemoryBackend:
+    """Process-local LRU bounded by the pickled size of its entries."""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return _MISS
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, blob):
+        """Store ``value``; returns how many entries were evicted to make room."""
+        size = len(blob)
+        evicted = 0
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and len(self._items) > 1:
+                _, (_, s) = self._items.popitem(last=False)
+                self.nbytes -= s
+                evicted += 1
+        return evicted
+
+    def drop(self, name):
+        """Forget every entry of callback ``name`` (its data version moved on)."""
+        with self._lock:
+            for k in [k for k in self._items if k[0] == name]:
+                self.nbytes -= self._items.pop(k)[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+class FileBackend:
+    """Pickle files in a directory shared by workers; LRU by file mtime."""
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode()).hexdigest() + ".pkl")
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISS
+        if stored_key != key:
+            return _MISS
+        try:
+            os.utime(path)  # mark recently used
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, blob):
+        path = self._file(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError:
+            return 0
+        return self._evict()
+
+    def _evict(self):
+        entries = []
+        for e in os.scandir(self.path):
+            if e.name.endswith(".pkl"):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        for e in os.scandir(self.path):
+            if e.name.endswith(".pkl"):
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return sum(1 for e in os.scandir(self.path) if e.name.endswith(".pkl"))
+
+backend = FileBackend(CACHE_DIR) if CACHE_DIR else MemoryBackend()
+_stats = defaultdict(Counter)
+_seen_versions = {}
+
+def _norm(value):
+    # Multi-selects: order and duplicates do not matter, [] means "all" like None
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted({_norm(v) for v in value}, key=repr)) or None
+    if isinstance(value, str) and value.endswith("T00:00:00"):
+        return value[:-len("T00:00:00")]
+    return value
+
+def range_key(bounds):
+    """Key function for ``(start, end, *rest)`` callbacks.
+
+    Dates are resolved to days and clamped to the data's ``bounds()``, so a
+    picker range reaching past the first/last order shares the entry of the
+    full range (unless clamping would turn it into an inverted range).
+    """
+    def key(start, end, *rest):
+        first, last = bounds()
+        s = pd.Timestamp(start).normalize() if start else None
+        e = pd.Timestamp(end).normalize() if end else None
+        if first is not None:
+            cs = first if s is None or s < first else s
+            ce = last if e is None or e > last else e
+            if cs <= ce:
+                s, e = cs, ce
+        return (s and s.date().isoformat(), e and e.date().isoformat()) + tuple(rest)
+    return key
+
+def memoize(version=lambda: None, key=None, name=None):
+    """Cache a page callback's outputs by normalised inputs and data version.
+
+    Put it *under* ``@callback`` so Dash registers the cached function. When
+    ``version()`` changes (new data ingested) the key changes, so stale
+    entries are never served; the memory backend also drops them at once.
+    """
+    def decorate(fn):
+        cb_name = name or f"{fn.__module__}.{fn.__name__}"
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            ver = version()
+            if _seen_versions.setdefault(cb_name, ver) != ver:
+                _seen_versions[cb_name] = ver
+                # Shared file entries age out via LRU; other workers may still be on ``ver``
+                if isinstance(backend, MemoryBackend):
+                    backend.drop(cb_name)
+            k = (cb_name, ver, tuple(_norm(a) for a in (key(*args) if key else args)))
+            stats = _stats[cb_name]
+            value = backend.get(k)
+            if value is not _MISS:
+                stats["hits"] += 1
+                return value
+            stats["misses"] += 1
+            value = fn(*args)
+            try:
+                # Pickled once: the size bound for memory, the payload for files
+                blob = pickle.dumps((k, value), protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                # Unpicklable outputs are simply not cached
+                return value
+            stats["evictions"] += backend.set(k, value, blob)
+            return value
+        return wrapper
+    return decorate
+
+def cache_stats():
+    """Hit/miss/eviction counters per callback plus backend size."""
+    out = {name: dict(c) for name, c in _stats.items()}
+    out["_backend"] = {
+        "type": type(backend).__name__,
+        "entries": len(backend),
+        "nbytes": getattr(backend, "nbytes", None),
+        "max_bytes": backend.max_bytes,
+    }
+    return out
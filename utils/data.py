@@ -1,13 +1,86 @@
-
+import glob
+import hashlib
+import io
+import itertools
+import json
 import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+import numpy as np
 import pandas as pd
 
+from utils import metrics, parallel
+from utils.kpi import KpiIndex
+from utils.ranking import ProductRanking, RangeTotals, select_k
+
+try:
+    import pyarrow.feather as _feather
+except ImportError:  # pyarrow opsiyonel: yoksa her açılışta CSV parse edilir
+    _feather = None
+
+# Pages receive shallow views of one shared frame; Copy-on-Write makes any
+# column assignment on a view copy that column instead of mutating the store.
+pd.options.mode.copy_on_write = True
+
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 SALES_PATH = os.path.join(DATA_DIR, "sales_data.csv")
 STOCK_PATH = os.path.join(DATA_DIR, "stock_snapshot.csv")
+PRODUCTS_PATH = os.path.join(DATA_DIR, "products.csv")
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
 
-def load_data():
-    df = pd.read_csv(SALES_PATH, parse_dates=["order_date"])
+# Seconds between checks for appended rows / new daily partitions (0 = never)
+REFRESH_SECONDS = float(os.environ.get("SALES_REFRESH_SECONDS", "0"))
+
+# Out-of-core storage (utils.partition): month x marketplace files under PARTITIONS_DIR.
+# SALES_STORAGE=partitions serves from them and keeps only the last HOT_DAYS of rows in memory.
+STORAGE = os.environ.get("SALES_STORAGE", "csv")
+PARTITIONS_DIR = os.environ.get("SALES_PARTITIONS_DIR", os.path.join(DATA_DIR, "partitions"))
+MANIFEST = "_manifest.json"
+HOT_DAYS = int(os.environ.get("SALES_HOT_DAYS", "120"))
+# Rows parsed / aggregated at a time when streaming (bounds peak memory)
+CHUNK_ROWS = int(os.environ.get("SALES_CHUNK_ROWS", "250000"))
+
+# Time buckets of resample_time: freq -> (bucket range rule, period used for labels)
+TIME_BUCKETS = {"D": ("D", None), "W": ("W-SUN", "W-SUN"), "M": ("ME", "M"), "ME": ("ME", "M"),
+                "Q": ("QE", "Q-DEC"), "QE": ("QE", "Q-DEC")}
+RESAMPLE_COLS = ["revenue", "sales_qty", "net_profit"]
+
+# Bump when the dtype plan or derived columns change so old caches are rebuilt
+CACHE_VERSION = 3
+
+# Dtype plan: string dimensions as categoricals, counts/rates downcast.
+# Money columns stay float64 so KPI sums keep their precision.
+CATEGORY_COLS = ["marketplace", "category", "brand", "product_id", "product_name",
+                 "city", "region", "return_reason"]
+INT_COLS = ["sales_qty", "return_qty", "delivery_days"]
+FLOAT32_COLS = ["commission_rate", "lat", "lon", "return_rate"]
+
+# Dimensions the page filters select on
+FILTER_COLS = ["marketplace", "category", "region"]
+
+# Daily cubes: additive measures summed per (day x dims). Dashboards only
+# need these sums, so callbacks scan cube cells instead of order lines.
+CUBE_MEASURES = ["revenue", "sales_qty", "return_qty", "cogs", "commission",
+                 "shipping_cost", "net_profit", "return_loss"]
+# Product attributes owned by the product dimension; order lines only keep
+# product_id (categorical) and the integer product_key into ProductDim.
+PRODUCT_ATTRS = ["product_name", "category", "brand"]
+# City attributes of GeoDim; coordinates live there only, rows get city_key
+GEO_ATTRS = ["region", "lat", "lon"]
+# Measures of the per-city range totals (delivery days as sum/count, so regions average correctly)
+GEO_MEASURES = ["revenue", "sales_qty", "return_qty", "delivery_days_sum", "delivery_days_count"]
+
+CUBE_DIMS = {
+    "sales": ["marketplace", "category", "brand"],
+    # Per-city cells; regions roll up from cities through GeoDim
+    "geo": ["marketplace", "city_key"],
+    # Per-product cells behind utils.ranking (category is a product attribute)
+    "products": ["marketplace", "product_key"],
+}
+
+def _enrich(df):
     # Financials
     df["revenue"] = df["sales_qty"] * df["unit_price"]
     df["cogs"] = df["sales_qty"] * df["unit_cost"]
@@ -15,16 +88,989 @@ def load_data():
     df["shipping_cost"] = df["sales_qty"] * df["cargo_cost"]
     df["net_profit"] = df["revenue"] - (df["cogs"] + df["commission"] + df["shipping_cost"])
     df["return_rate"] = (df["return_qty"] / df["sales_qty"]).fillna(0.0)
+    df["return_loss"] = df["return_qty"] * df["unit_price"]
     return df
 
+def _apply_dtype_plan(df):
+    for c in INT_COLS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], downcast="integer")
+    for c in FLOAT32_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype("float32")
+    return df
+
+def _prepare(df):
+    df = df.sort_values("order_date", kind="stable", ignore_index=True)
+    return _apply_dtype_plan(_enrich(df))
+
+def _parse(source, **kwargs):
+    dtype = {c: "category" for c in CATEGORY_COLS}
+    return _prepare(pd.read_csv(source, parse_dates=["order_date"], dtype=dtype, **kwargs))
+
+def iter_csv(path, chunk_rows=CHUNK_ROWS):
+    """Parsed and enriched frames of at most ``chunk_rows`` rows of ``path``, in file order."""
+    dtype = {c: "category" for c in CATEGORY_COLS}
+    with pd.read_csv(path, parse_dates=["order_date"], dtype=dtype, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _prepare(chunk)
+
+class _FileHead:
+    """File-like over the first ``size`` bytes of ``f``; rows appended while
+    parsing are left for the next refresh instead of being read twice."""
+
+    def __init__(self, f, size):
+        self._f = f
+        self._left = size
+
+    def read(self, n=-1):
+        if n is None or n < 0 or n > self._left:
+            n = self._left
+        data = self._f.read(n)
+        self._left -= len(data)
+        return data
+
+def _complete_size(f, size):
+    # Only whole lines count: a half-written trailing row waits for the writer
+    f.seek(max(0, size - (1 << 16)))
+    tail = f.read(size - f.tell())
+    cut = tail.rfind(b"\n")
+    return size if cut < 0 else size - len(tail) + cut + 1
+
+def _read_csv(path):
+    """Parse ``path`` as it is now: (frame, bytes consumed)."""
+    with open(path, "rb") as f:
+        size = _complete_size(f, os.fstat(f.fileno()).st_size)
+        f.seek(0)
+        return _parse(_FileHead(f, size)), size
+
+def _read_tail(path, offset, columns):
+    """Whole rows appended to ``path`` after ``offset``: (frame or None, new offset)."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b"\n") + 1
+    if end == 0:
+        return None, offset
+    df = _parse(io.BytesIO(chunk[:end]), header=None, names=columns)
+    return df, offset + end
+
+def _cache_paths(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (os.path.join(CACHE_DIR, name + ".feather"),
+            os.path.join(CACHE_DIR, name + ".json"))
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def _file_hash(path, size=None, chunk_size=1 << 20):
+    """sha1 of the first ``size`` bytes of ``path`` (whole file by default)."""
+    h = hashlib.sha1()
+    left = os.path.getsize(path) if size is None else size
+    with open(path, "rb") as f:
+        while left > 0:
+            chunk = f.read(min(chunk_size, left))
+            if not chunk:
+                break
+            h.update(chunk)
+            left -= len(chunk)
+    return h.hexdigest()
+
+def _write_json(path, obj):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+def _read_cache(path):
+    """Cached frame for ``path`` and the source bytes it covers, or (None, 0).
+
+    A cache built before rows were appended stays valid for its prefix; the
+    caller ingests only the remaining tail.
+    """
+    if _feather is None:
+        return None, 0
+    data_path, meta_path = _cache_paths(path)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None, 0
+    if meta.get("version") != CACHE_VERSION or not os.path.exists(data_path):
+        return None, 0
+    fp = _fingerprint(path)
+    covered = meta.get("size", -1)
+    if fp["size"] < covered:
+        return None, 0
+    if fp["size"] != covered or fp["mtime_ns"] != meta.get("mtime_ns"):
+        # Appended, copied or touched: the hash of the cached prefix decides
+        if _file_hash(path, covered) != meta.get("sha1"):
+            return None, 0
+        if fp["size"] == covered:
+            meta.update(fp)
+            _write_json(meta_path, meta)
+    # Uncompressed feather + memory_map: numeric columns are served from the
+    # page cache, shared by every worker reading the same file.
+    table = _feather.read_table(data_path, memory_map=True)
+    return table.to_pandas(split_blocks=True), covered
+
+def _write_cache(path, df, size):
+    if _feather is None:
+        return
+    data_path, meta_path = _cache_paths(path)
+    meta = {"size": size, "mtime_ns": os.stat(path).st_mtime_ns,
+            "version": CACHE_VERSION, "sha1": _file_hash(path, size)}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{data_path}.{os.getpid()}.tmp"
+        _feather.write_feather(df.reset_index(drop=True), tmp, compression="uncompressed")
+        os.replace(tmp, data_path)
+        _write_json(meta_path, meta)
+    except OSError:
+        # Read-only deployments simply keep parsing the CSV
+        pass
+
+def _to_datetime64(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize(None).to_datetime64() if ts.tzinfo else ts.to_datetime64()
+
+class DateIndex:
+    """Date-sorted frame answering ``start <= date <= end`` + dimension filters.
+
+    The date range is two binary searches and a positional slice (a view, no
+    copy); dimension filters test precomputed categorical codes against a
+    boolean lookup table, so only the rows that survive are ever copied.
+    """
+
+    def __init__(self, frame, date_col="order_date", dims=FILTER_COLS):
+        if not frame[date_col].is_monotonic_increasing:
+            frame = frame.sort_values(date_col, kind="stable", ignore_index=True)
+        self.frame = frame
+        self.date_col = date_col
+        self._dates = frame[date_col].to_numpy()
+        self._codes = {
+            c: (frame[c].cat.categories, frame[c].cat.codes.to_numpy())
+            for c in dims
+            if c in frame.columns and isinstance(frame[c].dtype, pd.CategoricalDtype)
+        }
+
+    def bounds(self, start=None, end=None):
+        """Positional ``[i0, i1)`` of rows within the inclusive date range."""
+        i0, i1 = 0, len(self._dates)
+        if start is not None and not pd.isna(start):
+            i0 = int(self._dates.searchsorted(_to_datetime64(start), "left"))
+        if end is not None and not pd.isna(end):
+            i1 = int(self._dates.searchsorted(_to_datetime64(end), "right"))
+        return i0, max(i0, i1)
+
+    def _member(self, col, values, i0, i1):
+        if col not in self._codes:
+            return self.frame[col].iloc[i0:i1].isin(values).to_numpy()
+        cats, codes = self._codes[col]
+        # One slot past the categories so code -1 (missing) looks up False
+        lut = np.zeros(len(cats) + 1, dtype=bool)
+        idx = cats.get_indexer(list(values))
+        lut[idx[idx >= 0]] = True
+        return lut[codes[i0:i1]]
+
+    def _take(self, i0, i1, filters):
+        out = self.frame.iloc[i0:i1]
+        mask = None
+        for col, values in filters.items():
+            if not values:
+                continue
+            m = self._member(col, values, i0, i1)
+            mask = m if mask is None else mask & m
+        return out if mask is None else out.iloc[np.flatnonzero(mask)]
+
+    def select(self, start=None, end=None, **filters):
+        """Rows in ``[start, end]`` whose ``col`` is in ``filters[col]`` (empty = all)."""
+        i0, i1 = self.bounds(start, end)
+        return self._take(i0, i1, filters)
+
+    def chunks(self, start=None, end=None, chunk_rows=CHUNK_ROWS, **filters):
+        """``select()`` as consecutive frames, each cut from at most ``chunk_rows`` rows."""
+        i0, i1 = self.bounds(start, end)
+        for a in range(i0, i1, chunk_rows):
+            out = self._take(a, min(a + chunk_rows, i1), filters)
+            if len(out):
+                yield out
+
+def _concat(frames):
+    """Concatenate frames keeping categoricals categorical (union of categories)."""
+    frames = [f for f in frames if len(f)]
+    if len(frames) < 2:
+        return frames[0] if frames else None
+    base, rest = frames[0], frames[1:]
+    for c in base.columns:
+        if not isinstance(base[c].dtype, pd.CategoricalDtype):
+            continue
+        old = base[c].cat.categories
+        cats = old
+        for f in rest:
+            cats = cats.append(pd.Index(f[c].dropna().unique()).difference(cats))
+        # New categories go at the end, so the (large) base keeps its codes
+        base = base.assign(**{c: base[c].cat.add_categories(cats[len(old):])})
+        rest = [f.assign(**{c: pd.Categorical(f[c], categories=cats)}) for f in rest]
+    return pd.concat([base] + rest, ignore_index=True)
+
+def _build_cube(frame, dims):
+    keys = [frame["order_date"].dt.normalize()] + dims
+    aggs = {m: (m, "sum") for m in CUBE_MEASURES if m in frame.columns}
+    if "delivery_days" in frame.columns:
+        aggs["delivery_days_sum"] = ("delivery_days", "sum")
+        aggs["delivery_days_count"] = ("delivery_days", "count")
+    # dropna=False: rows with a missing dimension still count towards totals
+    return (frame.groupby(keys, observed=True, dropna=False)
+            .agg(**aggs)
+            .reset_index())
+
+def _build_reason_cube(frame):
+    # Returned order lines per reason (the returns pie counts lines, not units)
+    returned = frame[frame["return_qty"] > 0]
+    keys = [returned["order_date"].dt.normalize(), "marketplace", "category", "return_reason"]
+    return (returned.groupby(keys, observed=True)
+            .size()
+            .rename("return_lines")
+            .reset_index())
+
+def build_cubes(frame):
+    """Daily aggregate cubes for ``frame``, keyed by name, each a DateIndex."""
+    builders = {name: (lambda dims=dims: DateIndex(_build_cube(frame, dims)))
+                for name, dims in CUBE_DIMS.items() if all(c in frame.columns for c in dims)}
+    if {"return_reason", "marketplace", "category"} <= set(frame.columns):
+        builders["reasons"] = lambda: DateIndex(_build_reason_cube(frame))
+    # Independent groupbys over the same rows: one per core
+    return dict(zip(builders, parallel.gather(*builders.values())))
+
+def _cell_keys(cube):
+    # Cells are keyed by the day, the dimensions and integer *_key columns
+    return ["order_date"] + [c for c in cube.columns if c != "order_date"
+                             and (c.endswith("_key") or not pd.api.types.is_numeric_dtype(cube[c]))]
+
+def _fold(frames, keys=None):
+    """Partial sums in ``frames`` combined into one row per ``keys`` (default: cube cells)."""
+    frame = _concat(frames)
+    if frame is None:
+        return None
+    keys = list(keys) if keys is not None else _cell_keys(frame)
+    return frame.groupby(keys, observed=True, dropna=False).sum().reset_index()
+
+def _merge_cube(index, delta):
+    """Fold delta cube cells into ``index``; only days >= the delta's first day are regrouped."""
+    cube = index.frame
+    if delta is None or delta.empty:
+        return index
+    i0, _ = index.bounds(start=delta["order_date"].iloc[0])
+    tail = _fold([cube.iloc[i0:], delta], _cell_keys(cube))
+    return DateIndex(_concat([cube.iloc[:i0], tail]))
+
+def _partition_paths(path):
+    # Daily drops next to the main export, e.g. sales_data_2025-02-04.csv
+    stem, ext = os.path.splitext(path)
+    return sorted(glob.glob(f"{stem}_*{ext}"))
+
+def _may_match(part, start, end, filters):
+    # Per-file min/max statistics: False only when no row can match
+    lo, hi = part["min"], part["max"]
+    if start is not None and not pd.isna(start) and hi.get("order_date") is not None \
+            and pd.Timestamp(hi["order_date"]) < pd.Timestamp(start):
+        return False
+    if end is not None and not pd.isna(end) and lo.get("order_date") is not None \
+            and pd.Timestamp(lo["order_date"]) > pd.Timestamp(end):
+        return False
+    for col, values in filters.items():
+        if not values or col not in lo:
+            continue
+        if lo[col] is None:
+            return False
+        if isinstance(lo[col], str) and not any(lo[col] <= str(v) <= hi[col] for v in values):
+            return False
+    return True
+
+class PartitionedSales:
+    """Sales history stored as month x marketplace files (written by ``utils.partition``).
+
+    ``_manifest.json`` lists every file with its row count and per-column
+    min/max. Queries open only the files whose statistics can match the date
+    range and filters, one at a time; files hold at most ``CHUNK_ROWS`` rows,
+    so memory is bounded by one chunk however long the history grows.
+    """
+
+    def __init__(self, root=PARTITIONS_DIR):
+        self.root = root
+        with open(os.path.join(root, MANIFEST), "rb") as f:
+            raw = f.read()
+        self.token = hashlib.sha1(raw).hexdigest()[:16]
+        self.parts = sorted(json.loads(raw)["parts"], key=lambda p: (p["month"], p["path"]))
+
+    def __len__(self):
+        return sum(p["rows"] for p in self.parts)
+
+    def changed(self):
+        """True once the manifest was rewritten (files added or rebuilt)."""
+        try:
+            with open(os.path.join(self.root, MANIFEST), "rb") as f:
+                return hashlib.sha1(f.read()).hexdigest()[:16] != self.token
+        except OSError:
+            return False
+
+    def date_bounds(self):
+        lo = [p["min"]["order_date"] for p in self.parts if p["min"].get("order_date")]
+        hi = [p["max"]["order_date"] for p in self.parts if p["max"].get("order_date")]
+        if not lo:
+            return None, None
+        return pd.Timestamp(min(lo)), pd.Timestamp(max(hi))
+
+    def prune(self, start=None, end=None, **filters):
+        """Manifest entries of the files that may hold matching rows, in month order."""
+        return [p for p in self.parts if _may_match(p, start, end, filters)]
+
+    def read(self, part, columns=None):
+        """All rows of one partition file (optionally only ``columns``)."""
+        path = os.path.join(self.root, part["path"])
+        if path.endswith(".feather"):
+            return _feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+        frame = _parse(path)
+        return frame if columns is None else frame[columns]
+
+    def scan(self, start=None, end=None, columns=None, **filters):
+        """Matching rows, one filtered frame per partition file."""
+        if columns is not None:
+            columns = list(dict.fromkeys(["order_date"] + list(columns)
+                                         + [c for c, v in filters.items() if v]))
+        for part in self.prune(start, end, **filters):
+            out = DateIndex(self.read(part, columns)).select(start, end, **filters)
+            if len(out):
+                yield out
+
+    def select(self, start=None, end=None, columns=None, **filters):
+        """Matching rows as one frame; only use for selections that fit in memory."""
+        return _concat([f.reset_index(drop=True) for f in self.scan(start, end, columns, **filters)])
+
+    def aggregate(self, keys, measures, start=None, end=None, **filters):
+        """Sums of ``measures`` per ``keys`` over matching rows, folded chunk by chunk."""
+        keys, measures = list(keys), list(measures)
+        partial, size = [], 0
+        for chunk in self.scan(start, end, keys + measures, **filters):
+            part = chunk.groupby(keys, observed=True, dropna=False)[measures].sum().reset_index()
+            partial.append(part)
+            size += len(part)
+            if size > CHUNK_ROWS:
+                # Keep the running result itself bounded
+                partial = [_fold(partial, keys)]
+                size = len(partial[0])
+        out = _fold(partial, keys)
+        return out if out is not None else pd.DataFrame(columns=keys + measures)
+
+class Dimension:
+    """Dimension table: row ``k`` describes the member with ``key_col == k``.
+
+    Members seen only in the orders are appended with the attributes of
+    their order lines, so existing keys never change when new ones arrive.
+    """
+    id_col = key_col = None
+    attrs = []
+    # Attributes only the dimension keeps (dropped from the order lines)
+    owned = []
+    label_cols = ()
+
+    def __init__(self, frame=None):
+        if frame is None:
+            frame = pd.DataFrame(columns=[self.id_col] + self.attrs)
+        self.frame = frame.reset_index(drop=True)
+        self._ids = pd.Index(self.frame[self.id_col])
+
+    def __len__(self):
+        return len(self.frame)
+
+    def extend(self, orders):
+        """This dimension plus members of ``orders`` it does not know yet."""
+        if self.id_col not in orders.columns:
+            return self
+        ids = orders[self.id_col]
+        seen = ids.cat.categories if isinstance(ids.dtype, pd.CategoricalDtype) else pd.Index(ids.dropna().unique())
+        new = seen[self._ids.get_indexer(seen) < 0]
+        if not len(new):
+            return self
+        cols = [self.id_col] + [c for c in self.attrs if c in orders.columns]
+        rows = orders.loc[ids.isin(new), cols].drop_duplicates(self.id_col)
+        rows = rows.astype({c: object for c in cols if isinstance(rows[c].dtype, pd.CategoricalDtype)})
+        return type(self)(pd.concat([f for f in (self.frame, rows) if len(f)], ignore_index=True))
+
+    def keys(self, ids):
+        """Keys of ``ids`` (-1 = unknown), int16 while the dimension fits."""
+        dtype = np.int16 if len(self) < 2**15 else np.int32
+        if isinstance(getattr(ids, "dtype", None), pd.CategoricalDtype):
+            # Look up each category once, then map the codes
+            lut = np.append(self._ids.get_indexer(ids.cat.categories), -1).astype(dtype)
+            return lut[ids.cat.codes.to_numpy()]
+        return self._ids.get_indexer(ids).astype(dtype)
+
+    def label(self, frame, cols=None):
+        """``frame`` indexed by key with the dimension's ``cols`` joined in front."""
+        keys = frame.index.to_numpy()
+        attrs = self.frame[list(cols or self.label_cols)].iloc[keys].reset_index(drop=True)
+        return pd.concat([attrs, frame.reset_index()], axis=1)
+
+    def attach(self, frame):
+        """``frame`` with the key column added and the owned attributes dropped."""
+        if self.id_col not in frame.columns:
+            return frame
+        frame = frame.assign(**{self.key_col: self.keys(frame[self.id_col])})
+        return frame.drop(columns=[c for c in self.owned if c in frame.columns])
+
+class ProductDim(Dimension):
+    """Product dimension, loaded once from ``products.csv``."""
+    id_col, key_col = "product_id", "product_key"
+    attrs = PRODUCT_ATTRS
+    owned = ["product_name"]
+    label_cols = ("product_name", "brand")
+
+    @classmethod
+    def from_csv(cls, path=PRODUCTS_PATH):
+        try:
+            frame = pd.read_csv(path, dtype={"product_id": str}, encoding="utf-8-sig")
+        except OSError:
+            frame = pd.DataFrame(columns=["product_id"] + PRODUCT_ATTRS)
+        return cls(frame.drop_duplicates("product_id"))
+
+class GeoDim(Dimension):
+    """City dimension (city -> region, coordinates), built from the orders."""
+    id_col, key_col = "city", "city_key"
+    attrs = GEO_ATTRS
+    owned = ["lat", "lon"]
+    label_cols = ("city", "lat", "lon")
+
+def _attach_keys(frame, products, cities):
+    # Attributes come from the dimensions; rows only keep the keys
+    return cities.attach(products.attach(frame))
+
+def _stream_history(history, hot_days=HOT_DAYS):
+    """(orders, cubes, products, cities) of a ``PartitionedSales``, reading one file at a time.
+
+    Cubes are folded month by month (partitions never share a month), and
+    only rows of the last ``hot_days`` days are kept as orders.
+    """
+    _, last = history.date_bounds()
+    hot_start = None if last is None else last.normalize() - pd.Timedelta(days=hot_days - 1)
+    products, cities = ProductDim.from_csv(), GeoDim()
+    hot, months, schema = [], {}, None
+    for _, parts in itertools.groupby(history.prune(), key=lambda p: p["month"]):
+        pending = {}
+        for part in parts:
+            chunk = history.read(part)
+            products, cities = products.extend(chunk), cities.extend(chunk)
+            chunk = _attach_keys(chunk, products, cities)
+            for name, idx in build_cubes(chunk).items():
+                pending.setdefault(name, []).append(idx.frame)
+            recent = chunk[chunk["order_date"] >= hot_start]
+            if len(recent):
+                hot.append(recent)
+            schema = chunk.iloc[:0]
+        for name, frames in pending.items():
+            months.setdefault(name, []).append(_fold(frames))
+    orders = _concat(hot)
+    orders = DateIndex(orders if orders is not None else schema if schema is not None
+                       else pd.DataFrame({"order_date": pd.DatetimeIndex([])}))
+    cubes = {name: DateIndex(_concat(frames)) for name, frames in months.items()}
+    return orders, cubes, products, cities
+
+_Snapshot = namedtuple("_Snapshot", "orders cubes version token products cities")
+
+class SalesStore:
+    """Sales data loaded and enriched once per process, shared read-only by all pages.
+
+    Built at import time of the app, so with ``gunicorn --preload`` the master
+    loads it once and forked workers share its pages copy-on-write.
+
+    ``refresh()`` ingests rows appended to the source CSV and new daily
+    partition files, parsing and aggregating only the delta. Readers always
+    see one consistent snapshot (orders + cubes + version) that is swapped
+    in a single assignment.
+    """
+
+    def __init__(self, frame=None, load_seconds=0.0, source=None, cached=False, history=None):
+        if history is None:
+            products = ProductDim.from_csv().extend(frame)
+            cities = GeoDim().extend(frame)
+            orders = DateIndex(_attach_keys(frame, products, cities))
+            cubes = build_cubes(orders.frame)
+        else:
+            orders, cubes, products, cities = _stream_history(history)
+        self._snap = _Snapshot(orders, cubes, 0, None, products, cities)
+        # PartitionedSales behind an out-of-core store (orders then hold recent days only)
+        self.history = history
+        self.load_seconds = load_seconds
+        self.source = source
+        self.cached = cached
+        self.refresh_interval = 0
+        self._offset = 0
+        self._columns = None
+        self._partitions = set()
+        self._checked_at = time.monotonic()
+        self._refresh_lock = threading.Lock()
+        self._derived = {}
+
+    @classmethod
+    def from_csv(cls, path=SALES_PATH, use_cache=True, refresh_interval=REFRESH_SECONDS):
+        """Load ``path``, preferring the columnar cache next to it when still fresh."""
+        t0 = time.perf_counter()
+        df, size = _read_cache(path) if use_cache else (None, 0)
+        cached = df is not None
+        if not cached:
+            df, size = _read_csv(path)
+            if use_cache:
+                _write_cache(path, df, size)
+        store = cls(df, time.perf_counter() - t0, path, cached)
+        store.refresh_interval = refresh_interval
+        store._offset = size
+        store._columns = list(pd.read_csv(path, nrows=0).columns)
+        store._snap = store._snap._replace(token=store._token())
+        # Rows appended after the cache was built and existing partitions
+        store.refresh()
+        store.load_seconds = time.perf_counter() - t0
+        return store
+
+    @classmethod
+    def from_partitions(cls, root=PARTITIONS_DIR, refresh_interval=REFRESH_SECONDS):
+        """Serve the partitioned history under ``root`` (see ``utils.partition``).
+
+        Cubes and dimensions are built by streaming the files once; only the
+        last ``HOT_DAYS`` days of order lines stay in memory, older rows are
+        read from the partitions a ``select()`` needs.
+        """
+        t0 = time.perf_counter()
+        store = cls(source=root, history=PartitionedSales(root))
+        store.refresh_interval = refresh_interval
+        store._snap = store._snap._replace(token=store._token())
+        store.load_seconds = time.perf_counter() - t0
+        return store
+
+    @property
+    def orders(self):
+        return self._current().orders
+
+    @property
+    def cubes(self):
+        return self._current().cubes
+
+    @property
+    def products(self):
+        """``ProductDim`` matching the ``product_key`` column of the orders."""
+        return self._current().products
+
+    @property
+    def cities(self):
+        """``GeoDim`` matching the ``city_key`` column of the orders."""
+        return self._current().cities
+
+    @property
+    def version(self):
+        return self._snap.version
+
+    @property
+    def data_key(self):
+        """Content-derived data version: equal in every worker that ingested the same bytes."""
+        return self._snap.token
+
+    def _token(self):
+        if self.history is not None:
+            parts = repr((self.source, self.history.token))
+        else:
+            parts = repr((self.source, self._offset, sorted(self._partitions)))
+        return hashlib.sha1(parts.encode()).hexdigest()[:16]
+
+    @property
+    def _df(self):
+        return self._snap.orders.frame
+
+    @property
+    def df(self):
+        # Shallow copy: shares the column buffers, never the mutations
+        return self._df.copy(deep=False)
+
+    def _current(self):
+        if self.refresh_interval and time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh(blocking=False)
+        return self._snap
+
+    def _pending(self):
+        """New row frames from the source tail and unseen partition files."""
+        frames = []
+        if self.source and self._columns:
+            size = os.path.getsize(self.source)
+            if size > self._offset:
+                tail, self._offset = _read_tail(self.source, self._offset, self._columns)
+                if tail is not None:
+                    frames.append(tail)
+            for part in _partition_paths(self.source):
+                if part not in self._partitions:
+                    frames.append(_read_csv(part)[0])
+                    self._partitions.add(part)
+        return frames
+
+    def refresh(self, blocking=True):
+        """Ingest new rows; returns how many were added (0 if another refresh is running)."""
+        if not self._refresh_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            self._checked_at = time.monotonic()
+            if self.history is not None:
+                # Partitions are appended by utils.partition: rebuild on a new manifest
+                return self._reload() if self.history.changed() else 0
+            if self.source and os.path.getsize(self.source) < self._offset:
+                return self._reload()
+            delta = _concat(self._pending())
+            if delta is None:
+                return 0
+            snap = self._snap
+            products = snap.products.extend(delta)
+            cities = snap.cities.extend(delta)
+            delta = _attach_keys(delta, products, cities)
+            frame = _concat([snap.orders.frame, delta])
+            delta = frame.iloc[len(snap.orders.frame):]
+            if delta["order_date"].iloc[0] < snap.orders.frame["order_date"].iloc[-1] \
+                    or not delta["order_date"].is_monotonic_increasing:
+                # Late rows: both runs are sorted, so the stable sort is a merge
+                frame = frame.sort_values("order_date", kind="stable", ignore_index=True)
+            new_cubes = build_cubes(delta)
+            cubes = {name: _merge_cube(idx, new_cubes[name].frame if name in new_cubes else None)
+                     for name, idx in snap.cubes.items()}
+            self._snap = _Snapshot(DateIndex(frame), cubes, snap.version + 1, self._token(),
+                                   products, cities)
+            return len(delta)
+        finally:
+            self._refresh_lock.release()
+
+    def _reload(self):
+        # The source was rewritten rather than appended to: start over
+        if self.history is not None:
+            fresh = SalesStore.from_partitions(self.source, refresh_interval=0)
+            self._snap = fresh._snap._replace(version=self._snap.version + 1)
+            self.history = fresh.history
+            return len(fresh.history)
+        fresh = SalesStore.from_csv(self.source, refresh_interval=0)
+        self._offset, self._partitions = fresh._offset, fresh._partitions
+        self._snap = fresh._snap._replace(version=self._snap.version + 1, token=fresh._token())
+        return len(fresh._df)
+
+    def select(self, start=None, end=None, **filters):
+        """Order lines matching the filters (row-level, e.g. product top-N)."""
+        with metrics.span("filter"):
+            orders = self.orders
+            out = orders.select(start, end, **filters)
+            hot = orders.frame["order_date"]
+            if self.history is not None and len(hot) and (start is None or pd.isna(start)
+                                                          or pd.Timestamp(start) < hot.iloc[0]):
+                # Older than the in-memory window: read the matching partitions
+                cold = self.history.select(start, end, **filters)
+                if cold is not None:
+                    cold = cold[cold["order_date"].to_numpy() < hot.iloc[0].to_datetime64()]
+                    cold = _attach_keys(cold, self.products, self.cities)
+                    out = _concat([cold, out.reset_index(drop=True)])
+        metrics.rows(len(out))
+        return out
+
+    def scan(self, start=None, end=None, chunk_rows=CHUNK_ROWS, **filters):
+        """Order lines matching the filters as frames of bounded size, month by month (exports)."""
+        orders = self.orders
+        hot = orders.frame["order_date"]
+        if self.history is not None and len(hot):
+            # Older than the in-memory window: straight from the partitions
+            for cold in self.history.scan(start, end, **filters):
+                cold = cold[cold["order_date"].to_numpy() < hot.iloc[0].to_datetime64()]
+                for a in range(0, len(cold), chunk_rows):
+                    yield _attach_keys(cold.iloc[a:a + chunk_rows], self.products, self.cities)
+        yield from orders.chunks(start, end, chunk_rows, **filters)
+
+    def cube(self, name, start=None, end=None, **filters):
+        """Daily cube cells matching the filters; same column names as orders."""
+        with metrics.span("filter"):
+            out = self.cubes[name].select(start, end, **filters)
+        metrics.rows(len(out))
+        return out
+
+    def _per_snapshot(self, name, build):
+        """``build(snap)`` for the current snapshot, computed once per snapshot."""
+        snap = self._current()
+        cached = self._derived.get(name)
+        if cached is None or cached[0] is not snap:
+            cached = self._derived[name] = (snap, build(snap))
+        return cached[1]
+
+    def daily(self, start=None, end=None, **filters):
+        """Daily totals of the cube measures; the unfiltered series is cached per snapshot."""
+        if any(filters.values()):
+            return daily_totals(self.cube("sales", start, end, **filters), CUBE_MEASURES)
+        series = self._per_snapshot("daily", lambda snap: DateIndex(
+            daily_totals(snap.cubes["sales"].frame, CUBE_MEASURES), dims=()))
+        return series.select(start, end)
+
+    def ranking(self):
+        """``ProductRanking`` of the current snapshot (built on first use)."""
+        return self._per_snapshot("ranking", lambda snap: ProductRanking(
+            snap.cubes["products"].frame, snap.products))
+
+    def city_totals(self):
+        """``RangeTotals`` per city of the current snapshot (region = GeoDim attribute)."""
+        return self._per_snapshot("geo", lambda snap: RangeTotals(
+            snap.cubes["geo"].frame, snap.cities, "city_key", "region", GEO_MEASURES))
+
+    def kpis(self):
+        """``KpiIndex`` of the current snapshot: O(1) date-range sums per filter cell."""
+        return self._per_snapshot("kpis", lambda snap: KpiIndex(
+            snap.cubes["sales"].frame, CUBE_MEASURES + ["delivery_days_sum", "delivery_days_count"]))
+
+    def date_bounds(self):
+        """First and last order date (the index is sorted, so O(1))."""
+        dates = self._snap.orders.frame["order_date"]
+        if self.history is not None:
+            first, last = self.history.date_bounds()
+            return first, (dates.iloc[-1] if len(dates) else last)
+        if dates.empty:
+            return None, None
+        return dates.iloc[0], dates.iloc[-1]
+
+    def values(self, col):
+        """Sorted distinct non-null values of a dimension, for filter dropdowns."""
+        snap = self._snap
+        if self.history is None:
+            s = snap.orders.frame[col]
+        else:
+            # Recent rows miss older values: cubes and dimensions cover the whole history
+            frames = [idx.frame for idx in snap.cubes.values()] + [snap.products.frame, snap.cities.frame]
+            s = next(f[col] for f in frames if col in f.columns)
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            return sorted(s.cat.categories)
+        return sorted(s.dropna().unique())
+
+    @property
+    def nbytes(self):
+        return int(self._df.memory_usage(deep=True).sum())
+
+    def stats(self):
+        snap = self._snap
+        return {
+            "rows": len(snap.orders.frame),
+            "version": snap.version,
+            "data_key": snap.token,
+            "load_seconds": round(self.load_seconds, 3),
+            "nbytes": self.nbytes,
+            "cube_rows": {k: len(v.frame) for k, v in snap.cubes.items()},
+            "source": self.source,
+            "cached": self.cached,
+            "partitions": len(self.history.parts) if self.history is not None else None,
+        }
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SalesStore.from_partitions() if STORAGE == "partitions" else SalesStore.from_csv()
+    return _store
+
+def set_store(store):
+    """Install ``store`` as the shared store (benchmarks, non-CSV sources); before pages import."""
+    global _store
+    with _store_lock:
+        _store = store
+    return store
+
+# Derived measures a ranking may ask for: name -> (numerator, denominator)
+RATIOS = {"margin": ("net_profit", "revenue")}
+
+class QueryEngine(ABC):
+    """Logical aggregation requests of the pages, answered from an engine's own storage.
+
+    - ``totals(start, end, measures, **filters)``: dict of sums, plus ``cells``
+      (records that matched; 0 = no data).
+    - ``group(by, measures, start, end, **filters)``: one row per ``by``
+      combination with data, ``by`` columns first, sorted by them (categories
+      in the engine's own order). ``by`` may be ``order_date`` (days), any
+      dimension, ``product_key`` or ``city_key``.
+    - ``top(by, measure, k, ...)``: the ``k`` best ``by`` members, indexed by ``by``.
+
+    Measures are the cube measures plus ``delivery_days_sum/count`` and
+    ``return_lines`` (order lines with a return). Filters are lists of
+    dimension values, empty or None meaning all.
+    """
+    name = None
+
+    @abstractmethod
+    def totals(self, start=None, end=None, measures=None, **filters):
+        """Sums of ``measures`` over the matching records, plus ``cells``."""
+
+    @abstractmethod
+    def group(self, by, measures, start=None, end=None, **filters):
+        """Sums of ``measures`` per ``by`` combination."""
+
+    def top(self, by, measure, k, start=None, end=None, measures=(), largest=True, having=None, **filters):
+        """Members of ``by`` ranked by ``measure`` (a measure or a ``RATIOS`` name).
+
+        ``having`` maps measures to the minimum a member needs to be ranked.
+        """
+        need = list(RATIOS.get(measure, (measure,))) + list(measures) + list(having or ())
+        out = self.group([by], list(dict.fromkeys(need)), start, end, **filters).set_index(by)
+        for m, low in (having or {}).items():
+            out = out[out[m].to_numpy() >= low]
+        if measure in RATIOS:
+            num, den = (out[c].to_numpy() for c in RATIOS[measure])
+            out = out.assign(**{measure: num / np.where(den == 0, 1, den)})
+        # Rows are sorted by ``by``, so ties fall back to the key order
+        return out.iloc[select_k(out[measure].to_numpy(), k, largest)]
+
+class PandasEngine(QueryEngine):
+    """In-memory engine: routes each request to the cheapest structure of the store.
+
+    KPI prefix sums for (marketplace, category) totals, per-product and
+    per-city running sums for product and geo breakdowns, daily cubes for
+    the rest, and order lines only when no cube has the columns.
+    """
+    name = "pandas"
+
+    def __init__(self, store):
+        self.store = store
+
+    def _kpis(self, by, measures, filters):
+        kpis = self.store.kpis()
+        active = [c for c, v in filters.items() if v]
+        if set(by) <= set(kpis.dims) and set(active) <= set(kpis.dims) and set(measures) <= set(kpis.measures):
+            return kpis
+        return None
+
+    def _frame(self, cols, start, end, filters):
+        # Smallest cube carrying every column, else the order lines
+        store = self.store
+        active = {c: v for c, v in filters.items() if v}
+        need = set(cols) | set(active)
+        for name in sorted(store.cubes, key=lambda n: len(store.cubes[n].frame)):
+            if need <= set(store.cubes[name].frame.columns):
+                return store.cube(name, start, end, **active)
+        rows = store.select(start, end, **active)
+        if "delivery_days_sum" in cols:
+            rows = rows.assign(delivery_days_sum=rows["delivery_days"], delivery_days_count=rows["delivery_days"].notna())
+        if "return_lines" in cols:
+            rows = rows.assign(return_lines=rows["return_qty"].to_numpy() > 0)
+        return rows
+
+    def totals(self, start=None, end=None, measures=None, **filters):
+        measures = list(measures or CUBE_MEASURES)
+        kpis = self._kpis([], measures, filters)
+        if kpis is not None:
+            t = kpis.totals(start, end, **filters)
+            return {**{m: t[m] for m in measures}, "cells": t["cells"]}
+        frame = self._frame(measures, start, end, filters)
+        return {**{m: frame[m].sum() for m in measures}, "cells": len(frame)}
+
+    def group(self, by, measures, start=None, end=None, **filters):
+        out = self._group(list(by), list(measures), start, end, filters)
+        # Dimension values as plain objects, as the SQL engine returns them (also when empty)
+        return out.astype({c: object for c in by if isinstance(out[c].dtype, pd.CategoricalDtype)})
+
+    def _group(self, by, measures, start, end, filters):
+        store = self.store
+        active = {c: v for c, v in filters.items() if v}
+        if by in (["product_key"], ["city_key"], ["region"]):
+            if by == ["product_key"]:
+                index, group = store.ranking(), "category"
+            else:
+                index, group = store.city_totals(), "region"
+            if set(active) <= {"marketplace", group} and set(measures) <= set(index.measures):
+                totals = index.totals(start, end, active.get("marketplace"), active.get(group), measures)
+                # Regions are rolled up from the city totals
+                return index.rollup(totals) if by == ["region"] else totals.reset_index()
+        if by == ["order_date"] and set(measures) <= set(CUBE_MEASURES) and set(active) <= set(FILTER_COLS):
+            return store.daily(start, end, **filters)[by + measures].reset_index(drop=True)
+        kpis = self._kpis(by, measures, filters)
+        if kpis is not None:
+            frame = kpis.breakdown(start, end, **filters)
+        else:
+            frame = self._frame(by + measures, start, end, filters)
+        if "order_date" in by:
+            frame = frame.assign(order_date=frame["order_date"].dt.normalize())
+        return frame.groupby(by, observed=True)[measures].sum().reset_index()
+
+ENGINE = os.environ.get("SALES_ENGINE", "pandas")
+_engine = None
+
+def get_engine(name=None):
+    """Query engine over the shared store (``SALES_ENGINE``: pandas or sqlite)."""
+    global _engine
+    name = name or ENGINE
+    store = get_store()
+    engine = _engine
+    if engine is not None and engine.name == name and engine.store is store:
+        return engine
+    with _store_lock:
+        if name == "pandas":
+            engine = PandasEngine(store)
+        elif name == "sqlite":
+            from utils.sqlite_engine import SqliteEngine
+            engine = SqliteEngine(store)
+        else:
+            raise ValueError(f"unknown engine {name!r}, expected pandas or sqlite")
+        if name == ENGINE:
+            _engine = engine
+    return engine
+
+def load_data():
+    return get_store().df
+
 def load_stock():
     stock = pd.read_csv(STOCK_PATH)
     return stock
 
-def resample_time(df, freq="D"):
-    # freq: "D" daily, "W" weekly, "M" monthly
-    s = (df
-         .groupby(pd.Grouper(key="order_date", freq=freq))
-         .agg({"revenue":"sum","sales_qty":"sum","net_profit":"sum"})
-         .reset_index())
-    return s
+def _sum_runs(values, starts):
+    """Sums of the consecutive runs beginning at ``starts`` (integer columns stay integer)."""
+    dtype = np.int64 if values.dtype.kind in "iub" else np.float64
+    return np.add.reduceat(values, starts, dtype=dtype)
+
+def daily_totals(df, value_cols=None, date_col="order_date"):
+    """One row per day with ``value_cols`` summed (raw rows or cube cells)."""
+    cols = RESAMPLE_COLS if value_cols is None else [value_cols] if isinstance(value_cols, str) else list(value_cols)
+    if df.empty:
+        return pd.DataFrame({date_col: pd.DatetimeIndex([]), **{c: np.zeros(0) for c in cols}})
+    dates = df[date_col].to_numpy("datetime64[ns]")
+    order = None if df[date_col].is_monotonic_increasing else np.argsort(dates, kind="stable")
+    if order is not None:
+        dates = dates[order]
+    days = dates.astype("datetime64[D]")
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    out = {date_col: days[starts].astype("datetime64[ns]")}
+    for c in cols:
+        values = df[c].to_numpy()
+        out[c] = _sum_runs(values if order is None else values[order], starts)
+    return pd.DataFrame(out)
+
+def resample_time(df, freq="D", value_col=None, date_col="order_date", mode="periodic"):
+    """Sum ``value_col`` (a column or list; default revenue/sales_qty/net_profit) per time bucket.
+
+    ``freq`` is one of D/W/M/Q (weeks end on Sunday, months and quarters are
+    labelled by their last day, as with a Grouper). Input is rolled up to
+    daily totals first (a no-op for a daily series), then days to buckets
+    by run sums over sorted dates; empty buckets inside the range are 0.
+    ``mode="cumulative"`` returns running totals.
+    """
+    try:
+        rule, period = TIME_BUCKETS[freq]
+    except KeyError:
+        raise ValueError(f"unknown freq {freq!r}, expected one of {sorted(TIME_BUCKETS)}") from None
+    daily = daily_totals(df, value_col, date_col)
+    cols = [c for c in daily.columns if c != date_col]
+    if daily.empty:
+        return daily
+    days = pd.DatetimeIndex(daily[date_col])
+    labels = (days if period is None else days.to_period(period).to_timestamp(how="end").normalize()).to_numpy()
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    out = (pd.DataFrame({c: _sum_runs(daily[c].to_numpy(), starts) for c in cols},
+                        index=pd.DatetimeIndex(labels[starts]))
+           .reindex(pd.date_range(labels[0], labels[-1], freq=rule), fill_value=0))
+    if mode == "cumulative":
+        out = out.cumsum()
+    return out.rename_axis(date_col).reset_index()
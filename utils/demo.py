@@ -0,0 +1,193 @@
+"""Synthetic sales data with the same schema as ``data/sales_data.csv``.
+
+Every column is drawn as a whole array per chunk of days, so generating
+tens of millions of rows is bounded by memory bandwidth, not Python loops::
+
+    python -m utils.demo --days 1095 --orders-per-day 30000 --out /tmp/sales_data.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.data import DATA_DIR, _apply_dtype_plan, _enrich
+
+PRODUCTS_PATH = os.path.join(DATA_DIR, "products.csv")
+
+MARKETPLACES = ["Trendyol", "Hepsiburada", "Amazon", "N11"]
+# Typical commission rate per marketplace (same order as MARKETPLACES)
+COMMISSION = [0.15, 0.13, 0.11, 0.10]
+RETURN_REASONS = ["Hasarlı ürün", "Yanlış ürün", "Beden/ölçü uymadı",
+                  "Beklentiyi karşılamadı", "Vazgeçti", "Geç teslimat"]
+
+CITIES = [
+    ("İstanbul", "Marmara", 41.01, 28.98), ("Ankara", "İç Anadolu", 39.93, 32.86),
+    ("İzmir", "Ege", 38.42, 27.14), ("Bursa", "Marmara", 40.19, 29.06),
+    ("Antalya", "Akdeniz", 36.90, 30.70), ("Adana", "Akdeniz", 37.00, 35.32),
+    ("Konya", "İç Anadolu", 37.87, 32.48), ("Gaziantep", "Güneydoğu Anadolu", 37.07, 37.38),
+    ("Kocaeli", "Marmara", 40.77, 29.92), ("Mersin", "Akdeniz", 36.81, 34.64),
+    ("Kayseri", "İç Anadolu", 38.73, 35.49), ("Eskişehir", "İç Anadolu", 39.78, 30.52),
+    ("Diyarbakır", "Güneydoğu Anadolu", 37.91, 40.24), ("Samsun", "Karadeniz", 41.29, 36.33),
+    ("Trabzon", "Karadeniz", 41.00, 39.72), ("Erzurum", "Doğu Anadolu", 39.90, 41.27),
+    ("Malatya", "Doğu Anadolu", 38.36, 38.31), ("Denizli", "Ege", 37.78, 29.09),
+    ("Manisa", "Ege", 38.61, 27.43), ("Tekirdağ", "Marmara", 40.98, 27.51),
+    ("Sakarya", "Marmara", 40.69, 30.44), ("Muğla", "Ege", 37.22, 28.36),
+    ("Hatay", "Akdeniz", 36.20, 36.16), ("Van", "Doğu Anadolu", 38.50, 43.38),
+]
+
+# Column order of the CSV export
+COLUMNS = ["order_date", "marketplace", "product_id", "product_name", "category", "brand",
+           "city", "region", "lat", "lon", "sales_qty", "return_qty", "unit_price",
+           "unit_cost", "commission_rate", "cargo_cost", "return_reason", "delivery_days"]
+
+def _popularity(n, skew):
+    # Zipf-like weights: a few best sellers / big cities, a long tail
+    w = 1.0 / np.arange(1, n + 1) ** skew
+    return w / w.sum()
+
+def _catalog(n_products, rng):
+    """Product table: product_id, product_name, category, brand, base_price, base_cost."""
+    base = pd.read_csv(PRODUCTS_PATH)
+    if not n_products or n_products <= len(base):
+        return base.iloc[:n_products] if n_products else base
+    # Larger catalogs: variants of the real products with their own ids/prices
+    idx = rng.integers(0, len(base), n_products)
+    cat = base.iloc[idx].reset_index(drop=True)
+    factor = rng.lognormal(0.0, 0.35, n_products)
+    return cat.assign(
+        product_id=[f"SKU-{i:07d}" for i in range(n_products)],
+        product_name=cat["product_name"] + " #" + pd.Series(np.arange(n_products)).astype(str),
+        base_price=(cat["base_price"] * factor).round(2),
+        base_cost=(cat["base_cost"] * factor).round(2),
+    )
+
+def _cities(n_cities, rng):
+    """City table: city, region, lat, lon (districts are added past the built-in list)."""
+    base = pd.DataFrame(CITIES, columns=["city", "region", "lat", "lon"])
+    if not n_cities or n_cities <= len(base):
+        return base.iloc[:n_cities] if n_cities else base
+    idx = np.concatenate([np.arange(len(base)), rng.integers(0, len(base), n_cities - len(base))])
+    out = base.iloc[idx].reset_index(drop=True)
+    district = np.arange(len(out)) - len(base) + 1
+    extra = district > 0
+    out["city"] = np.where(extra, out["city"] + "-" + district.astype(str), out["city"])
+    out.loc[extra, ["lat", "lon"]] += rng.normal(0, 0.15, (int(extra.sum()), 2))
+    return out
+
+def _categorical(codes, categories):
+    return pd.Categorical.from_codes(codes, categories=pd.Index(categories))
+
+def _rows(dates, per_day, catalog, cities, weights, rng):
+    n = int(per_day.sum())
+    p = rng.choice(len(catalog), n, p=weights[0])
+    c = rng.choice(len(cities), n, p=weights[1])
+    m = rng.choice(len(MARKETPLACES), n, p=[0.4, 0.3, 0.2, 0.1])
+    qty = rng.integers(1, 5, n)
+    ret = rng.binomial(qty, 0.06)
+    reason = np.where(ret > 0, rng.integers(0, len(RETURN_REASONS), n), -1)
+
+    cat_codes, cat_names = pd.factorize(catalog["category"])
+    brand_codes, brand_names = pd.factorize(catalog["brand"])
+    region_codes, region_names = pd.factorize(cities["region"])
+    return pd.DataFrame({
+        "order_date": np.repeat(dates, per_day),
+        "marketplace": _categorical(m, MARKETPLACES),
+        "product_id": _categorical(p, catalog["product_id"]),
+        "product_name": _categorical(p, catalog["product_name"]),
+        "category": _categorical(cat_codes[p], cat_names),
+        "brand": _categorical(brand_codes[p], brand_names),
+        "city": _categorical(c, cities["city"]),
+        "region": _categorical(region_codes[c], region_names),
+        "lat": cities["lat"].to_numpy(np.float32)[c],
+        "lon": cities["lon"].to_numpy(np.float32)[c],
+        "sales_qty": qty.astype(np.int8),
+        "return_qty": ret.astype(np.int8),
+        "unit_price": (catalog["base_price"].to_numpy()[p] * rng.uniform(0.9, 1.1, n)).round(2),
+        "unit_cost": catalog["base_cost"].to_numpy()[p],
+        "commission_rate": (np.asarray(COMMISSION)[m] + rng.normal(0, 0.01, n)).clip(0.03, 0.25).astype(np.float32),
+        "cargo_cost": rng.uniform(20, 120, n).round(2),
+        "return_reason": _categorical(reason, RETURN_REASONS),
+        # Farther from İstanbul (the warehouse) -> slower delivery
+        "delivery_days": (1 + rng.poisson(1 + np.abs(cities["lon"].to_numpy()[c] - 29.0) / 4)).astype(np.int8),
+    })
+
+def iter_sales_chunks(n_days=420, orders_per_day=(60, 120), n_products=None, n_cities=None,
+                      end=None, seed=42, chunk_rows=1_000_000, enrich=True):
+    """Yield sales frames of at most ~``chunk_rows`` rows, whole days each, in date order.
+
+    ``orders_per_day`` is an int or an inclusive (low, high) range. With
+    ``enrich`` the derived financial columns are added and the store's dtype
+    plan applied, exactly as ``utils.data`` does for the CSV.
+    """
+    rng = np.random.default_rng(seed)
+    catalog = _catalog(n_products, rng)
+    cities = _cities(n_cities, rng)
+    weights = (_popularity(len(catalog), 0.8), _popularity(len(cities), 1.0))
+    end = pd.Timestamp(end or pd.Timestamp.today()).normalize()
+    dates = pd.date_range(end=end, periods=n_days, freq="D")
+    lo, hi = (orders_per_day, orders_per_day) if np.isscalar(orders_per_day) else orders_per_day
+    per_day = rng.integers(lo, hi + 1, n_days)
+
+    start = 0
+    while start < n_days:
+        # As many whole days as fit in the chunk (at least one)
+        stop = start + max(1, int(np.searchsorted(np.cumsum(per_day[start:]), chunk_rows, "right")))
+        df = _rows(dates[start:stop], per_day[start:stop], catalog, cities, weights, rng)
+        yield _apply_dtype_plan(_enrich(df)) if enrich else df
+        start = stop
+
+def demo_sales(n_days=420, orders_per_day=(60, 120), seed=42, **kwargs):
+    """One in-memory demo frame (categoricals preserved across chunks)."""
+    chunks = list(iter_sales_chunks(n_days, orders_per_day, seed=seed, **kwargs))
+    return pd.concat(chunks, ignore_index=True)
+
+def demo_stock(n_products=None, seed=42):
+    """Stock snapshot with the schema of ``data/stock_snapshot.csv``: one row per product and marketplace."""
+    rng = np.random.default_rng(seed)
+    catalog = _catalog(n_products, rng)
+    n = len(catalog) * len(MARKETPLACES)
+    p = np.repeat(np.arange(len(catalog)), len(MARKETPLACES))
+    daily = (rng.gamma(2.0, 0.3, n) * np.tile([1.6, 1.2, 0.8, 0.4], len(catalog))).clip(0.03, None)
+    current = 2 + rng.poisson(daily * 10)
+    return pd.DataFrame({
+        "product_id": catalog["product_id"].to_numpy()[p],
+        "product_name": catalog["product_name"].to_numpy()[p],
+        "marketplace": np.tile(MARKETPLACES, len(catalog)),
+        "daily_avg_sales": daily.round(6),
+        "reorder_level": np.maximum(3, np.ceil(daily * 7)).astype(int),
+        "current_stock": current,
+        "days_to_oos": (current / daily).round(1),
+    })
+
+def write_sales_csv(path, **kwargs):
+    """Stream generated rows to ``path`` chunk by chunk; returns the row count."""
+    rows = 0
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(iter_sales_chunks(enrich=False, **kwargs)):
+            chunk.to_csv(f, header=(i == 0), index=False, columns=COLUMNS, date_format="%Y-%m-%d")
+            rows += len(chunk)
+    os.replace(tmp, path)
+    return rows
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate a synthetic sales_data.csv")
+    ap.add_argument("--out", default=os.path.join(DATA_DIR, "sales_data.csv"))
+    ap.add_argument("--days", type=int, default=420)
+    ap.add_argument("--orders-per-day", type=int, nargs="+", default=[60, 120],
+                    help="fixed count or LOW HIGH range")
+    ap.add_argument("--products", type=int, default=None)
+    ap.add_argument("--cities", type=int, default=None)
+    ap.add_argument("--end", default=None, help="last order date (default: today)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--chunk-rows", type=int, default=1_000_000)
+    args = ap.parse_args(argv)
+    opd = args.orders_per_day[0] if len(args.orders_per_day) == 1 else tuple(args.orders_per_day[:2])
+    rows = write_sales_csv(args.out, n_days=args.days, orders_per_day=opd,
+                           n_products=args.products, n_cities=args.cities,
+                           end=args.end, seed=args.seed, chunk_rows=args.chunk_rows)
+    print(f"{rows:,} rows -> {args.out}")
+
+if __name__ == "__main__":
+    main()
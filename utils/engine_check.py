@@ -0,0 +1,151 @@
+"""Check that the query engines agree, and time them side by side.
+
+    python -m utils.engine_check                  # the configured sales data
+    python -m utils.engine_check --rows 1000000   # synthetic data of that size
+
+Every logical request the pages issue (KPI totals, daily series, dimension
+breakdowns, product and city totals, rankings) runs on each engine over a
+matrix of date ranges and filters, including a range without data. Sums
+must agree within ``--rtol``; groups are compared regardless of row order
+(each engine sorts categories its own way), but their ``by`` columns must
+have the same dtypes; rankings by their ranked values (members tied on the
+measure may come in either order). Mismatches are listed and the exit
+status is 1. The table shows the median latency per request and engine,
+plus the time the SQLite copy took to build.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from utils import data
+from utils.sqlite_engine import SqliteEngine
+
+REQUESTS = {
+    "kpi-totals": ("totals", (), {"measures": data.CUBE_MEASURES}),
+    "daily": ("group", (["order_date"], ["revenue", "net_profit"]), {}),
+    "by-marketplace": ("group", (["marketplace"], ["revenue"]), {}),
+    "by-category-brand": ("group", (["category", "brand"], ["revenue"]), {}),
+    "mp-x-category": ("group", (["marketplace", "category"], ["sales_qty", "return_qty"]), {}),
+    "return-reasons": ("group", (["return_reason"], ["return_lines"]), {}),
+    "top-revenue": ("top", ("product_key", "revenue", 15), {"measures": ["sales_qty"]}),
+    "top-returns": ("top", ("product_key", "return_qty", 15), {}),
+    "low-margin": ("top", ("product_key", "margin", 20), {"largest": False}),
+    "by-city": ("group", (["city_key"], data.GEO_MEASURES), {}),
+    "by-region": ("group", (["region"], data.GEO_MEASURES), {}),
+}
+# Requests of the regional page filter on region instead of category
+GEO = {"by-city", "by-region"}
+
+def _cases(store):
+    first, last = store.date_bounds()
+    day = lambda ts: ts.date().isoformat()
+    last30, last90 = day(last - np.timedelta64(29, "D")), day(last - np.timedelta64(89, "D"))
+    mps, cats, regions = store.values("marketplace"), store.values("category"), store.values("region")
+    return [
+        ("all", None, None, {}),
+        ("30d", last30, day(last), {}),
+        ("90d-1mp", last90, day(last), {"marketplace": mps[:1]}),
+        ("all-2mp-1cat", day(first), day(last), {"marketplace": mps[:2], "category": cats[:1]}),
+        ("all-2reg", day(first), day(last), {"region": regions[:2]}),
+        # No data in range: empty results must still have the same shape and types
+        ("empty", "2100-01-01", "2100-01-31", {}),
+    ]
+
+def _call(engine, request, start, end, filters):
+    method, args, kwargs = REQUESTS[request]
+    return getattr(engine, method)(*args, start=start, end=end, **kwargs, **filters)
+
+def _diff(a, b, rtol, request):
+    """None when the two results agree, else a short description."""
+    method, args, _ = REQUESTS[request]
+    if isinstance(a, dict):
+        for k in a:
+            if k == "cells":
+                # Cube cells vs. rows: only "no data" has to agree
+                if (a[k] == 0) != (b[k] == 0):
+                    return f"cells {a[k]} vs {b[k]}"
+            elif not np.isclose(a[k], b[k], rtol=rtol, atol=1e-6):
+                return f"{k} {a[k]!r} vs {b[k]!r}"
+        return None
+    if method == "top":
+        # Rank by rank the measure must agree; members tied on it may come in either order
+        measure = args[1]
+        a, b = a[[measure]].reset_index(drop=True), b[[measure]].reset_index(drop=True)
+    else:
+        by = args[0]
+        for c in by:
+            if a[c].dtype != b[c].dtype:
+                return f"{c} dtype {a[c].dtype} vs {b[c].dtype}"
+        # Category order is each engine's own: compare as sets
+        a, b = ((f.assign(**{c: f[c].astype(str) for c in by if f[c].dtype.kind not in "iu"})
+                 .sort_values(by).reset_index(drop=True)) for f in (a, b))
+    if len(a) != len(b):
+        return f"{len(a)} vs {len(b)} rows"
+    for c in a.columns:
+        x, y = a[c].to_numpy(), b[c].to_numpy()
+        if x.dtype.kind in "fiu" and y.dtype.kind in "fiu":
+            if not np.allclose(x.astype(np.float64), y.astype(np.float64), rtol=rtol, atol=1e-6):
+                return f"{c} differs"
+        elif (a[c].astype(str).to_numpy() != b[c].astype(str).to_numpy()).any():
+            return f"{c} differs"
+    return None
+
+def _median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+def run(store, db_path, repeat=5, rtol=1e-9):
+    engines = [data.PandasEngine(store), SqliteEngine(store, db_path)]
+    engines[1].sync()
+    print(f"{len(store.orders.frame):,} order lines; sqlite copy built in {engines[1].build_seconds or 0:.2f} s")
+    print(f"{'request':<20}{'case':<15}" + "".join(f"{e.name + ' ms':>12}" for e in engines))
+    issues = []
+    for request in REQUESTS:
+        for case, start, end, filters in _cases(store):
+            if ("region" in filters) != (request in GEO) and filters:
+                continue
+            results = [_call(e, request, start, end, filters) for e in engines]
+            problem = _diff(results[0], results[1], rtol, request)
+            if problem:
+                issues.append(f"{request}/{case}: {problem}")
+            ms = [_median_ms(lambda e=e: _call(e, request, start, end, filters), repeat) for e in engines]
+            print(f"{request:<20}{case:<15}" + "".join(f"{m:>12.1f}" for m in ms) + ("  MISMATCH" if problem else ""))
+    return issues
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compare the pandas and SQLite query engines")
+    ap.add_argument("--rows", type=float, default=None, help="synthetic order lines (default: the sales CSV)")
+    ap.add_argument("--days", type=int, default=730)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--rtol", type=float, default=1e-9, help="allowed relative difference of sums")
+    args = ap.parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="engine-check-")
+    if args.rows:
+        from utils.demo import demo_sales
+        frame = demo_sales(n_days=args.days, orders_per_day=max(1, int(args.rows) // args.days),
+                           end="2025-12-31", seed=args.seed)
+        store = data.SalesStore(frame, source="engine-check")
+    else:
+        store = data.get_store()
+    try:
+        issues = run(store, os.path.join(workdir, "sales.sqlite"), args.repeat, args.rtol)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("\nEngines agree." if not issues else "\nMismatches:")
+    for line in issues:
+        print("  " + line)
+    if issues:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Download the rows and tables behind a page as CSV or Excel, streamed in chunks.
+
+    GET /export/<page>/<table>.csv?start=2024-01-01&end=2024-06-30&mp=Amazon&cat=Moda
+
+Every page gets a ``rows`` table: the filtered order lines, read
+``CHUNK_ROWS`` at a time from the store and written out as they are read,
+so a multi-million-row extract never exists in memory as a whole. Pages add
+their aggregated tables with ``@export.table(page, name, label)``; those
+are computed by the query engine and are small. A page that is not built
+from order lines (stock) registers its own ``rows`` table instead.
+
+Query parameters: ``start``, ``end`` (days) and repeatable ``mp``,
+``cat``, ``region`` filters, the same values the page's filter controls
+hold. ``.xlsx`` needs the optional ``openpyxl``; the workbook is written
+in write-only mode to a temporary file and streamed from there, with a new
+sheet every ``XLSX_MAX_ROWS`` rows.
+"""
+import os
+import tempfile
+from urllib.parse import urlencode
+
+import dash_bootstrap_components as dbc
+import numpy as np
+import pandas as pd
+
+from utils import data
+
+# URL parameter -> engine / store filter
+FILTERS = {"mp": "marketplace", "cat": "category", "region": "region"}
+# Columns of a row export; names and attributes come back from the dimensions
+ROW_COLS = ["order_date", "marketplace", "product_id", "product_name", "category", "brand",
+            "city", "region", "lat", "lon", "sales_qty", "return_qty", "unit_price", "unit_cost",
+            "commission_rate", "cargo_cost", "return_reason", "delivery_days", "revenue",
+            "cogs", "commission", "shipping_cost", "net_profit"]
+XLSX_MAX_ROWS = 1_000_000
+STREAM_BLOCK = 1 << 20
+
+_tables = {}
+
+try:
+    import openpyxl
+except ImportError:  # openpyxl opsiyonel: yoksa yalnızca CSV
+    openpyxl = None
+
+def table(page, name, label):
+    """Register ``fn(start, end, **filters)`` (a frame or frames) as an export of ``page``."""
+    def decorate(fn):
+        _tables.setdefault(page, {})[name] = (label, fn)
+        return fn
+    return decorate
+
+def _owned(chunk, dim):
+    # Attributes the dimension keeps (product_name, lat/lon) back on the rows
+    if dim.key_col not in chunk.columns:
+        return chunk
+    keys = chunk[dim.key_col].to_numpy()
+    known = keys >= 0
+    cols = {}
+    for c in dim.owned:
+        values = dim.frame[c].to_numpy()[np.where(known, keys, 0)] if len(dim) else np.full(len(keys), None)
+        cols[c] = pd.Series(values, index=chunk.index).where(known)
+    return chunk.assign(**cols)
+
+def _rows(start, end, **filters):
+    store = data.get_store()
+    for chunk in store.scan(start, end, **filters):
+        chunk = _owned(_owned(chunk, store.products), store.cities)
+        yield chunk[[c for c in ROW_COLS if c in chunk.columns]]
+
+def tables(page):
+    """(name, label) of the exports of ``page``, rows first; none for a page without exports."""
+    if page not in _tables:
+        return []
+    own = [(name, label) for name, (label, _) in _tables[page].items()]
+    return own if "rows" in _tables[page] else [("rows", "Satırlar")] + own
+
+def url(page, name, fmt="csv", start=None, end=None, **filters):
+    """Download link of one export for the given filters (``marketplace=[...]``, ...)."""
+    params = {v: k for k, v in FILTERS.items()}
+    query = [("start", start), ("end", end)]
+    query += [(params[col], v) for col, values in filters.items() if values for v in values]
+    query = urlencode([(k, v) for k, v in query if v])
+    return f"/export/{page}/{name}.{fmt}" + (f"?{query}" if query else "")
+
+def menu(page, start=None, end=None, **filters):
+    """Items of a page's "Dışa aktar" menu: every export in every available format."""
+    items = []
+    for fmt in formats():
+        items.append(dbc.DropdownMenuItem(fmt.upper(), header=True))
+        items += [dbc.DropdownMenuItem(label, href=url(page, name, fmt, start, end, **filters), external_link=True)
+                  for name, label in tables(page)]
+    return items
+
+def formats():
+    return ["csv", "xlsx"] if openpyxl is not None else ["csv"]
+
+def frames(page, name, start=None, end=None, **filters):
+    """Frames of one export, or None when ``page`` has no export ``name``."""
+    if page not in _tables:
+        return None
+    entry = _tables[page].get(name)
+    if entry is None:
+        return _rows(start, end, **filters) if name == "rows" else None
+    out = entry[1](start, end, **filters)
+    return [out] if isinstance(out, pd.DataFrame) else out
+
+def iter_csv(chunks, columns=None):
+    """CSV bytes of ``chunks``, one block per frame; a BOM first so Excel reads UTF-8.
+
+    ``columns`` is the header written when no frame comes back at all.
+    """
+    yield "﻿".encode("utf-8")
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header, date_format="%Y-%m-%d").encode("utf-8")
+        header = False
+    if header and columns:
+        yield pd.DataFrame(columns=columns).to_csv(index=False).encode("utf-8")
+
+def iter_xlsx(chunks, columns=None):
+    """XLSX bytes of ``chunks``: written to a temporary file, then streamed from it."""
+    wb = openpyxl.Workbook(write_only=True)
+    sheet, rows = None, 0
+    for chunk in chunks:
+        columns = list(chunk.columns)
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if sheet is None or rows == XLSX_MAX_ROWS:
+                sheet = wb.create_sheet(f"Sayfa {len(wb.worksheets) + 1}")
+                sheet.append(columns)
+                rows = 0
+            sheet.append(row)
+            rows += 1
+    if sheet is None:
+        sheet = wb.create_sheet("Sayfa 1")
+        if columns:
+            sheet.append(list(columns))
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(STREAM_BLOCK)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
+
+def _day(value):
+    # ISO day of a ``start``/``end`` parameter (None when absent); ValueError when unreadable
+    if not value:
+        return None
+    ts = pd.Timestamp(value)
+    if pd.isna(ts):
+        raise ValueError(f"not a date: {value!r}")
+    return ts.date().isoformat()
+
+MIMETYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def install(app):
+    """Add the ``/export/<page>/<table>.<fmt>`` endpoint to ``app``'s server."""
+    from flask import Response, abort, request, stream_with_context
+
+    @app.server.route("/export/<page>/<name>.<fmt>")
+    def _export(page, name, fmt):
+        if fmt not in formats():
+            abort(404 if fmt not in MIMETYPES else 501)
+        # Bad dates fail here with 400, not inside the stream after a 200 has gone out
+        try:
+            start, end = _day(request.args.get("start")), _day(request.args.get("end"))
+        except ValueError:
+            abort(400)
+        filters = {col: request.args.getlist(k) for k, col in FILTERS.items() if request.args.getlist(k)}
+        chunks = frames(page, name, start, end, **filters)
+        if chunks is None:
+            abort(404)
+        columns = ROW_COLS if name == "rows" and "rows" not in _tables[page] else None
+        body = iter_csv(chunks, columns) if fmt == "csv" else iter_xlsx(chunks, columns)
+        return Response(stream_with_context(body), mimetype=MIMETYPES[fmt], headers={
+            "Content-Disposition": f'attachment; filename="{page}-{name}.{fmt}"',
+            # Proxies must pass chunks through instead of buffering the whole file
+            "X-Accel-Buffering": "no",
+        })
+    return _export
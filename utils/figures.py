@@ -0,0 +1,132 @@
+"""Bound the size of figures before a callback returns them.
+
+``reduce_figure`` is the last step of a page callback: long line series are
+downsampled with LTTB to a point budget, dense scatter traces switch to
+WebGL, oversized geo scatters keep their largest markers, and date axes
+are sent as epoch milliseconds so plotly (>= 6) ships them as base64
+binary arrays like every other numeric column.
+"""
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+
+# Max points per trace (env override; per-call ``max_points`` wins)
+MAX_POINTS = int(os.environ.get("FIGURE_MAX_POINTS", "2000"))
+# Scatter traces above this many points are rendered with WebGL
+WEBGL_POINTS = int(os.environ.get("FIGURE_WEBGL_POINTS", "1000"))
+
+# Per-point trace attributes that must be subset together with x/y
+_POINT_ATTRS = ("x", "y", "text", "hovertext", "customdata", "ids", "lat", "lon", "locations")
+_MARKER_ATTRS = ("size", "color", "symbol", "opacity")
+
+def lttb(x, y, n_out):
+    """Indices of ``n_out`` points chosen by Largest-Triangle-Three-Buckets.
+
+    First and last points are kept; every bucket in between contributes the
+    point forming the largest triangle with the previous pick and the next
+    bucket's mean, which preserves peaks and dips of the series.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    out = np.empty(n_out, dtype=np.intp)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        nx, ny = x[hi:nhi].mean(), y[hi:nhi].mean()
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+def downsample(df, x, y, max_points=None):
+    """Rows of ``df`` kept by LTTB on columns ``x``/``y`` (unchanged under budget)."""
+    max_points = max_points or MAX_POINTS
+    if len(df) <= max_points:
+        return df
+    xs = df[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype("datetime64[ms]").astype(np.int64)
+    return df.iloc[lttb(xs, df[y].to_numpy(), max_points)]
+
+def _is_dates(values):
+    return isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64)
+
+def _epoch_ms(values):
+    return values.astype("datetime64[ms]").astype(np.int64).astype(np.float64)
+
+def _take(trace, idx, n):
+    """Subset every per-point array of ``trace`` (length ``n``) to ``idx``."""
+    for attr in _POINT_ATTRS:
+        v = getattr(trace, attr, None)
+        if v is not None and not isinstance(v, str) and len(v) == n:
+            trace[attr] = np.asarray(v)[idx]
+    marker = getattr(trace, "marker", None)
+    for attr in _MARKER_ATTRS:
+        v = marker[attr] if marker is not None else None
+        if v is not None and not np.isscalar(v) and not isinstance(v, str) and len(v) == n:
+            marker[attr] = np.asarray(v)[idx]
+
+def _axis(fig, ref):
+    # "x" -> layout.xaxis, "x2" -> layout.xaxis2
+    return fig.layout[ref[0] + "axis" + ref[1:]]
+
+def _reduce_scatter(fig, trace, max_points, webgl_points):
+    """Downsample/encode one scatter trace; True when it should become WebGL."""
+    x = trace.x
+    if x is None or trace.y is None:
+        return False
+    x = np.asarray(x)
+    n = len(x)
+    dates = _is_dates(x)
+    xs = _epoch_ms(x) if dates else x
+    if n > max_points and "lines" in (trace.mode or "lines") and np.issubdtype(xs.dtype, np.number):
+        _take(trace, lttb(xs, trace.y, max_points), n)
+        x = np.asarray(trace.x)
+        n = len(x)
+    if dates:
+        # Numbers on a date axis are epoch ms; unlike ISO strings they are sent binary
+        trace.x = _epoch_ms(x)
+        _axis(fig, trace.xaxis or "x").type = "date"
+    return n > webgl_points and trace.type == "scatter"
+
+def _reduce_geo(trace, max_points):
+    lat = trace.lat
+    if lat is None or len(lat) <= max_points:
+        return
+    n = len(lat)
+    size = trace.marker.size
+    if size is not None and not np.isscalar(size) and len(size) == n:
+        idx = np.sort(np.argpartition(-np.asarray(size, dtype=float), max_points - 1)[:max_points])
+    else:
+        idx = np.arange(max_points)
+    _take(trace, idx, n)
+
+def reduce_figure(fig, max_points=None, webgl_points=None):
+    """Apply the point budget / WebGL / binary-date reductions; returns the figure to send."""
+    max_points = max_points or MAX_POINTS
+    webgl_points = webgl_points or WEBGL_POINTS
+    to_gl = []
+    for i, trace in enumerate(fig.data):
+        if trace.type in ("scatter", "scattergl"):
+            if _reduce_scatter(fig, trace, max_points, webgl_points):
+                to_gl.append(i)
+        elif trace.type == "scattergeo":
+            _reduce_geo(trace, max_points)
+    if not to_gl:
+        return fig
+    # Figure.data only accepts its own traces, so WebGL swaps need a new figure
+    data = []
+    for i, trace in enumerate(fig.data):
+        spec = trace.to_plotly_json()
+        if i in to_gl:
+            spec.pop("type", None)
+            trace = go.Scattergl(spec)
+        data.append(trace)
+    return go.Figure(data=data, layout=fig.layout)
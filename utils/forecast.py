@@ -0,0 +1,163 @@
+"""Demand rates per (product, marketplace) fitted from the order history.
+
+One batched pass over the last ``HISTORY_DAYS`` of orders fits, for every
+SKU x marketplace pair at once:
+
+- a weekday seasonality index (7 factors, shrunk towards 1 for thin SKUs),
+- an exponentially smoothed daily level of the deseasonalized demand,
+- the trailing ``WINDOW``-day mean and the daily standard deviation.
+
+``rates()`` blends the smoothed level with the trailing mean into the daily
+rate the stock page uses: the level follows recent changes, the window mean
+damps the noise of a thin SKU's last few days.
+
+Everything is a weighted ``bincount`` over the order rows (the EWMA is
+linear in the daily totals), so there is no per-SKU loop and no dense
+SKU x day matrix. Parameters are cached per data version in memory and,
+via ``python -m utils.forecast``, as ``data/.cache/demand_<key>.npz`` for
+other workers and restarts.
+"""
+import argparse
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from utils import data
+
+HISTORY_DAYS = 91
+WINDOW = 28
+ALPHA = 0.2
+# Share of the trailing window mean in the daily rate (the rest is the EWMA level)
+WINDOW_WEIGHT = 0.5
+# Units of history needed before a SKU's own weekday pattern counts fully
+SEASON_PRIOR = 20.0
+# Two-sided band of the projections (z = 1.64 -> 90%)
+BAND_Z = 1.64
+
+DemandModel = namedtuple("DemandModel", "key end products marketplaces pairs level window_mean sigma season")
+DemandModel.__doc__ = """Fitted parameters; ``pairs`` are sorted ``product_code * n_mp + mp_code`` keys."""
+
+def fit_demand(frame, end=None, history=HISTORY_DAYS, window=WINDOW, alpha=ALPHA, key=None):
+    """Fit every (product, marketplace) pair of the order rows in ``frame``."""
+    dates = frame["order_date"]
+    end = pd.Timestamp(end or dates.max()).normalize()
+    start = end - pd.Timedelta(days=history - 1)
+    day_all = (dates.to_numpy("datetime64[D]") - np.datetime64(start.date(), "D")).astype(np.int64)
+    keep = (day_all >= 0) & (day_all < history)
+    day = day_all[keep]
+    qty = frame["sales_qty"].to_numpy()[keep].astype(np.float64)
+
+    prod = frame["product_id"].astype("category")
+    mp = frame["marketplace"].astype("category")
+    n_mp = len(mp.cat.categories)
+    pair_key = prod.cat.codes.to_numpy()[keep].astype(np.int64) * n_mp + mp.cat.codes.to_numpy()[keep]
+    pairs, pair = np.unique(pair_key, return_inverse=True)
+    n = len(pairs)
+
+    total = np.bincount(pair, weights=qty, minlength=n)
+    mean = total / history
+
+    # Weekday index: demand share per weekday vs. a flat week, shrunk towards 1
+    weekday = (np.datetime64(start.date(), "D").astype(np.int64) + day + 3) % 7  # 0 = Monday
+    days_per_weekday = np.bincount((np.arange(history) + start.weekday()) % 7, minlength=7)
+    by_weekday = np.bincount(pair * 7 + weekday, weights=qty, minlength=n * 7).reshape(n, 7)
+    raw = np.divide(by_weekday / days_per_weekday, mean[:, None],
+                    out=np.ones((n, 7)), where=mean[:, None] > 0)
+    trust = (total / (total + SEASON_PRIOR))[:, None]
+    season = trust * raw + (1 - trust)
+    season /= season.mean(axis=1, keepdims=True)
+
+    # EWMA of deseasonalized daily totals, started at the history mean:
+    # level = (1-a)^T * mean + sum_d a (1-a)^(T-1-d) * y_d / s(weekday_d)
+    decay = alpha * (1 - alpha) ** (history - 1 - np.arange(history))
+    level = (1 - alpha) ** history * mean + np.bincount(
+        pair, weights=qty * decay[day] / season[pair, weekday], minlength=n)
+
+    recent = day >= history - window
+    window_mean = np.bincount(pair[recent], weights=qty[recent], minlength=n) / window
+
+    # Daily std including zero-sale days: needs per (pair, day) totals first
+    cell, cell_idx = np.unique(pair.astype(np.int64) * history + day, return_inverse=True)
+    cell_sum = np.bincount(cell_idx, weights=qty)
+    sq = np.bincount(cell // history, weights=cell_sum ** 2, minlength=n)
+    sigma = np.sqrt(np.maximum(sq / history - mean ** 2, 0))
+
+    return DemandModel(key, end, np.asarray(prod.cat.categories, dtype=object),
+                       np.asarray(mp.cat.categories, dtype=object), pairs,
+                       level, window_mean, sigma, season)
+
+def rates(model, window_weight=WINDOW_WEIGHT):
+    """Daily demand rate of every pair: EWMA level blended with the trailing window mean."""
+    # A whole number of weeks holds every weekday equally often, so the window
+    # mean is on the deseasonalized scale of the level
+    return (1 - window_weight) * model.level + window_weight * model.window_mean
+
+def lookup(model, product_ids, marketplaces):
+    """Row positions in ``model`` for aligned product/marketplace arrays (-1 = no history)."""
+    p = pd.Index(model.products).get_indexer(product_ids)
+    m = pd.Index(model.marketplaces).get_indexer(marketplaces)
+    key = p.astype(np.int64) * len(model.marketplaces) + m
+    pos = np.searchsorted(model.pairs, key).clip(max=max(len(model.pairs) - 1, 0))
+    found = (p >= 0) & (m >= 0) & (len(model.pairs) > 0)
+    found &= model.pairs[pos] == key if len(model.pairs) else False
+    return np.where(found, pos, -1)
+
+def _cache_path(key):
+    return os.path.join(data.CACHE_DIR, f"demand_{key}.npz")
+
+def save_model(model):
+    os.makedirs(data.CACHE_DIR, exist_ok=True)
+    path = _cache_path(model.key)
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, end=np.datetime64(model.end.date()), products=model.products.astype(str),
+             marketplaces=model.marketplaces.astype(str), pairs=model.pairs, level=model.level,
+             window_mean=model.window_mean, sigma=model.sigma, season=model.season)
+    os.replace(tmp, path)
+    return path
+
+def _load_model(key):
+    try:
+        with np.load(_cache_path(key)) as z:
+            return DemandModel(key, pd.Timestamp(z["end"]), z["products"].astype(object),
+                               z["marketplaces"].astype(object), z["pairs"], z["level"],
+                               z["window_mean"], z["sigma"], z["season"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_demand_model():
+    """Demand model of the shared store's current data version (fitted once per version)."""
+    global _model
+    store = data.get_store()
+    key = store.data_key
+    model = _model
+    if model is not None and model.key == key:
+        return model
+    with _model_lock:
+        if _model is None or _model.key != key:
+            model = _load_model(key)
+            if model is None:
+                model = fit_demand(store.orders.frame, key=key)
+            _model = model
+        return _model
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Refit demand rates for the whole catalog")
+    ap.add_argument("--no-save", action="store_true", help="fit and report only")
+    args = ap.parse_args(argv)
+    store = data.get_store()
+    t0 = time.perf_counter()
+    model = fit_demand(store.orders.frame, key=store.data_key)
+    took = time.perf_counter() - t0
+    print(f"{len(model.pairs):,} SKU x marketplace pairs fitted in {took:.2f} s")
+    if not args.no_save:
+        print(save_model(model))
+
+if __name__ == "__main__":
+    main()
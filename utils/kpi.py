@@ -0,0 +1,92 @@
+"""Date-range KPIs from cumulative daily sums per (marketplace, category) cell.
+
+``KpiIndex`` is built once per data snapshot from the daily ``sales`` cube.
+For every filter cell present in the data it keeps, per measure, the
+running total up to each day; a KPI over ``[start, end]`` is then two
+lookups per selected cell, however long the history is. Cells are the
+combinations that actually occur (a few dozen), so the table stays small.
+"""
+import numpy as np
+import pandas as pd
+
+def _slots(col):
+    # Category codes with missing values in an extra last slot
+    codes = col.cat.codes.to_numpy().astype(np.int64)
+    return np.where(codes < 0, len(col.cat.categories), codes)
+
+class KpiIndex:
+    """Cumulative daily sums of ``measures`` per combination of ``dims``."""
+
+    def __init__(self, cube, measures, dims=("marketplace", "category")):
+        self.dims = list(dims)
+        self.measures = [m for m in measures if m in cube.columns]
+        dates = cube["order_date"].to_numpy("datetime64[D]")
+        self._day0 = dates.min() if len(dates) else np.datetime64("1970-01-01", "D")
+        day = (dates - self._day0).astype(np.int64)
+        self.n_days = int(day.max()) + 1 if len(day) else 0
+
+        self._categories = [cube[d].cat.categories for d in self.dims]
+        key = np.zeros(len(cube), dtype=np.int64)
+        for d, cats in zip(self.dims, self._categories):
+            key = key * (len(cats) + 1) + _slots(cube[d])
+        cell_keys, cell = np.unique(key, return_inverse=True)
+        # Slot of every dim per cell, for the filter lookup tables
+        self._cell_slots = []
+        rest = cell_keys
+        for cats in reversed(self._categories):
+            rest, slot = np.divmod(rest, len(cats) + 1)
+            self._cell_slots.insert(0, slot)
+        n_cells = len(cell_keys)
+
+        # (day + 1, cell, measure): row d holds totals of days < d; the last
+        # measure counts cube cells, so an empty selection is recognisable
+        flat = day * n_cells + cell
+        cum = np.zeros((self.n_days + 1, n_cells, len(self.measures) + 1))
+        for j, m in enumerate(self.measures + [None]):
+            weights = None if m is None else cube[m].to_numpy().astype(np.float64)
+            daily = np.bincount(flat, weights=weights, minlength=self.n_days * n_cells)
+            cum[1:, :, j] = np.cumsum(daily.reshape(self.n_days, n_cells), axis=0)
+        self._cum = cum
+
+    def _day(self, value, default):
+        if value is None or pd.isna(value):
+            return default
+        return int((pd.Timestamp(value).to_datetime64().astype("datetime64[D]") - self._day0).astype(np.int64))
+
+    def _cells(self, filters):
+        sel = np.ones(self._cum.shape[1], dtype=bool)
+        for d, cats, slots in zip(self.dims, self._categories, self._cell_slots):
+            values = filters.get(d)
+            if values:
+                lut = np.append(np.isin(cats, list(values)), False)
+                sel &= lut[slots]
+        return np.flatnonzero(sel)
+
+    def _range(self, start, end, filters):
+        """(selected cells, per-cell totals) for the inclusive date range."""
+        d0 = max(self._day(start, 0), 0)
+        d1 = min(self._day(end, self.n_days - 1), self.n_days - 1)
+        cells = self._cells(filters)
+        if d1 < d0:
+            return cells, np.zeros((len(cells), self._cum.shape[2]))
+        return cells, self._cum[d1 + 1, cells] - self._cum[d0, cells]
+
+    def totals(self, start=None, end=None, **filters):
+        """Sums of every measure over the range and filters, plus ``cells`` (0 = no data)."""
+        _, sums = self._range(start, end, filters)
+        out = dict(zip(self.measures + ["cells"], sums.sum(axis=0).tolist()))
+        out["cells"] = int(out["cells"])
+        return out
+
+    def breakdown(self, start=None, end=None, **filters):
+        """Per-cell sums (one row per dims combination with data in range)."""
+        cells, sums = self._range(start, end, filters)
+        present = sums[:, -1] > 0
+        cells, sums = cells[present], sums[present]
+        out = {}
+        for d, cats, slots in zip(self.dims, self._categories, self._cell_slots):
+            codes = slots[cells]
+            out[d] = pd.Categorical.from_codes(np.where(codes < len(cats), codes, -1), categories=cats)
+        for j, m in enumerate(self.measures):
+            out[m] = sums[:, j]
+        return pd.DataFrame(out)
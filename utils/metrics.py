@@ -0,0 +1,349 @@
+"""Opt-in callback instrumentation (``DASH_METRICS=1``).
+
+When enabled, every Dash callback request records its wall time split into
+stages (filter / aggregate / figure / serialize / other), the JSON payload
+size and the number of rows the store returned. Totals are served in
+Prometheus text format at ``/_metrics``; each response also carries a
+``Server-Timing`` header for the browser's network panel.
+
+Pages mark stages with ``stage("aggregate")`` / ``stage("figure")``; the
+store wraps its queries in ``span("filter")``. When disabled both are a
+flag check, and ``install()`` adds no hooks at all.
+"""
+import contextlib
+import cProfile
+import functools
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+ENABLED = os.environ.get("DASH_METRICS", "0") == "1"
+# Also track peak Python/NumPy allocation per request (tracemalloc costs ~2x CPU)
+TRACE_MEMORY = ENABLED and os.environ.get("DASH_METRICS_MEMORY", "0") == "1"
+PROFILE_DIR = os.environ.get("DASH_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "dash-profiles"))
+# Newest cProfile dumps kept in PROFILE_DIR; older ones are deleted
+PROFILE_KEEP = int(os.environ.get("DASH_PROFILE_KEEP", "20"))
+
+STAGES = ("filter", "aggregate", "figure", "serialize", "other")
+# Latency histogram bounds (seconds)
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_LOCAL_ADDRS = ("127.0.0.1", "::1")
+
+_local = threading.local()
+_lock = threading.Lock()
+_profile_next = set()
+
+class _Request:
+    """Timings of one callback request; time goes to ``current`` until the next switch."""
+    __slots__ = ("name", "t0", "last", "current", "stages", "rows", "payload", "peak", "seconds", "tasks")
+
+    def __init__(self, name, current="other"):
+        self.name = name
+        self.t0 = self.last = time.perf_counter()
+        self.current = current
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.rows = self.payload = self.peak = 0
+        self.seconds = 0.0
+        # Finished pool tasks of this request (see bind()); folded in by finish()
+        self.tasks = []
+
+    def switch(self, name):
+        now = time.perf_counter()
+        self.stages[self.current] = self.stages.get(self.current, 0.0) + now - self.last
+        self.last = now
+        prev, self.current = self.current, name
+        return prev
+
+    def finish(self):
+        self.switch("other")
+        self.seconds = self.last - self.t0
+        for task in self.tasks:
+            # Task time adds up per thread: with parallel tasks the stages exceed the wall time
+            for s, v in task.stages.items():
+                if s != "other":
+                    self.stages[s] = self.stages.get(s, 0.0) + v
+            self.rows += task.rows
+        self.tasks = []
+
+    def server_timing(self):
+        parts = [f"{s};dur={self.stages[s] * 1000:.1f}" for s in STAGES if self.stages.get(s)]
+        parts.append(f"total;dur={self.seconds * 1000:.1f};desc=\"{self.name}\"")
+        return ", ".join(parts)
+
+class _Totals:
+    __slots__ = ("count", "errors", "seconds", "buckets", "stages", "rows", "payload", "peak")
+
+    def __init__(self):
+        self.count = self.errors = self.rows = self.payload = self.peak = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.stages = defaultdict(float)
+
+_totals = defaultdict(_Totals)
+
+class _Span:
+    __slots__ = ("req", "name", "prev")
+
+    def __init__(self, req, name):
+        self.req, self.name = req, name
+
+    def __enter__(self):
+        self.prev = self.req.switch(self.name)
+
+    def __exit__(self, *exc):
+        self.req.switch(self.prev)
+
+class _NullSpan:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL = _NullSpan()
+
+def _current():
+    return getattr(_local, "req", None)
+
+def stage(name):
+    """From here on, attribute this request's time to ``name`` (until the next mark)."""
+    if ENABLED:
+        req = _current()
+        if req is not None:
+            req.switch(name)
+
+def span(name):
+    """Context manager: time inside goes to ``name``, then the previous stage resumes."""
+    req = _current() if ENABLED else None
+    return _Span(req, name) if req is not None else _NULL
+
+def context():
+    """The current request's timings, to hand to ``bind()`` in another thread (None if untracked)."""
+    return _current() if ENABLED else None
+
+@contextlib.contextmanager
+def bind(req):
+    """Record stages and rows of this thread into request ``req`` (a pool task of it)."""
+    if req is None:
+        yield
+        return
+    task = _Request(req.name, req.current)
+    prev, _local.req = _current(), task
+    try:
+        yield
+    finally:
+        task.finish()
+        _local.req = prev
+        # list.append is atomic; the request's own thread reads the list only in finish()
+        req.tasks.append(task)
+
+def rows(n):
+    """Count rows handed to the callback (store queries call this)."""
+    if ENABLED:
+        req = _current()
+        if req is not None:
+            req.rows += n
+
+def _record(req, error):
+    with _lock:
+        t = _totals[req.name]
+        t.count += 1
+        t.errors += error
+        t.seconds += req.seconds
+        for i, bound in enumerate(BUCKETS):
+            if req.seconds <= bound:
+                t.buckets[i] += 1
+        for s, v in req.stages.items():
+            t.stages[s] += v
+        t.rows += req.rows
+        t.payload += req.payload
+        t.peak = max(t.peak, req.peak)
+
+def _dump_profile(prof, name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+    prof.dump_stats(path)
+    _prune_profiles()
+    return path
+
+def _prune_profiles(keep=None):
+    keep = PROFILE_KEEP if keep is None else keep
+    try:
+        paths = [os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith(".prof")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+    except OSError:
+        return
+    for path in paths[max(keep, 1):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # removed by another worker
+
+def instrument(name, fn):
+    """Wrap Dash's per-callback entry point (it returns the serialized JSON)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        req = _local.req = _Request(name)
+        prof = None
+        if getattr(_local, "profile", False) or name in _profile_next:
+            _profile_next.discard(name)
+            prof = cProfile.Profile()
+        if TRACE_MEMORY:
+            tracemalloc.reset_peak()
+        out, error = None, False
+        try:
+            if prof is not None:
+                prof.enable()
+            out = fn(*args, **kwargs)
+            return out
+        except Exception as exc:
+            # PreventUpdate is flow control, not an error
+            error = type(exc).__name__ != "PreventUpdate"
+            raise
+        finally:
+            if prof is not None:
+                prof.disable()
+                _local.profile_path = _dump_profile(prof, name)
+            req.finish()
+            if TRACE_MEMORY:
+                req.peak = tracemalloc.get_traced_memory()[1]
+            req.payload = len(out) if isinstance(out, str) else 0
+            _local.req = None
+            _local.last = req
+            _record(req, error)
+    wrapper._instrumented = True
+    return wrapper
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def render():
+    """All totals in Prometheus text exposition format."""
+    out = []
+    with _lock:
+        items = sorted(_totals.items())
+        out += ["# HELP dash_callback_duration_seconds Callback wall time including serialization.",
+                "# TYPE dash_callback_duration_seconds histogram"]
+        for name, t in items:
+            cb = _label(name)
+            for bound, n in zip(BUCKETS, t.buckets):
+                out.append(f'dash_callback_duration_seconds_bucket{{callback="{cb}",le="{bound}"}} {n}')
+            out.append(f'dash_callback_duration_seconds_bucket{{callback="{cb}",le="+Inf"}} {t.count}')
+            out.append(f'dash_callback_duration_seconds_sum{{callback="{cb}"}} {t.seconds:.6f}')
+            out.append(f'dash_callback_duration_seconds_count{{callback="{cb}"}} {t.count}')
+        out += ["# HELP dash_callback_stage_seconds_total Callback time per stage.",
+                "# TYPE dash_callback_stage_seconds_total counter"]
+        for name, t in items:
+            for s in STAGES:
+                out.append(f'dash_callback_stage_seconds_total{{callback="{_label(name)}",stage="{s}"}} '
+                           f'{t.stages.get(s, 0.0):.6f}')
+        for metric, attr, kind, help_ in (
+            ("dash_callback_payload_bytes_total", "payload", "counter", "Serialized response bytes."),
+            ("dash_callback_rows_total", "rows", "counter", "Rows returned by store queries."),
+            ("dash_callback_errors_total", "errors", "counter", "Callbacks that raised."),
+            ("dash_callback_peak_alloc_bytes", "peak", "gauge", "Largest per-request allocation peak."),
+        ):
+            if attr == "peak" and not TRACE_MEMORY:
+                continue
+            out += [f"# HELP {metric} {help_}", f"# TYPE {metric} {kind}"]
+            out += [f'{metric}{{callback="{_label(name)}"}} {getattr(t, attr)}' for name, t in items]
+    out += _cache_lines()
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+        out += ["# HELP process_max_rss_bytes Peak resident set size of this worker.",
+                "# TYPE process_max_rss_bytes gauge", f"process_max_rss_bytes {rss}"]
+    except ImportError:  # Windows
+        pass
+    return "\n".join(out) + "\n"
+
+def _cache_lines():
+    # Callback cache counters (utils.cache), per memoized callback of this worker
+    from utils.cache import cache_stats
+    stats = cache_stats()
+    backend = stats.pop("_backend")
+    out = []
+    for key, help_ in (("hits", "Callback cache hits."), ("misses", "Callback cache misses."),
+                       ("evictions", "Callback cache entries evicted to make room.")):
+        metric = f"dash_callback_cache_{key}_total"
+        out += [f"# HELP {metric} {help_}", f"# TYPE {metric} counter"]
+        out += [f'{metric}{{callback="{_label(name)}"}} {c.get(key, 0)}' for name, c in sorted(stats.items())]
+    out += ["# HELP dash_callback_cache_entries Entries in the callback cache backend.",
+            "# TYPE dash_callback_cache_entries gauge",
+            f'dash_callback_cache_entries{{backend="{backend["type"]}"}} {backend["entries"]}']
+    if backend["nbytes"] is not None:
+        out += ["# HELP dash_callback_cache_bytes Bytes held by the in-memory callback cache.",
+                "# TYPE dash_callback_cache_bytes gauge",
+                f'dash_callback_cache_bytes{{backend="{backend["type"]}"}} {backend["nbytes"]}']
+    return out
+
+def _patch_serializer():
+    # Dash serializes the callback output inside its own wrapper; time that call as "serialize"
+    from dash import _callback
+    original = getattr(_callback, "to_json", None)
+    if original is None or getattr(original, "_instrumented", False):
+        return
+
+    @functools.wraps(original)
+    def to_json(obj):
+        with span("serialize"):
+            return original(obj)
+    to_json._instrumented = True
+    _callback.to_json = to_json
+
+def install(app):
+    """Wire metrics into ``app``: callback wrappers, headers and endpoints (no-op when disabled)."""
+    if not ENABLED:
+        return False
+    from flask import Response, abort, request
+
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _patch_serializer()
+    server = app.server
+
+    def _is_local():
+        return request.remote_addr in _LOCAL_ADDRS
+
+    def _local_only():
+        if not _is_local():
+            abort(403)
+
+    @server.before_request
+    def _wrap_callbacks():
+        # Runs after Dash's own setup hook, which moves page callbacks into callback_map
+        for cb in app.callback_map.values():
+            fn = cb.get("callback")
+            if fn is not None and not getattr(fn, "_instrumented", False):
+                cb["callback"] = instrument(getattr(fn, "__name__", "callback"), fn)
+        # curl -H "X-Dash-Profile: 1" ... profiles just that request; like /_metrics, from localhost only
+        _local.profile = request.headers.get("X-Dash-Profile") == "1" and _is_local()
+
+    @server.after_request
+    def _server_timing(response):
+        req = _local.__dict__.pop("last", None)
+        if req is not None:
+            response.headers["Server-Timing"] = req.server_timing()
+            path = _local.__dict__.pop("profile_path", None)
+            if path and _is_local():
+                response.headers["X-Dash-Profile-Path"] = path
+        return response
+
+    @server.route("/_metrics")
+    def _metrics():
+        _local_only()
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
+    @server.route("/_metrics/profile")
+    def _profile():
+        # Arm a one-shot cProfile for the next call of ?callback=<function name>
+        _local_only()
+        name = request.args.get("callback", "")
+        if not name:
+            return Response("usage: /_metrics/profile?callback=update_sales\n", status=400, mimetype="text/plain")
+        _profile_next.add(name)
+        return Response(f"next {name} call will be profiled into {PROFILE_DIR}\n", mimetype="text/plain")
+    return True
@@ -0,0 +1,64 @@
+"""Run the independent aggregations of one callback on several cores.
+
+``gather(f, g, ...)`` calls each zero-argument function on a shared thread
+pool and returns their results in order. pandas groupbys and NumPy
+reductions release the GIL for most of their work, so aggregations over
+the same frames overlap on different cores. Nothing is copied, since the
+threads read the store's frames in place. A process pool would need every
+column in shared memory to avoid pickling, and gains nothing over threads
+on the cube sizes callbacks aggregate.
+
+``AGG_WORKERS=0`` (or a single-core box) runs everything inline, in order.
+Calls from inside a pool task also run inline, so nested ``gather`` never
+waits on its own pool.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from utils import metrics
+
+# Threads per process; with gunicorn, workers x AGG_WORKERS should fit the cores
+WORKERS = int(os.environ.get("AGG_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+def _get_pool():
+    global _pool, _pool_pid
+    # Threads do not survive fork (gunicorn --preload, background jobs): one pool per process
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="agg",
+                                           initializer=_mark_worker)
+                _pool_pid = os.getpid()
+    return _pool
+
+def _mark_worker():
+    _local.in_pool = True
+
+def _run(ctx, task):
+    with metrics.bind(ctx):
+        return task()
+
+def gather(*tasks):
+    """Results of ``tasks`` (zero-argument callables), computed concurrently when possible.
+
+    An exception of a task is re-raised once all tasks have finished.
+    """
+    if WORKERS <= 1 or len(tasks) < 2 or getattr(_local, "in_pool", False):
+        return [task() for task in tasks]
+    pool = _get_pool()
+    # Pool threads time their stages into the calling request (DASH_METRICS)
+    ctx = metrics.context()
+    # The calling thread takes the first task itself instead of idling
+    futures = [pool.submit(_run, ctx, task) for task in tasks[1:]]
+    try:
+        first = tasks[0]()
+    finally:
+        # Never leave tasks running behind the caller, even if the first one failed
+        wait(futures)
+    return [first] + [f.result() for f in futures]
@@ -0,0 +1,105 @@
+"""Write the sales history as month x marketplace partition files (out-of-core storage).
+
+    python -m utils.partition                       # sales_data.csv + its daily drops
+    python -m utils.partition --append data/sales_data_2025-03-01.csv
+
+Sources are parsed ``CHUNK_ROWS`` rows at a time; every chunk adds one file
+per (month, marketplace) it touches, under
+``data/partitions/month=YYYY-MM/marketplace=<name>/``. ``_manifest.json``
+lists each file with its row count and per-column min/max, which
+``utils.data.PartitionedSales`` uses to skip files a query cannot match.
+Files are feather when pyarrow is installed, CSV otherwise.
+
+Serve from the partitions with ``SALES_STORAGE=partitions``; a running app
+picks up a rewritten manifest on its next refresh.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from urllib.parse import quote
+
+import pandas as pd
+
+from utils import data
+
+NULL = "__null__"
+
+def _stat(s):
+    # JSON-friendly min/max of one column (None when it has no values)
+    s = s.dropna()
+    if s.empty:
+        return None, None
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.min().isoformat(), s.max().isoformat()
+    if pd.api.types.is_numeric_dtype(s) and not isinstance(s.dtype, pd.CategoricalDtype):
+        return float(s.min()), float(s.max())
+    s = s.astype(str)
+    return s.min(), s.max()
+
+def _write_piece(root, rel, piece):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if data._feather is not None:
+        data._feather.write_feather(piece, path, compression="uncompressed")
+    else:
+        piece.to_csv(path, index=False, date_format="%Y-%m-%d")
+
+def _load_manifest(root):
+    try:
+        with open(os.path.join(root, data.MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"parts": [], "sources": []}
+
+def write_partitions(sources, root=data.PARTITIONS_DIR, append=False, chunk_rows=data.CHUNK_ROWS):
+    """Partition ``sources`` (CSV paths) under ``root``; returns the rows written.
+
+    Without ``append`` the layout is rebuilt next to ``root`` and swapped in
+    at the end, so a serving app never sees a half-written history.
+    """
+    target = root if append else f"{root}.{os.getpid()}.tmp"
+    meta = _load_manifest(root) if append else {"parts": [], "sources": []}
+    ext = ".feather" if data._feather is not None else ".csv"
+    seq, rows = len(meta["parts"]), 0
+    for src in sources:
+        for chunk in data.iter_csv(src, chunk_rows):
+            month = chunk["order_date"].dt.to_period("M")
+            for (m, mp), piece in chunk.groupby([month, "marketplace"], observed=True, dropna=False, sort=True):
+                mp = NULL if pd.isna(mp) else str(mp)
+                rel = f"month={m}/marketplace={quote(mp, safe='')}/part-{seq:06d}{ext}"
+                piece = piece.reset_index(drop=True)
+                _write_piece(target, rel, piece)
+                stats = {c: _stat(piece[c]) for c in piece.columns}
+                meta["parts"].append({"path": rel, "month": str(m), "marketplace": mp, "rows": len(piece),
+                                      "min": {c: v[0] for c, v in stats.items()},
+                                      "max": {c: v[1] for c, v in stats.items()}})
+                seq += 1
+                rows += len(piece)
+        meta["sources"].append(os.path.abspath(src))
+    meta["version"] = data.CACHE_VERSION
+    os.makedirs(target, exist_ok=True)
+    # The manifest goes last: readers only ever see complete files
+    data._write_json(os.path.join(target, data.MANIFEST), meta)
+    if not append:
+        if os.path.isdir(root):
+            shutil.rmtree(root)
+        os.replace(target, root)
+    return rows
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Partition the sales history by month and marketplace")
+    ap.add_argument("sources", nargs="*", help="CSV files (default: sales_data.csv and its daily drops)")
+    ap.add_argument("--out", default=data.PARTITIONS_DIR)
+    ap.add_argument("--append", action="store_true", help="add files to an existing layout")
+    ap.add_argument("--chunk-rows", type=int, default=data.CHUNK_ROWS)
+    args = ap.parse_args(argv)
+    sources = args.sources or [data.SALES_PATH] + data._partition_paths(data.SALES_PATH)
+    t0 = time.perf_counter()
+    rows = write_partitions(sources, args.out, args.append, args.chunk_rows)
+    parts = len(_load_manifest(args.out)["parts"])
+    print(f"{rows:,} rows -> {args.out} ({parts} files, {time.perf_counter() - t0:.1f} s)")
+
+if __name__ == "__main__":
+    main()
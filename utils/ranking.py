@@ -0,0 +1,124 @@
+"""Per-member range totals and top-k / bottom-k rankings over daily cubes.
+
+``RangeTotals`` is built once per data snapshot from a daily cube keyed by
+marketplace and a dimension key (``products``: product_key, ``geo``:
+city_key). Cells are sorted into one run per (marketplace, member) with
+running sums of every measure, so the total of a run over ``[start, end]``
+is two binary searches and a subtraction. A query therefore costs
+O(active runs), independent of the number of days and order lines.
+Rankings over these totals (``QueryEngine.top``) are a partial selection
+(``select_k``) of k members followed by sorting just those k.
+"""
+import numpy as np
+import pandas as pd
+
+# Measures with running sums (all additive cube measures a ranking may need)
+RANK_MEASURES = ["revenue", "sales_qty", "return_qty", "cogs", "commission",
+                 "shipping_cost", "net_profit"]
+
+def select_k(values, k, largest=True, keys=None):
+    """Positions of the ``k`` largest (or smallest) ``values``, best first.
+
+    Partial selection first, then only the selected k are sorted; ties are
+    broken by ``keys`` (default: position) so the order is deterministic.
+    """
+    n = len(values)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    score = -values if largest else values
+    idx = np.arange(n) if k == n else np.argpartition(score, k - 1)[:k]
+    tie = idx if keys is None else keys[idx]
+    return idx[np.lexsort((tie, score[idx]))]
+
+class RangeTotals:
+    """Range totals per member of ``dim`` over a (day x marketplace x ``key``) cube frame.
+
+    ``group`` names a dimension attribute (category, region) the totals can
+    be filtered on and rolled up by.
+    """
+
+    def __init__(self, cube, dim, key, group, measures):
+        self.dim = dim
+        self.measures = [m for m in measures if m in cube.columns]
+        n_members = max(len(dim), 1)
+        cube = cube[cube[key].to_numpy() >= 0]
+        self._key = key
+
+        dates = cube["order_date"].to_numpy("datetime64[D]")
+        self._day0 = dates.min() if len(dates) else np.datetime64("1970-01-01", "D")
+        day = (dates - self._day0).astype(np.int64)
+        self._span = int(day.max()) + 2 if len(day) else 2
+
+        mp = cube["marketplace"]
+        self.marketplaces = mp.cat.categories
+        # Slot len(categories) holds rows without a marketplace
+        mp_slot = np.where(mp.cat.codes.to_numpy() < 0, len(self.marketplaces), mp.cat.codes.to_numpy())
+        run = mp_slot.astype(np.int64) * n_members + cube[key].to_numpy().astype(np.int64)
+
+        order = np.lexsort((day, run))
+        run, day = run[order], day[order]
+        # Cells sorted by (run, day): one searchsorted key per cell
+        self._cell_key = run * self._span + day
+        self._runs = np.unique(run)
+        self._run_member = self._runs % n_members
+        self._run_mp = self._runs // n_members
+        self._n_members = n_members
+        self._cum = {m: np.concatenate([[0], np.cumsum(cube[m].to_numpy()[order].astype(np.float64))])
+                     for m in self.measures}
+        self.group = group
+        self._groups = pd.Categorical(dim.frame[group]) if group in dim.frame else None
+
+    def _day(self, value, default):
+        if value is None or pd.isna(value):
+            return default
+        return int((pd.Timestamp(value).to_datetime64().astype("datetime64[D]") - self._day0).astype(np.int64))
+
+    def _active_runs(self, marketplace=None, groups=None):
+        runs = np.ones(len(self._runs), dtype=bool)
+        if marketplace:
+            lut = np.append(np.isin(self.marketplaces, list(marketplace)), False)
+            runs &= lut[self._run_mp]
+        if groups and self._groups is not None:
+            lut = np.append(np.isin(self._groups.categories, list(groups)), False)
+            runs &= lut[self._groups.codes][self._run_member]
+        return np.flatnonzero(runs)
+
+    def totals(self, start=None, end=None, marketplace=None, groups=None, measures=None):
+        """Totals per member with at least one cell in range, indexed by the key."""
+        measures = measures or self.measures
+        d0 = max(self._day(start, 0), 0)
+        d1 = min(self._day(end, self._span - 2), self._span - 2)
+        sel = self._active_runs(marketplace, groups)
+        if d1 < d0:
+            sel = sel[:0]
+        base = self._runs[sel] * self._span
+        lo = np.searchsorted(self._cell_key, base + d0, "left")
+        hi = np.searchsorted(self._cell_key, base + d1, "right")
+        member = self._run_member[sel]
+        n = self._n_members
+        present = np.flatnonzero(np.bincount(member, weights=hi - lo, minlength=n))
+        out = {}
+        for m in measures:
+            cum = self._cum[m]
+            out[m] = np.bincount(member, weights=cum[hi] - cum[lo], minlength=n)[present]
+        return pd.DataFrame(out, index=pd.Index(present, name=self._key))
+
+    def rollup(self, totals):
+        """``totals`` (from ``totals()``) summed per ``group`` value, one row per group present."""
+        codes = self._groups.codes[totals.index.to_numpy()].astype(np.int64)
+        # Members without a group value go to the last slot and are left out
+        slots = np.where(codes < 0, len(self._groups.categories), codes)
+        n = len(self._groups.categories) + 1
+        present = np.flatnonzero(np.bincount(slots, minlength=n)[:-1])
+        out = {self.group: self._groups.categories[present]}
+        for m in totals.columns:
+            out[m] = np.bincount(slots, weights=totals[m].to_numpy(), minlength=n)[present]
+        return pd.DataFrame(out)
+
+class ProductRanking(RangeTotals):
+    """Per-product range totals over a products cube frame (filterable by category)."""
+
+    def __init__(self, cube, products, measures=RANK_MEASURES):
+        super().__init__(cube, products, "product_key", "category", measures)
+        self.products = products
@@ -0,0 +1,189 @@
+"""Render the page figures to report files, one report per marketplace or category.
+
+    python -m utils.reports --by marketplace --last-days 30 --out reports/
+    python -m utils.reports --by category --format png --workers 4
+    python -m utils.reports --format html          # no kaleido needed
+
+Each report calls the same page callbacks the dashboard runs (``update_sales``,
+``update_fin_kpis``/``update_fin``, ``update_returns``, ``update_reg``), so its
+figures come from the query engine, the cubes and the callback cache, never
+from a scan of raw rows. Reports of one batch that share a filter share the
+cached aggregates; with ``CALLBACK_CACHE_DIR`` set, so do the worker
+processes and the running app.
+
+Jobs go through a local queue drained by ``--workers`` processes, forked
+after the store and pages are loaded, so every worker starts with the data
+in memory. A failed report is recorded in ``index.json`` and does not stop
+the batch.
+
+``pdf`` and ``png`` need the optional ``kaleido`` (and the Chrome it
+drives). A PDF gets one vector page per figure: kaleido renders each figure
+as a PDF and ``pypdf`` merges them. ``html`` writes one self-contained page
+per report next to a shared ``plotly.min.js``.
+"""
+import argparse
+import importlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+FORMATS = ["pdf", "png", "html"]
+# Figure size in CSS pixels; PNGs are rendered at SCALE x this, PDFs are vector
+WIDTH, HEIGHT, SCALE = 1100, 620, 2
+WORKERS = int(os.environ.get("REPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pages = {}
+
+def _load_pages():
+    # register_page needs an app; pages are not rendered, only their callbacks called
+    if _pages:
+        return _pages
+    import dash
+    dash.Dash(__name__, use_pages=True, pages_folder="")
+    for name in ("sales", "finance", "returns", "regional"):
+        _pages[name] = importlib.import_module(f"pages.{name}_dashboard")
+    return _pages
+
+def _figures(start, end, mp, cat):
+    """(section, figure) pairs of one report, in page order."""
+    pages = _load_pages()
+    _, _, bar, tree, line, top = pages["sales"].update_sales(start, end, mp, cat, "W", "periodic")
+    out = [("Satış", f) for f in (bar, tree, line, top)]
+    _, waterfall = pages["finance"].update_fin_kpis(start, end, mp, cat)
+    out += [("Finans", f) for f in (waterfall, *pages["finance"].update_fin(start, end, mp, cat))]
+    out += [("İade", f) for f in pages["returns"].update_returns(start, end, mp, cat)]
+    # The regional page filters by region, not category: a category report leaves it out
+    if not cat:
+        out += [("Bölgesel", f) for f in pages["regional"].update_reg(start, end, mp, None)]
+    return out
+
+def write_pdf(path, pages, title=""):
+    """Merge single-page PDFs (bytes, one per figure) into ``path``, titled ``title``."""
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter()
+    for blob in pages:
+        writer.append(PdfReader(io.BytesIO(blob)))
+    writer.add_metadata({"/Title": title, "/Producer": "ecommerce_dashboard"})
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        writer.write(f)
+    os.replace(tmp, path)
+
+def _images(figures, fmt):
+    # One kaleido call per report: the browser starts once for all its figures
+    import plotly.io as pio
+    buffers = [io.BytesIO() for _ in figures]
+    pio.write_images([f for _, f in figures], buffers, format=fmt, scale=SCALE)
+    return [b.getvalue() for b in buffers]
+
+def _slug(text):
+    text = str(text).lower().translate(str.maketrans("çğıöşü", "cgiosu"))
+    return re.sub(r"[^a-z0-9]+", "-", text).strip("-") or "report"
+
+def _titled(fig, scope):
+    import plotly.graph_objects as go
+    fig = go.Figure(fig)
+    fig.update_layout(title_text=f"{scope} — {fig.layout.title.text or ''}", width=WIDTH, height=HEIGHT)
+    return fig
+
+def render(job):
+    """Render one report ``job`` (a dict from ``jobs()``); returns its ``index.json`` entry."""
+    t0 = time.perf_counter()
+    entry = {"name": job["name"], "scope": job["scope"], "files": []}
+    try:
+        figures = [(s, _titled(f, job["scope"])) for s, f in _figures(job["start"], job["end"], job["mp"], job["cat"])]
+        base = os.path.join(job["out"], job["name"])
+        if job["format"] == "pdf":
+            write_pdf(base + ".pdf", _images(figures, "pdf"), job["scope"])
+            entry["files"].append(base + ".pdf")
+        elif job["format"] == "png":
+            os.makedirs(base, exist_ok=True)
+            for i, ((section, _), blob) in enumerate(zip(figures, _images(figures, "png")), 1):
+                path = os.path.join(base, f"{i:02d}-{_slug(section)}.png")
+                with open(path, "wb") as f:
+                    f.write(blob)
+                entry["files"].append(path)
+        else:
+            body = "\n".join(f.to_html(full_html=False, include_plotlyjs=False) for _, f in figures)
+            with open(base + ".html", "w", encoding="utf-8") as out:
+                out.write(f'<!DOCTYPE html>\n<html lang="tr"><head><meta charset="utf-8"><title>{job["scope"]}</title>'
+                          f'<script src="plotly.min.js"></script></head><body>\n{body}\n</body></html>\n')
+            entry["files"].append(base + ".html")
+    except Exception:
+        entry["error"] = traceback.format_exc(limit=3)
+    entry["seconds"] = round(time.perf_counter() - t0, 3)
+    return entry
+
+def jobs(by, values, start, end, fmt, out):
+    """One job per value of ``by`` (``marketplace``/``category``), plus ``all`` for the whole data."""
+    out_jobs = [{"name": "all", "scope": "Tümü", "mp": None, "cat": None}]
+    for v in values:
+        out_jobs.append({"name": f"{by}-{_slug(v)}", "scope": str(v),
+                         "mp": [v] if by == "marketplace" else None, "cat": [v] if by == "category" else None})
+    for job in out_jobs:
+        job.update(start=start, end=end, format=fmt, out=out)
+    return out_jobs
+
+def run(jobs, workers=WORKERS):
+    """Render ``jobs`` on a pool of ``workers`` processes; entries come back in job order."""
+    _load_pages()
+    if workers <= 1 or len(jobs) < 2:
+        return [render(job) for job in jobs]
+    # Forked after the store and pages are loaded: workers share them copy-on-write
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_load_pages) as pool:
+        return list(pool.map(render, jobs))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Render dashboard reports per marketplace or category")
+    ap.add_argument("--by", choices=["marketplace", "category"], default="marketplace")
+    ap.add_argument("--values", nargs="+", help="only these marketplaces / categories (default: all)")
+    ap.add_argument("--start", help="first day (default: start of the data)")
+    ap.add_argument("--end", help="last day (default: end of the data)")
+    ap.add_argument("--last-days", type=int, help="the last N days of the data instead of --start/--end")
+    ap.add_argument("--format", choices=FORMATS, default="pdf")
+    ap.add_argument("--out", default="reports")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    args = ap.parse_args(argv)
+    if args.format != "html" and importlib.util.find_spec("kaleido") is None:
+        ap.error(f"--format {args.format} needs kaleido (pip install kaleido); --format html works without it")
+    if args.format == "pdf" and importlib.util.find_spec("pypdf") is None:
+        ap.error("--format pdf needs pypdf (pip install pypdf); --format png and html work without it")
+
+    from utils.data import get_store
+    store = get_store()
+    first, last = store.date_bounds()
+    # Concrete days: the pages' filter state expects both ends of the range
+    start, end = args.start or first.date().isoformat(), args.end or last.date().isoformat()
+    if args.last_days:
+        start, end = (last - pd.Timedelta(days=args.last_days - 1)).date().isoformat(), last.date().isoformat()
+    os.makedirs(args.out, exist_ok=True)
+    if args.format == "html":
+        from plotly.offline import get_plotlyjs
+        with open(os.path.join(args.out, "plotly.min.js"), "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+
+    t0 = time.perf_counter()
+    batch = jobs(args.by, args.values or store.values(args.by), start, end, args.format, args.out)
+    entries = run(batch, args.workers)
+    index = {"by": args.by, "start": start, "end": end,
+             "format": args.format, "seconds": round(time.perf_counter() - t0, 3), "reports": entries}
+    with open(os.path.join(args.out, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    failed = [e for e in entries if "error" in e]
+    print(f"{len(entries) - len(failed)}/{len(entries)} reports -> {args.out} ({index['seconds']:.1f} s)")
+    for e in failed:
+        print(f"  {e['name']}: {e['error'].strip().splitlines()[-1]}")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""SQLite query engine: the pages' logical requests answered by an embedded database file.
+
+``SALES_ENGINE=sqlite`` copies the store's order lines once per data
+version into ``data/.cache/sales.sqlite`` (one ``orders`` table, dates as
+day numbers) with indexes on ``(order_date, marketplace, category)`` and
+``(product_id)``, then answers ``totals``/``group``/``top`` with SQL.
+Queries run in SQLite, outside the GIL-bound pandas path, and only the
+aggregated rows come back.
+
+The file is rebuilt next to the old one and swapped in, so readers never
+see a half-written table; each thread keeps its own read-only connection.
+The rebuild copies every row, so this engine suits deployments where the
+data changes a few times a day rather than every few seconds.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import data
+
+DB_PATH = os.environ.get("SALES_SQLITE_PATH", os.path.join(data.CACHE_DIR, "sales.sqlite"))
+
+DIMS = ["marketplace", "category", "brand", "product_id", "city", "region", "return_reason"]
+KEYS = ["product_key", "city_key"]
+MEASURES = data.CUBE_MEASURES + ["delivery_days"]
+# Logical measures that are not a plain column sum
+EXPRS = {
+    "delivery_days_sum": "SUM(delivery_days)",
+    "delivery_days_count": "COUNT(delivery_days)",
+    "return_lines": "SUM(return_qty > 0)",
+}
+INDEXES = {
+    "idx_orders_date_mp_cat": "order_date, marketplace, category",
+    "idx_orders_product": "product_id",
+}
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+def _day(value):
+    if value is None or pd.isna(value):
+        return None
+    return int((pd.Timestamp(value).to_datetime64().astype("datetime64[D]") - _EPOCH).astype(np.int64))
+
+def _expr(m):
+    if m in EXPRS:
+        return EXPRS[m]
+    if m not in MEASURES:
+        raise ValueError(f"unknown measure {m!r}")
+    return f"SUM({m})"
+
+def _column(c):
+    if c != "order_date" and c not in DIMS + KEYS:
+        raise ValueError(f"unknown column {c!r}")
+    return c
+
+def _chunks(store):
+    # Order lines of the whole history, a bounded chunk at a time
+    if store.history is not None:
+        for chunk in store.history.scan():
+            yield data._attach_keys(chunk, store.products, store.cities)
+        return
+    frame = store.orders.frame
+    for i in range(0, len(frame), data.CHUNK_ROWS):
+        yield frame.iloc[i:i + data.CHUNK_ROWS]
+
+def _rows(chunk, cols):
+    # Python values column by column (NaN / missing categories become NULL)
+    out = [(chunk["order_date"].to_numpy("datetime64[D]") - _EPOCH).astype(np.int64).tolist()]
+    for c in cols[1:]:
+        if c not in chunk.columns:
+            out.append([None] * len(chunk))
+            continue
+        s = chunk[c]
+        if isinstance(s.dtype, pd.CategoricalDtype) or s.dtype == object:
+            out.append(s.astype(object).where(s.notna(), None).tolist())
+        else:
+            out.append(s.to_numpy().tolist())
+    return zip(*out)
+
+def _stored_key(path):
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        return conn.execute("SELECT value FROM meta WHERE key = 'data_key'").fetchone()[0]
+    except (sqlite3.Error, TypeError):
+        return None
+    finally:
+        conn.close()
+
+def build(store, path=DB_PATH, key=None):
+    """Write the store's order lines to a fresh database at ``path``; returns the row count."""
+    cols = ["order_date"] + DIMS + KEYS + MEASURES
+    types = {"order_date": "INTEGER", **{c: "TEXT" for c in DIMS}, **{c: "INTEGER" for c in KEYS},
+             **{c: "REAL" for c in MEASURES}}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    rows = 0
+    try:
+        # A throwaway file until the swap: no journal, no fsync
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"CREATE TABLE orders ({', '.join(f'{c} {types[c]}' for c in cols)})")
+        insert = f"INSERT INTO orders VALUES ({', '.join('?' * len(cols))})"
+        for chunk in _chunks(store):
+            conn.executemany(insert, _rows(chunk, cols))
+            rows += len(chunk)
+        for name, on in INDEXES.items():
+            conn.execute(f"CREATE INDEX {name} ON orders ({on})")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("INSERT INTO meta VALUES ('data_key', ?)", (key,))
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return rows
+
+class SqliteEngine(data.QueryEngine):
+    """``QueryEngine`` over an SQLite copy of the store, refreshed per data version."""
+    name = "sqlite"
+
+    def __init__(self, store, path=DB_PATH):
+        self.store = store
+        self.path = path
+        self.build_seconds = None
+        self._key = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _data_key(self):
+        store = self.store
+        # Stores built in memory (benchmarks) have no content token
+        return store.data_key or f"{id(store)}-{store.version}"
+
+    def sync(self):
+        """Bring the database file to the store's data version (rebuilt only when stale)."""
+        key = self._data_key()
+        if self._key != key:
+            with self._lock:
+                if self._key != key:
+                    if _stored_key(self.path) != key:
+                        t0 = time.perf_counter()
+                        build(self.store, self.path, key)
+                        self.build_seconds = time.perf_counter() - t0
+                    self._key = key
+        return key
+
+    def _conn(self):
+        key = self.sync()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.key != key:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.execute("PRAGMA mmap_size = 268435456")
+            self._local.conn, self._local.key = conn, key
+        return conn
+
+    def _where(self, start, end, filters, by=()):
+        sql, params = [], []
+        d0, d1 = _day(start), _day(end)
+        if d0 is not None:
+            sql.append("order_date >= ?")
+            params.append(d0)
+        if d1 is not None:
+            sql.append("order_date <= ?")
+            params.append(d1)
+        for col, values in filters.items():
+            if values:
+                sql.append(f"{_column(col)} IN ({', '.join('?' * len(values))})")
+                params += [str(v) for v in values]
+        # Same as the pandas groupbys: no group for missing values or unknown keys
+        for col in by:
+            sql.append(f"{col} >= 0" if col in KEYS else f"{col} IS NOT NULL")
+        return (" WHERE " + " AND ".join(sql)) if sql else "", params
+
+    def totals(self, start=None, end=None, measures=None, **filters):
+        measures = list(measures or data.CUBE_MEASURES)
+        where, params = self._where(start, end, filters)
+        # TOTAL() is SUM() that returns 0.0 instead of NULL for no rows
+        exprs = [_expr(m).replace("SUM(", "TOTAL(") for m in measures]
+        row = self._conn().execute(f"SELECT {', '.join(exprs)}, COUNT(*) FROM orders{where}", params).fetchone()
+        return {**dict(zip(measures, row[:-1])), "cells": row[-1]}
+
+    def group(self, by, measures, start=None, end=None, **filters):
+        by, measures = [_column(c) for c in by], list(measures)
+        where, params = self._where(start, end, filters, by)
+        cols = ", ".join(by)
+        sql = (f"SELECT {cols}, {', '.join(f'{_expr(m)} AS {m}' for m in measures)} "
+               f"FROM orders{where} GROUP BY {cols} ORDER BY {cols}")
+        out = pd.DataFrame(self._conn().execute(sql, params).fetchall(), columns=by + measures)
+        if "order_date" in by:
+            out["order_date"] = pd.to_datetime(out["order_date"].astype(np.int64), unit="D")
+        for c in by:
+            if c in KEYS:
+                # No rows: fetchall() gives no type to infer
+                out[c] = out[c].astype(np.int64)
+        for m in measures:
+            out[m] = out[m].astype(np.float64)
+        return out
@@ -0,0 +1,203 @@
+"""Stock snapshot analytics, precomputed once per snapshot file.
+
+``StockIndex`` keeps the snapshot rows in file order and adds per-row
+coverage days and reorder flags, a product -> rows index, and the global
+critical ordering (coverage, then stock). Marketplace filters are boolean
+masks over categorical codes; the frame itself is never copied, so
+callbacks stay interactive on ~500k product x marketplace rows.
+
+``demand()`` lays fitted sales-history rates (``utils.forecast``) over the
+rows; coverage, the critical list and depletion forecasts then use them,
+with confidence bands. Rows without history keep ``daily_avg_sales``.
+"""
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from utils import data
+from utils.forecast import BAND_Z, lookup, rates
+
+# Daily sales assumed for rows without a sales rate (coverage denominator)
+MIN_DAILY = 0.25
+# Floor of the summed daily rate in depletion forecasts
+MIN_FORECAST_DAILY = 0.2
+
+Demand = namedtuple("Demand", "key rate sigma season weekday0 coverage coverage_low critical")
+Demand.__doc__ = """Per-row demand view: daily rate/std, weekday factors and coverage in days."""
+Forecast = namedtuple("Forecast", "stock daily projection lower upper")
+
+class StockIndex:
+    """Read-only stock snapshot with coverage/reorder columns and product lookup."""
+
+    def __init__(self, frame, token=None):
+        frame = frame.reset_index(drop=True)
+        self.frame = frame
+        self.token = token
+        self.current = frame["current_stock"].to_numpy(np.float64)
+        self.daily = frame["daily_avg_sales"].to_numpy(np.float64)
+        self.reorder_level = frame["reorder_level"].to_numpy(np.float64)
+        self.coverage = np.round(self.current / np.where(self.daily == 0, MIN_DAILY, self.daily), 1)
+        self.needs_reorder = self.current <= self.reorder_level
+
+        mp = pd.Categorical(frame["marketplace"])
+        self.marketplaces = list(mp.categories)
+        self._mp_codes = mp.codes
+
+        prod = pd.Categorical(frame["product_id"])
+        self.products = prod.categories
+        # Rows of each product, contiguous in _by_product (file order within a product)
+        self._by_product = np.argsort(prod.codes, kind="stable")
+        self._product_starts = np.searchsorted(prod.codes[self._by_product], np.arange(len(self.products) + 1))
+        # Critical list order for the whole snapshot; filtered lists keep the first k passing rows
+        self._critical = np.lexsort((self.current, self.coverage))
+        self._demand = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    def mask(self, marketplaces=None):
+        """Boolean row mask for ``marketplaces`` (None/empty = all rows -> None)."""
+        if not marketplaces:
+            return None
+        lut = np.isin(self.marketplaces, list(marketplaces))
+        return lut[self._mp_codes]
+
+    def product_rows(self, product_id, mask=None):
+        """Row positions of ``product_id`` (optionally restricted by ``mask``)."""
+        i = self.products.get_indexer([product_id])[0]
+        if i < 0:
+            return np.zeros(0, dtype=np.intp)
+        rows = self._by_product[self._product_starts[i]:self._product_starts[i + 1]]
+        return rows if mask is None else rows[mask[rows]]
+
+    def demand(self, model=None):
+        """Demand view from a fitted ``DemandModel`` (None: snapshot rates), cached per model."""
+        key = None if model is None else model.key
+        view = self._demand
+        if view is not None and view.key == key:
+            return view
+        rate, sigma = self.daily, np.sqrt(self.daily)  # Poisson spread for snapshot rates
+        season = np.ones((len(self), 7))
+        weekday0 = 0
+        if model is not None:
+            pos = lookup(model, self.frame["product_id"].to_numpy(), self.frame["marketplace"].to_numpy())
+            fitted = pos >= 0
+            rate = np.where(fitted, rates(model)[pos], rate)
+            sigma = np.where(fitted, model.sigma[pos], sigma)
+            season[fitted] = model.season[pos[fitted]]
+            weekday0 = (model.end.weekday() + 1) % 7  # day 1 of a forecast = day after the history
+        r = np.where(rate <= 0, MIN_DAILY, rate)
+        coverage = self.current / r
+        # Days until stock runs out at the upper band: r*h + z*sigma*sqrt(h) = stock
+        zs = BAND_Z * sigma
+        root = (np.sqrt(zs ** 2 + 4 * r * np.maximum(self.current, 0)) - zs) / (2 * r)
+        coverage, coverage_low = np.round(coverage, 1), np.round(root ** 2, 1)
+        view = Demand(key, rate, sigma, season, weekday0, coverage, coverage_low,
+                      np.lexsort((self.current, coverage)))
+        self._demand = view
+        return view
+
+    def critical(self, k=25, mask=None, demand=None):
+        """The ``k`` rows with the lowest coverage (ties: lower stock), as a small frame.
+
+        With a ``demand`` view, coverage comes from the fitted rates and a
+        pessimistic ``coverage_low`` column is added.
+        """
+        ranked = self._critical if demand is None else demand.critical
+        order = ranked if mask is None else ranked[mask[ranked]]
+        idx = order[:k]
+        if demand is None:
+            return self.frame.iloc[idx].assign(coverage_days=self.coverage[idx])
+        return self.frame.iloc[idx].assign(demand_rate=np.round(demand.rate[idx], 2),
+                                           coverage_days=demand.coverage[idx],
+                                           coverage_low=demand.coverage_low[idx])
+
+    def by_marketplace(self, mask=None):
+        """Current stock summed per marketplace present under ``mask``."""
+        codes = self._mp_codes if mask is None else self._mp_codes[mask]
+        weights = self.current if mask is None else self.current[mask]
+        n = len(self.marketplaces)
+        counts = np.bincount(codes, minlength=n)
+        totals = np.bincount(codes, weights=weights, minlength=n)
+        present = counts > 0
+        return pd.DataFrame({"marketplace": np.asarray(self.marketplaces, dtype=object)[present],
+                             "current_stock": totals[present].astype(self.frame["current_stock"].dtype)})
+
+    def forecast(self, product_ids, horizon, mask=None, demand=None):
+        """Depletion for many products at once.
+
+        Returns a ``Forecast``: summed current stock and mean daily demand per
+        product, and ``(len(product_ids), horizon + 1)`` arrays of projected
+        stock with its lower/upper band. Daily demand follows the weekday
+        factors of ``demand`` (default: flat snapshot rates), floored at
+        ``MIN_FORECAST_DAILY``; row variances add up across marketplaces.
+        """
+        demand = demand or self.demand()
+        codes = self.products.get_indexer(list(product_ids))
+        valid = codes >= 0
+        starts = np.where(valid, self._product_starts[codes], 0)
+        lengths = np.where(valid, self._product_starts[codes + 1], 0) - starts
+        # All rows of the requested products in one gather, segment j = product j
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        rows = self._by_product[np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())]
+        seg = np.repeat(np.arange(len(codes)), lengths)
+        weight = 1.0 if mask is None else mask[rows]
+        n = len(codes)
+        stock = np.bincount(seg, weights=self.current[rows] * weight, minlength=n)
+        var = np.bincount(seg, weights=demand.sigma[rows] ** 2 * weight, minlength=n)
+        # Expected demand per product and weekday, then per forecast day
+        by_weekday = np.bincount((seg[:, None] * 7 + np.arange(7)).ravel(),
+                                 weights=(demand.rate[rows, None] * demand.season[rows]
+                                          * np.reshape(weight, (-1, 1))).ravel(),
+                                 minlength=n * 7).reshape(n, 7)
+        days = np.arange(1, horizon + 1)
+        per_day = np.maximum(by_weekday[:, (demand.weekday0 + days - 1) % 7], MIN_FORECAST_DAILY)
+        used = np.concatenate([np.zeros((n, 1)), np.cumsum(per_day, axis=1)], axis=1)
+        spread = BAND_Z * np.sqrt(var)[:, None] * np.sqrt(np.r_[0, days])[None, :]
+        expected = stock[:, None] - used
+        daily = np.maximum(by_weekday.mean(axis=1), MIN_FORECAST_DAILY)
+        # Demand is never negative: the optimistic band stays at or below today's stock
+        upper = np.clip(expected + spread, 0, stock[:, None])
+        return Forecast(stock, daily, np.maximum(0, expected), np.maximum(0, expected - spread), upper)
+
+    def options(self, search=None, limit=None):
+        """Dropdown options ``{"label": "name (id)", "value": id}``, optionally filtered by a substring."""
+        labels = self._labels()
+        if search:
+            hit = labels["label"].str.contains(search, case=False, regex=False).to_numpy()
+            labels = labels[hit]
+        if limit:
+            labels = labels.head(limit)
+        return labels.to_dict("records")
+
+    def _labels(self):
+        labels = getattr(self, "_label_frame", None)
+        if labels is None:
+            first = self.frame.drop_duplicates("product_id")
+            labels = pd.DataFrame({"label": first["product_name"] + " (" + first["product_id"] + ")",
+                                   "value": first["product_id"]}).reset_index(drop=True)
+            self._label_frame = labels
+        return labels
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_stock_index():
+    """Shared ``StockIndex`` of ``data.STOCK_PATH``; rebuilt when the file changes."""
+    global _index
+    path = data.STOCK_PATH
+    try:
+        fp = data._fingerprint(path)
+        token = f"{os.path.basename(path)}:{fp['size']}:{fp['mtime_ns']}"
+    except OSError:
+        token = None
+    index = _index
+    if index is not None and index.token == token:
+        return index
+    with _index_lock:
+        if _index is None or _index.token != token:
+            _index = StockIndex(data.load_stock(), token)
+        return _index